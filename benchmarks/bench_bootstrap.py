@@ -0,0 +1,42 @@
+"""Time of 2,000 bootstrap replicates of the metrics, vectorized and in a loop."""
+import time
+
+import numpy as np
+from sklearn.metrics import accuracy_score, precision_score, recall_score, roc_auc_score
+
+from thriva.bootstrap import bootstrap_metrics
+
+N_REPLICATES = 2000
+# The loop is timed on fewer replicates and scaled up
+N_LOOP_REPLICATES = 50
+
+
+def holdout(n_rows, rng):
+    y_true = rng.random(n_rows) < 0.6
+    scores = np.clip(rng.normal(0.55 + 0.1 * y_true, 0.15), 0, 1)
+    return y_true, scores > 0.5, scores
+
+
+def loop_time(y_true, y_pred, scores, rng):
+    start = time.perf_counter()
+    for _ in range(N_LOOP_REPLICATES):
+        rows = rng.integers(0, len(y_true), len(y_true))
+        accuracy_score(y_true[rows], y_pred[rows])
+        roc_auc_score(y_true[rows], scores[rows])
+        precision_score(y_true[rows], y_pred[rows])
+        recall_score(y_true[rows], y_pred[rows])
+    return (time.perf_counter() - start) * N_REPLICATES / N_LOOP_REPLICATES
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    for n_rows in [1_000, 10_000, 100_000]:
+        y_true, y_pred, scores = holdout(n_rows, rng)
+        start = time.perf_counter()
+        bootstrap_metrics(y_true, {"model": (y_pred, scores)}, N_REPLICATES, 0)
+        vectorized = time.perf_counter() - start
+        loop = loop_time(y_true, y_pred, scores, rng)
+        print(
+            f"{n_rows:>8,d} rows | loop: {loop:7.2f} s | vectorized: {vectorized:6.2f} s"
+            f" | speed-up: {loop / vectorized:5.1f}x"
+        )
@@ -0,0 +1,29 @@
+"""Throughput of the scalar and vectorized age cleaning, in rows per second."""
+import time
+
+import numpy as np
+import pandas as pd
+
+from thriva.clean_data import age_clean, age_clean_series
+
+
+def rows_per_second(function, ages, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(ages)
+        best = min(best, time.perf_counter() - start)
+    return len(ages) / best
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    for n_rows in [10_000, 100_000, 1_000_000]:
+        ages = pd.Series(rng.integers(0, 2023, n_rows), name="Users Age")
+        scalar = rows_per_second(lambda x: x.apply(age_clean), ages)
+        vectorized = rows_per_second(age_clean_series, ages)
+        print(
+            f"{n_rows:>9,d} rows | apply: {scalar:>14,.0f} rows/s"
+            f" | vectorized: {vectorized:>14,.0f} rows/s"
+            f" | speed-up: {vectorized / scalar:.0f}x"
+        )
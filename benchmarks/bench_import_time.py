@@ -0,0 +1,37 @@
+"""Import time of each thriva module, in a fresh interpreter each time."""
+import subprocess
+import sys
+
+MODULES = [
+    "thriva.cache",
+    "thriva.clean_data",
+    "thriva.model",
+    "thriva.predict",
+    "thriva.serve",
+    "thriva.aggregate",
+    "thriva.plots",
+    "thriva.report",
+]
+
+
+def import_time(module, repeat=5):
+    """Best cumulative import time of `module`, in seconds, from `-X importtime`."""
+    best = float("inf")
+    for _ in range(repeat):
+        stderr = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stderr
+        # Lines read "import time: <self us> | <cumulative us> | <module>"
+        for line in stderr.splitlines():
+            _, cumulative, name = line.split("|")
+            if name.strip() == module:
+                best = min(best, int(cumulative) / 1e6)
+    return best
+
+
+if __name__ == "__main__":
+    for module in MODULES:
+        print(f"{module:>18}: {import_time(module):.3f} s")
@@ -0,0 +1,44 @@
+"""Rendering time of `kde_plot` as the number of rows grows."""
+import time
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import matplotlib.pyplot as plt  # noqa: E402
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+from thriva.plots import kde_plot  # noqa: E402
+
+
+def synthetic_frame(n_rows, rng):
+    return pd.DataFrame(
+        {
+            "BMI": rng.normal(27, 6, n_rows),
+            "Age": rng.integers(18, 90, n_rows),
+            "Vitamin D Supplement": pd.Categorical(rng.choice(["Yes", "No"], n_rows)),
+        }
+    )
+
+
+def render_time(df, **kwargs):
+    start = time.perf_counter()
+    fig = kde_plot(df, ["BMI", "Age"], "Vitamin D Supplement", **kwargs)
+    fig.canvas.draw()
+    plt.close(fig)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    for n_rows in [10_000, 100_000, 1_000_000, 10_000_000]:
+        df = synthetic_frame(n_rows, rng)
+        # The exact estimate is skipped where it would take minutes
+        exact = render_time(df) if n_rows <= 1_000_000 else float("nan")
+        capped = render_time(df, max_rows=100_000)
+        binned = render_time(df, binned=True)
+        print(
+            f"{n_rows:>10,d} rows | exact: {exact:7.2f} s"
+            f" | exact, 100,000 rows: {capped:7.2f} s | binned: {binned:7.2f} s"
+        )
@@ -0,0 +1,36 @@
+"""Cold and warm load times of `load_clean_data` with the columnar cache."""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from thriva.cache import cache_dir_for
+from thriva.clean_data import CLEAN_DATA_PATH, load_clean_data
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    function(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    source = sys.argv[1] if len(sys.argv) > 1 else CLEAN_DATA_PATH
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, os.path.basename(source))
+        shutil.copy(source, path)
+        no_cache = timed(load_clean_data, path, use_cache=False)
+        cold = timed(load_clean_data, path)
+        warm = min(timed(load_clean_data, path) for _ in range(5))
+        os.utime(path)
+        touched = timed(load_clean_data, path)
+        cache_size = sum(
+            entry.stat().st_size for entry in os.scandir(cache_dir_for(path))
+        )
+    print(f"CSV size:             {os.path.getsize(source) / 1e6:8.1f} MB")
+    print(f"Cache size:           {cache_size / 1e6:8.1f} MB")
+    print(f"No cache:             {no_cache:8.3f} s")
+    print(f"Cold (writes cache):  {cold:8.3f} s")
+    print(f"Warm:                 {warm:8.3f} s")
+    print(f"Touched (re-hashed):  {touched:8.3f} s")
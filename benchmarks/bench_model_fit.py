@@ -0,0 +1,29 @@
+"""Wall-clock time of `ModelSelection.fit`, sequential and in parallel."""
+import time
+
+from lightgbm import LGBMClassifier
+from sklearn.dummy import DummyClassifier
+
+from thriva.model import ModelSelection, encoded_logistic_regression, prepare_data
+
+
+def model_list():
+    return [encoded_logistic_regression(), LGBMClassifier(), DummyClassifier()]
+
+
+def fit_time(models, X, y):
+    start = time.perf_counter()
+    models.fit(X, y)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    X_train, _, y_train, _ = prepare_data()
+    for model in model_list():
+        model_time = fit_time(ModelSelection(models=[model]), X_train, y_train)
+        print(f"{model.__class__.__name__:>20}: {model_time:.3f} s")
+    for n_jobs in [1, -1]:
+        models = ModelSelection(models=model_list(), n_jobs=n_jobs)
+        print(
+            f"{'all, n_jobs=' + str(n_jobs):>20}: {fit_time(models, X_train, y_train):.3f} s"
+        )
@@ -0,0 +1,104 @@
+"""Peak memory of fitting LightGBM in memory and out of core, on growing data.
+
+Each fit runs in its own process, so its peak resident memory, which includes
+the memory allocated inside LightGBM, is not mixed with the other runs. The
+data is generated in a process of its own too, as a child process starts with
+the peak memory of its parent on Linux. The
+in-memory fit loads the data with `prepare_data`, the out-of-core fit streams
+it with `ModelSelection.fit_out_of_core`. Both then score the holdout.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from thriva.clean_data import clean_csv_in_chunks
+from thriva.synthetic import write_raw_csv
+
+SIZES = [100_000, 1_000_000, 3_000_000]
+MODES = ["out_of_core", "in_memory"]
+
+
+def generate(n_rows, path):
+    """Write `n_rows` rows of cleaned synthetic data to `path`."""
+    raw_path = f"{path}.raw"
+    write_raw_csv(raw_path, n_rows, random_state=0)
+    clean_csv_in_chunks(raw_path, path)
+    os.remove(raw_path)
+
+
+def run(mode, path, chunksize):
+    """Fit and score a LightGBM model on the cleaned file `path`."""
+    from lightgbm import LGBMClassifier
+
+    from thriva.model import RANDOM_STATE, ModelSelection, prepare_data
+    from thriva.out_of_core import StreamedData
+    from thriva.profiling import peak_rss_mb
+
+    selection = ModelSelection(models=[LGBMClassifier()], random_state=RANDOM_STATE)
+    start = time.perf_counter()
+    if mode == "in_memory":
+        X_train, X_test, y_train, y_test = prepare_data(
+            random_state=RANDOM_STATE, path=path
+        )
+        selection.fit(X_train, y_train).score(X_test, y_test)
+    else:
+        data = StreamedData(path, random_state=RANDOM_STATE, chunksize=chunksize)
+        selection.fit_out_of_core(data, work_dir=os.path.dirname(path))
+        selection.score_out_of_core()
+    seconds = time.perf_counter() - start
+    print(json.dumps({"seconds": seconds, "peak_rss_mb": peak_rss_mb()}))
+
+
+def call(*args) -> str:
+    """Run this benchmark with `args` in a new process and return its output."""
+    return subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_out_of_core", *map(str, args)],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--sizes",
+        default=",".join(str(size) for size in SIZES),
+        help="Comma-separated numbers of rows",
+    )
+    parser.add_argument("--chunksize", type=int, default=100_000)
+    parser.add_argument(
+        "--generate", nargs=2, metavar=("ROWS", "PATH"), help=argparse.SUPPRESS
+    )
+    parser.add_argument(
+        "--run", nargs=2, metavar=("MODE", "PATH"), help=argparse.SUPPRESS
+    )
+    args = parser.parse_args()
+    if args.generate:
+        generate(int(args.generate[0]), args.generate[1])
+        sys.exit()
+    if args.run:
+        run(*args.run, args.chunksize)
+        sys.exit()
+
+    for n_rows in [int(float(size)) for size in args.sizes.split(",")]:
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            clean_path = os.path.join(tmp_dir, "clean.csv")
+            call("--generate", n_rows, clean_path)
+            # The out-of-core fit runs first, so it streams the CSV file
+            # rather than the columnar cache written by the in-memory fit
+            for mode in MODES:
+                output = call("--run", mode, clean_path, "--chunksize", args.chunksize)
+                result = json.loads(output.strip().splitlines()[-1])
+                print(
+                    f"{n_rows:>10,d} rows | {mode:<11} | {result['seconds']:7.1f} s"
+                    f" | peak RSS: {result['peak_rss_mb']:7.0f} MB"
+                )
+        finally:
+            shutil.rmtree(tmp_dir)
@@ -0,0 +1,55 @@
+"""Time to save the percentage panels of task 1 at 300 dpi, with and without reuse."""
+import io
+import time
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import matplotlib.pyplot as plt  # noqa: E402
+
+from thriva.aggregate import count_cube  # noqa: E402
+from thriva.clean_data import load_clean_data  # noqa: E402
+from thriva.plots import (  # noqa: E402
+    PanelFigure,
+    plot_categorical_percentages,
+    plot_hist_percentages,
+)
+
+PANELS = [
+    ["Fatigued Rating", "Diet Rating", "Exercise Rating"],
+    ["Sleep Hours", "Main Goal", "Stressed Rating"],
+    ["Active Days Walking", "Inactive Time", "Sex"],
+]
+
+
+def save_panels(vitamin_d, cubes, panel=None, dpi=300):
+    start = time.perf_counter()
+    for plot, target in [
+        (plot_categorical_percentages, "Vitamin D Supplement"),
+        (plot_hist_percentages, "Low Vitamin D"),
+    ]:
+        for cols in PANELS:
+            fig = plot(vitamin_d, cols, target, cube=cubes[target], panel=panel)
+            fig.savefig(io.BytesIO(), format="png", dpi=dpi)
+            if panel is None:
+                plt.close(fig)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    vitamin_d = load_clean_data()
+    low = (vitamin_d["Vitamin D Level"] < 50).map({True: "Yes", False: "No"})
+    vitamin_d["Low Vitamin D"] = low.astype("category")
+    cols = sum(PANELS, [])
+    cubes = {
+        target: count_cube(vitamin_d, cols, target)
+        for target in ["Vitamin D Supplement", "Low Vitamin D"]
+    }
+    for dpi in [100, 300]:
+        fresh = save_panels(vitamin_d, cubes, dpi=dpi)
+        reused = save_panels(vitamin_d, cubes, panel=PanelFigure(), dpi=dpi)
+        print(
+            f"{dpi} dpi | new figures: {fresh:.2f} s | reused panel: {reused:.2f} s"
+            f" | speed-up: {fresh / reused:.2f}x"
+        )
@@ -0,0 +1,81 @@
+"""Time of the permutation importance of every model, batched and in a loop.
+
+The models are fitted on synthetic data of each size, and the importances are
+computed on its 20% holdout, so the fixed costs of the batched path can be
+told apart from the time it saves per permutation.
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from lightgbm import LGBMClassifier
+from sklearn.dummy import DummyClassifier
+from sklearn.metrics import roc_auc_score
+
+from thriva.clean_data import clean_csv_in_chunks
+from thriva.model import (
+    RANDOM_STATE,
+    ModelSelection,
+    encoded_logistic_regression,
+    prepare_data,
+)
+from thriva.synthetic import write_raw_csv
+
+N_REPEATS = 5
+SIZES = [5_000, 50_000, 250_000]
+
+
+def loop_time(models, X_test, y_test):
+    """Permute one copy of the data and call `predict_proba` per permutation."""
+    rng = np.random.default_rng(0)
+    start = time.perf_counter()
+    for model in models.models:
+        for col in X_test.columns:
+            for _ in range(N_REPEATS):
+                permuted = X_test.copy()
+                permuted[col] = permuted[col].iloc[rng.permutation(len(X_test))].values
+                roc_auc_score(y_test, model.predict_proba(permuted)[:, 1])
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--sizes",
+        default=",".join(str(size) for size in SIZES),
+        help="Comma-separated numbers of rows, of which 20%% are held out",
+    )
+    args = parser.parse_args()
+    for n_rows in [int(float(size)) for size in args.sizes.split(",")]:
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            raw_path = os.path.join(tmp_dir, "raw.csv")
+            clean_path = os.path.join(tmp_dir, "clean.csv")
+            write_raw_csv(raw_path, n_rows, random_state=0)
+            clean_csv_in_chunks(raw_path, clean_path)
+            X_train, X_test, y_train, y_test = prepare_data(
+                random_state=RANDOM_STATE, path=clean_path
+            )
+            models = ModelSelection(
+                models=[
+                    encoded_logistic_regression(),
+                    LGBMClassifier(),
+                    DummyClassifier(),
+                ],
+                random_state=RANDOM_STATE,
+            ).fit(X_train, y_train)
+            loop = loop_time(models, X_test, y_test)
+            print(f"{len(X_test):>8,d} test rows | {'loop':>9}: {loop:7.2f} s")
+            for n_jobs in [1, -1]:
+                start = time.perf_counter()
+                models.permutation_importance(X_test, y_test, N_REPEATS, n_jobs=n_jobs)
+                batched = time.perf_counter() - start
+                print(
+                    f"{len(X_test):>8,d} test rows | {f'n_jobs={n_jobs}':>9}:"
+                    f" {batched:7.2f} s | {batched / loop:6.1%} of the loop"
+                )
+        finally:
+            shutil.rmtree(tmp_dir)
@@ -0,0 +1,195 @@
+"""Time and peak memory of each pipeline step on synthetic data of growing size.
+
+Each step runs once to time it, then again under `tracemalloc` for its peak
+memory, so tracing does not slow down the timings. `tracemalloc` sees numpy and
+pandas buffers but not the memory allocated inside LightGBM.
+
+Results are written to `benchmarks/results/scaling_<timestamp>.csv`. Two runs
+are compared with `--compare OLD.csv NEW.csv`.
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import matplotlib.pyplot as plt  # noqa: E402
+import pandas as pd  # noqa: E402
+from lightgbm import LGBMClassifier  # noqa: E402
+from sklearn.dummy import DummyClassifier  # noqa: E402
+
+from thriva.cache import cache_dir_for  # noqa: E402
+from thriva.clean_data import clean_csv_in_chunks, load_clean_data  # noqa: E402
+from thriva.model import (  # noqa: E402
+    RANDOM_STATE,
+    ModelSelection,
+    encoded_logistic_regression,
+    prepare_data,
+)
+from thriva.plots import (  # noqa: E402
+    kde_plot,
+    plot_categorical_percentages,
+    plot_hist_percentages,
+)
+from thriva.synthetic import write_raw_csv  # noqa: E402
+
+RESULTS_DIR = os.path.join("benchmarks", "results")
+SIZES = [1_000, 10_000, 100_000, 1_000_000, 10_000_000]
+# The exact KDE grows with rows times grid points, so it stops at this size
+EXACT_KDE_MAX_ROWS = 100_000
+CATEGORICAL_COLS = ["Fatigued Rating", "Diet Rating", "Exercise Rating"]
+
+
+def measure(function, memory=True):
+    """Return the result of `function`, its time in seconds and peak memory in MB."""
+    start = time.perf_counter()
+    result = function()
+    seconds = time.perf_counter() - start
+    peak_mb = None
+    if memory:
+        del result
+        tracemalloc.start()
+        try:
+            result = function()
+            peak_mb = tracemalloc.get_traced_memory()[1] / 1e6
+        finally:
+            tracemalloc.stop()
+    return result, seconds, peak_mb
+
+
+def figure(plot):
+    """Draw the figure returned by `plot` and close it."""
+
+    def draw():
+        fig = plot()
+        fig.canvas.draw()
+        plt.close(fig)
+
+    return draw
+
+
+def steps(raw_path, clean_path):
+    """Yield the name and function of each step, in order.
+
+    Later steps use the results of earlier ones, through the generator state.
+    """
+
+    def cold_load():
+        shutil.rmtree(cache_dir_for(clean_path), ignore_errors=True)
+        return load_clean_data(clean_path)
+
+    yield "clean", lambda: clean_csv_in_chunks(raw_path, clean_path)
+    yield "load_cold", cold_load
+    vitamin_d = yield "load_warm", lambda: load_clean_data(clean_path)
+    low = (vitamin_d["Vitamin D Level"] < 50).map({True: "Yes", False: "No"})
+    vitamin_d["Low Vitamin D"] = low.astype("category")
+    split = yield "prepare_data", lambda: prepare_data(
+        random_state=RANDOM_STATE, path=clean_path
+    )
+    X_train, X_test, y_train, y_test = split
+
+    def fit():
+        models = [encoded_logistic_regression(), LGBMClassifier(), DummyClassifier()]
+        return ModelSelection(models=models, random_state=RANDOM_STATE).fit(
+            X_train, y_train
+        )
+
+    models = yield "fit", fit
+    yield "score", lambda: models.score(X_test, y_test)
+    yield "plot_categorical_percentages", figure(
+        lambda: plot_categorical_percentages(
+            vitamin_d, CATEGORICAL_COLS, "Vitamin D Supplement"
+        )
+    )
+    yield "plot_hist_percentages", figure(
+        lambda: plot_hist_percentages(vitamin_d, CATEGORICAL_COLS, "Low Vitamin D")
+    )
+    if len(vitamin_d) <= EXACT_KDE_MAX_ROWS:
+        yield "kde_plot", figure(
+            lambda: kde_plot(vitamin_d, ["BMI", "Age"], "Vitamin D Supplement")
+        )
+    yield "kde_plot_binned", figure(
+        lambda: kde_plot(vitamin_d, ["BMI", "Age"], "Vitamin D Supplement", binned=True)
+    )
+    yield "roc_plot", figure(lambda: models.roc_plot(X_test, y_test))
+    yield "importance_plot", figure(
+        lambda: models.importance_plot()["LGBMClassifier"].figure
+    )
+
+
+def run_size(n_rows, work_dir, memory=True):
+    """Benchmark every step on `n_rows` synthetic rows and return the records."""
+    raw_path = os.path.join(work_dir, f"raw_{n_rows}.csv")
+    clean_path = os.path.join(work_dir, f"clean_{n_rows}.csv")
+    write_raw_csv(raw_path, n_rows, random_state=RANDOM_STATE)
+    records = []
+    generator = steps(raw_path, clean_path)
+    result = None
+    try:
+        while True:
+            name, function = generator.send(result)
+            result, seconds, peak_mb = measure(function, memory)
+            records.append(
+                {"rows": n_rows, "step": name, "seconds": seconds, "peak_mb": peak_mb}
+            )
+            print(
+                f"{n_rows:>12,d} {name:>30}: {seconds:9.3f} s"
+                + ("" if peak_mb is None else f" {peak_mb:9.1f} MB")
+            )
+    except StopIteration:
+        pass
+    return records
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old_path, new_path) -> pd.DataFrame:
+    """Ratio of the new to the old time of each step and size."""
+    old, new = pd.read_csv(old_path), pd.read_csv(new_path)
+    merged = old.merge(new, on=["rows", "step"], suffixes=("_old", "_new"))
+    merged["speed-up"] = merged["seconds_old"] / merged["seconds_new"]
+    return merged.pivot(index="step", columns="rows", values="speed-up")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes",
+        type=lambda sizes: [int(float(size)) for size in sizes.split(",")],
+        default=SIZES[:3],
+        help="Comma-separated numbers of rows, such as 1e3,1e5,1e7.",
+    )
+    parser.add_argument("--no-memory", action="store_true")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    args = parser.parse_args()
+    if args.compare:
+        print(compare(*args.compare).round(2).to_string())
+    else:
+        records = []
+        with tempfile.TemporaryDirectory() as work_dir:
+            for n_rows in args.sizes:
+                records += run_size(n_rows, work_dir, memory=not args.no_memory)
+        results = pd.DataFrame(records)
+        results.insert(0, "commit", git_commit())
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(
+            RESULTS_DIR, f"scaling_{time.strftime('%Y%m%d_%H%M%S')}.csv"
+        )
+        results.to_csv(path, index=False)
+        print(f"💾 Saved to {path}")
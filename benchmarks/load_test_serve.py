@@ -0,0 +1,109 @@
+"""Load test of the micro-batching server in `thriva.serve` on localhost.
+
+Starts the server on a saved model, sends single-user requests from many
+concurrent keep-alive connections and reports client-side latency
+percentiles and throughput, next to the server's own statistics.
+
+    python -m benchmarks.load_test_serve model.joblib --concurrency 64
+"""
+import argparse
+import asyncio
+import json
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from thriva.clean_data import load_clean_data
+from thriva.model import FEATURE_COLUMNS
+
+
+async def request(reader, writer, method, path, body=b""):
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\nHost: localhost\r\n"
+        f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+    )
+    await writer.drain()
+    await reader.readline()
+    headers = {}
+    while (line := await reader.readline()) not in (b"\r\n", b""):
+        name, value = line.decode().split(":", 1)
+        headers[name.strip().lower()] = value.strip()
+    return json.loads(await reader.readexactly(int(headers["content-length"])))
+
+
+async def client(host, port, payloads, latencies):
+    reader, writer = await asyncio.open_connection(host, port)
+    for payload in payloads:
+        start = time.perf_counter()
+        await request(reader, writer, "POST", "/predict", payload)
+        latencies.append(time.perf_counter() - start)
+    writer.close()
+
+
+async def wait_for_server(host, port, timeout=30):
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+            writer.close()
+            return
+        except OSError:
+            if time.perf_counter() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+
+async def load_test(host, port, users, concurrency, n_requests):
+    await wait_for_server(host, port)
+    payloads = [json.dumps(users[i % len(users)]).encode() for i in range(n_requests)]
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(
+            client(host, port, payloads[i::concurrency], latencies)
+            for i in range(concurrency)
+        )
+    )
+    elapsed = time.perf_counter() - start
+    reader, writer = await asyncio.open_connection(host, port)
+    server_stats = await request(reader, writer, "GET", "/stats")
+    writer.close()
+    latencies = np.array(latencies) * 1000
+    print(f"Requests:      {n_requests:,d} from {concurrency} connections")
+    print(f"Client p50:    {np.percentile(latencies, 50):.2f} ms")
+    print(f"Client p99:    {np.percentile(latencies, 99):.2f} ms")
+    print(f"Throughput:    {n_requests / elapsed:,.0f} requests/s")
+    print(f"Server stats:  {server_stats}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("model", help="Model saved with thriva.predict.save_model.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=10_000)
+    parser.add_argument("--max-batch-size", type=int, default=64)
+    parser.add_argument("--max-wait-ms", type=float, default=5)
+    args = parser.parse_args()
+    features = load_clean_data(columns=FEATURE_COLUMNS).head(1000)
+    users = json.loads(features.to_json(orient="records"))
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "thriva.serve",
+            args.model,
+            f"--port={args.port}",
+            f"--max-batch-size={args.max_batch_size}",
+            f"--max-wait-ms={args.max_wait_ms}",
+        ]
+    )
+    try:
+        asyncio.run(
+            load_test("127.0.0.1", args.port, users, args.concurrency, args.requests)
+        )
+    finally:
+        server.terminate()
+        server.wait()
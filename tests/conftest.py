@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from thriva.clean_data import clean_csv_in_chunks
+from thriva.synthetic import write_raw_csv
+
+
+@pytest.fixture
+def raw_csv(tmp_path):
+    rng = np.random.default_rng(0)
+    n_rows = 500
+    raw = pd.DataFrame(
+        {
+            "Tests Completed Month": rng.choice(["2022-01-01", "2022-02-01"], n_rows),
+            "Users Active Days Walking": rng.integers(0, 8, n_rows),
+            "Users Diet Rating": rng.integers(1, 6, n_rows),
+            "Users Exercise Rating": rng.integers(1, 6, n_rows),
+            "Users Inactive Time": rng.choice(["0-2 hours", "8+ hours"], n_rows),
+            "Users Bmi": rng.normal(27, 8, n_rows),
+            "Users Fatigued Rating": rng.integers(1, 6, n_rows),
+            "Users Sleep Hours": rng.choice(["5-6", "7-8"], n_rows),
+            "Users Stressed Rating": rng.choice(["1", "2", "3"], n_rows),
+            "Users Main Goal": rng.choice(["Energy", "Sleep"], n_rows),
+            "Users Age": rng.choice([25, 60, 150, 1980], n_rows),
+            "Sex": rng.choice(["Male", "Female"], n_rows),
+            "Users Vitamin D Supplement (Yes / No)": rng.choice(["Yes", "No"], n_rows),
+            "Analyte Results Avg Numeric Result": rng.normal(70, 25, n_rows),
+        }
+    )
+    # Make sure some categories only appear late in the file
+    raw.loc[450:, "Users Main Goal"] = "Weight"
+    path = tmp_path / "raw.csv"
+    raw.to_csv(path, index=False)
+    yield path
+
+
+@pytest.fixture(scope="session")
+def clean_data(tmp_path_factory):
+    # Synthetic data cleaned in a temporary directory, so the tests never
+    # depend on the real export or write next to it in data/
+    data_dir = tmp_path_factory.mktemp("data")
+    raw_path = str(data_dir / "raw.csv")
+    clean_path = str(data_dir / "clean.csv")
+    write_raw_csv(raw_path, 5000, random_state=0)
+    clean_csv_in_chunks(raw_path, clean_path)
+    yield clean_path
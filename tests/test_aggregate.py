@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from thriva.aggregate import count_cube
+from thriva.clean_data import load_clean_data
+
+
+def groupby_percentages(df, col, target_col):
+    df_defined = df[[col, target_col]].dropna()
+    percentages = df_defined.groupby(col).value_counts().unstack()
+    return 100 * (percentages.T / percentages.sum(axis=1)).T[["Yes", "No"]]
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_count_cube_matches_groupby(clean_data, compact):
+    vitamin_d = load_clean_data(clean_data, compact=compact)
+    target = "Vitamin D Supplement"
+    cols = ["Fatigued Rating", "Sleep Hours", "Main Goal", "Active Days Walking"]
+    cube = count_cube(vitamin_d, cols, target)
+    assert cube.columns == cols
+    for col in cols:
+        expected = groupby_percentages(vitamin_d, col, target)
+        pd.testing.assert_frame_equal(
+            cube.percentages(col), expected, check_index_type=False
+        )
+    expected_ratio = vitamin_d[target].value_counts()["Yes"] / len(vitamin_d)
+    assert cube.ratio("Yes") == pytest.approx(expected_ratio)
+
+
+def test_count_cube_skips_missing_values():
+    df = pd.DataFrame(
+        {
+            "Rating": [1.0, 2.0, np.nan, 2.0, 1.0],
+            "Target": pd.Categorical(["Yes", "No", "Yes", None, "Yes"]),
+        }
+    )
+    cube = count_cube(df, ["Rating"], "Target")
+    assert cube.counts["Rating"].to_numpy().tolist() == [[0, 2], [1, 0]]
+    assert cube.ratio("Yes") == pytest.approx(3 / 5)
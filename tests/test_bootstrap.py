@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+from sklearn.dummy import DummyClassifier
+from sklearn.metrics import accuracy_score, precision_score, recall_score, roc_auc_score
+
+from thriva.bootstrap import (
+    ResampledMetrics,
+    bootstrap_indices,
+    bootstrap_metrics,
+    percentile_interval,
+    stacked_metric,
+)
+from thriva.model import ModelSelection, encoded_logistic_regression, prepare_data
+
+
+@pytest.fixture
+def predictions():
+    rng = np.random.default_rng(0)
+    y_true = rng.random(500) < 0.4
+    # Rounded, so many scores are tied
+    scores = np.round(rng.random(500) + 0.3 * y_true, 1) / 1.3
+    y_pred = scores > 0.5
+    y_pred[:10] = ~y_pred[:10]
+    return y_true, y_pred, scores
+
+
+def test_bootstrap_indices_batches():
+    batches = list(bootstrap_indices(100, 25, random_state=0, max_cells=1000))
+    assert [len(batch) for batch in batches] == [10, 10, 5]
+    assert all(batch.shape[1] == 100 and batch.max() < 100 for batch in batches)
+
+
+def test_resampled_metrics_match_sklearn(predictions):
+    y_true, y_pred, scores = predictions
+    indices = np.vstack(
+        [np.arange(len(y_true)), *bootstrap_indices(len(y_true), 5, random_state=0)]
+    )
+    metrics = ResampledMetrics(y_true, y_pred, scores)(indices)
+    for i, rows in enumerate(indices):
+        expected = {
+            "accuracy": accuracy_score(y_true[rows], y_pred[rows]),
+            "auc": roc_auc_score(y_true[rows], scores[rows]),
+            "precision": precision_score(y_true[rows], y_pred[rows]),
+            "recall": recall_score(y_true[rows], y_pred[rows]),
+        }
+        for metric, value in expected.items():
+            assert metrics[metric][i] == pytest.approx(value)
+
+
+def test_bootstrap_metrics_paired(predictions):
+    y_true, y_pred, scores = predictions
+    replicates = bootstrap_metrics(
+        y_true,
+        {"model": (y_pred, scores), "same": (y_pred, scores)},
+        n_replicates=200,
+        random_state=0,
+    )
+    assert replicates["model"]["auc"].shape == (200,)
+    # Same resamples for every model
+    np.testing.assert_array_equal(replicates["model"]["auc"], replicates["same"]["auc"])
+    low, high = percentile_interval(replicates["model"]["auc"])
+    assert low < roc_auc_score(y_true, scores) < high
+
+
+def test_score_bootstrap(clean_data):
+    X_train, X_test, y_train, y_test = prepare_data(random_state=0, path=clean_data)
+    models = ModelSelection(
+        models=[encoded_logistic_regression(), DummyClassifier()], random_state=0
+    ).fit(X_train, y_train)
+    results = models.score(X_test, y_test, n_bootstrap=100)
+    assert list(models.intervals_.columns) == list(results.columns)
+    for metric in results.index:
+        low, high = (
+            models.intervals_.loc[metric, "low"],
+            models.intervals_.loc[metric, "high"],
+        )
+        assert (low <= results.loc[metric] + 1e-3).all()
+        assert (results.loc[metric] <= high + 1e-3).all()
+    differences = models.differences_["LogisticRegression - DummyClassifier"]
+    assert differences["auc", "low"] <= differences["auc", "high"]
+    assert differences["auc", "difference"] == pytest.approx(
+        results.loc["auc", "LogisticRegression"] - 0.5, abs=1e-3
+    )
+
+
+@pytest.mark.parametrize("metric", ["accuracy", "auc", "precision", "recall"])
+def test_stacked_metric_matches_sklearn(predictions, metric):
+    y_true, y_pred, scores = predictions
+    rng = np.random.default_rng(1)
+    stacked_pred = np.vstack([y_pred, rng.random(len(y_pred)) < 0.5])
+    stacked_scores = np.vstack([scores, rng.random(len(scores))])
+    functions = {
+        "accuracy": accuracy_score,
+        "precision": precision_score,
+        "recall": recall_score,
+    }
+    values = stacked_metric(y_true, stacked_pred, stacked_scores, metric)
+    for i in range(2):
+        if metric == "auc":
+            expected = roc_auc_score(y_true, stacked_scores[i])
+        else:
+            expected = functions[metric](y_true, stacked_pred[i])
+        assert values[i] == pytest.approx(expected)
@@ -0,0 +1,82 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from thriva.cache import (
+    append_column_cache,
+    is_cache_valid,
+    read_column_cache,
+    write_column_cache,
+)
+
+
+@pytest.fixture
+def frame():
+    yield pd.DataFrame(
+        {
+            "Month": pd.to_datetime(["2022-01-01", None, "2022-03-01"]),
+            "BMI": [20.5, np.nan, 31.0],
+            "Age": [30, 40, 50],
+            "Sex": pd.Categorical(["Male", None, "Female"]),
+        }
+    )
+
+
+def test_column_cache_round_trip(frame, tmp_path):
+    source = tmp_path / "source.csv"
+    frame.to_csv(source, index=False)
+    cache_dir = str(tmp_path / "source.cache")
+    write_column_cache(frame, cache_dir, source)
+    assert is_cache_valid(cache_dir, source)
+    pd.testing.assert_frame_equal(read_column_cache(cache_dir), frame)
+
+
+def test_column_cache_invalidated_when_source_changes(frame, tmp_path):
+    source = tmp_path / "source.csv"
+    frame.to_csv(source, index=False)
+    cache_dir = str(tmp_path / "source.cache")
+    write_column_cache(frame, cache_dir, source)
+    # Same contents with a new timestamp keep the cache
+    os.utime(source, ns=(0, 0))
+    assert is_cache_valid(cache_dir, source)
+    frame.iloc[:2].to_csv(source, index=False)
+    assert not is_cache_valid(cache_dir, source)
+
+
+def test_write_column_cache_replaces_outdated_cache(frame, tmp_path):
+    source = tmp_path / "source.csv"
+    frame.to_csv(source, index=False)
+    cache_dir = str(tmp_path / "source.cache")
+    write_column_cache(frame, cache_dir, source)
+    frame.iloc[:2].to_csv(source, index=False)
+    write_column_cache(frame.iloc[:2], cache_dir, source)
+    assert is_cache_valid(cache_dir, source)
+    pd.testing.assert_frame_equal(read_column_cache(cache_dir), frame.iloc[:2])
+    # An up-to-date cache written by someone else is kept
+    write_column_cache(frame, cache_dir, source)
+    pd.testing.assert_frame_equal(read_column_cache(cache_dir), frame.iloc[:2])
+    assert sorted(os.listdir(tmp_path)) == ["source.cache", "source.csv"]
+
+
+def test_append_column_cache(frame, tmp_path):
+    source = tmp_path / "source.csv"
+    frame.to_csv(source, index=False)
+    cache_dir = str(tmp_path / "source.cache")
+    write_column_cache(frame, cache_dir, source)
+    new_rows = frame.assign(Sex=pd.Categorical(["Other", "Male", None]))
+    new_rows.to_csv(source, mode="a", header=False, index=False)
+    append_column_cache(new_rows, cache_dir, source)
+    assert is_cache_valid(cache_dir, source)
+    expected = pd.concat([frame, new_rows], ignore_index=True)
+    expected["Sex"] = expected["Sex"].astype("category")
+    pd.testing.assert_frame_equal(read_column_cache(cache_dir), expected)
+    rows = np.array([1, 4, 5])
+    pd.testing.assert_frame_equal(
+        read_column_cache(cache_dir, rows=rows),
+        expected.iloc[rows].reset_index(drop=True),
+    )
+    # The appended rows were not hashed, so a new timestamp invalidates the cache
+    os.utime(source, ns=(0, 0))
+    assert not is_cache_valid(cache_dir, source)
@@ -0,0 +1,155 @@
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from thriva.cache import cache_dir_for, is_cache_valid
+from thriva.clean_data import (
+    RAW_DATE_COLS,
+    RAW_DTYPES,
+    age_clean,
+    age_clean_series,
+    append_new_months,
+    bmi_clean_series,
+    clean_csv_in_chunks,
+    clean_vitamin_d,
+    compact_vitamin_d,
+    inactive_time_clean_series,
+    load_clean_data,
+    memory_report,
+    natural_order,
+    read_clean_chunks,
+)
+
+
+def test_age_clean_series_matches_age_clean():
+    ages = pd.Series([0, 18, 45, 100, 101, 150, 1900, 1901, 1950, 2004], name="Age")
+    expected = ages.apply(age_clean)
+    result = age_clean_series(ages)
+    pd.testing.assert_series_equal(result, expected)
+
+
+def test_age_clean_series_matches_age_clean_on_random_ages():
+    ages = pd.Series(np.random.default_rng(0).integers(0, 2023, 10_000))
+    pd.testing.assert_series_equal(age_clean_series(ages), ages.apply(age_clean))
+
+
+def test_bmi_clean_series():
+    bmi = pd.Series([5.0, 10.0, 25.0, 60.0, 61.0, np.nan])
+    result = bmi_clean_series(bmi)
+    assert result.isna().tolist() == [True, False, False, False, True, True]
+
+
+def test_inactive_time_clean_series():
+    inactive_time = pd.Series(["0-2 hours", "8+ hours", "0-2 hours"], dtype="category")
+    result = inactive_time_clean_series(inactive_time)
+    assert result.dtype == "category"
+    assert result.tolist() == ["0-2", "8+", "0-2"]
+
+
+def test_read_clean_chunks_keeps_categories(raw_csv):
+    chunks = list(read_clean_chunks(raw_csv, chunksize=100))
+    assert len(chunks) == 5
+    for chunk in chunks[1:]:
+        for col in ["Inactive Time", "Main Goal", "Sex"]:
+            assert chunk[col].dtype == chunks[0][col].dtype
+
+
+def test_clean_csv_in_chunks_matches_full_cleaning(raw_csv, tmp_path):
+    full_path = tmp_path / "full.csv"
+    chunked_path = tmp_path / "chunked.csv"
+    raw = pd.read_csv(raw_csv, dtype=RAW_DTYPES, parse_dates=RAW_DATE_COLS)
+    clean_vitamin_d(raw).to_csv(full_path, index=False)
+    clean_csv_in_chunks(raw_csv, chunked_path, chunksize=64)
+    assert chunked_path.read_text() == full_path.read_text()
+
+
+def test_load_clean_data_cache_matches_csv(raw_csv, tmp_path):
+    clean_path = str(tmp_path / "clean.csv")
+    clean_csv_in_chunks(raw_csv, clean_path)
+    from_csv = load_clean_data(clean_path, use_cache=False)
+    cold = load_clean_data(clean_path)
+    warm = load_clean_data(clean_path)
+    pd.testing.assert_frame_equal(cold, from_csv)
+    pd.testing.assert_frame_equal(warm, from_csv)
+
+
+@pytest.mark.parametrize("use_cache", [True, False])
+def test_load_clean_data_columns_and_months(raw_csv, tmp_path, use_cache):
+    clean_path = str(tmp_path / "clean.csv")
+    clean_csv_in_chunks(raw_csv, clean_path)
+    columns = ["Age", "Sex"]
+    vitamin_d = load_clean_data(
+        clean_path, use_cache=use_cache, columns=columns, months=("2022-02", None)
+    )
+    full = load_clean_data(clean_path, use_cache=False)
+    expected = full.loc[full["Tests Completed Month"] >= "2022-02-01", columns]
+    assert list(vitamin_d.columns) == columns
+    pd.testing.assert_frame_equal(vitamin_d, expected.reset_index(drop=True))
+
+
+def test_append_new_months(raw_csv, tmp_path):
+    raw = pd.read_csv(raw_csv)
+    january_path = tmp_path / "january.csv"
+    raw[raw["Tests Completed Month"] == "2022-01-01"].to_csv(january_path, index=False)
+    clean_path = str(tmp_path / "clean.csv")
+    clean_csv_in_chunks(january_path, clean_path)
+    load_clean_data(clean_path)
+    n_february = (raw["Tests Completed Month"] == "2022-02-01").sum()
+    with pytest.warns(UserWarning, match=f"Skipped {len(raw) - n_february:,d} rows"):
+        assert append_new_months(raw_csv, clean_path, chunksize=64) == n_february
+    # Months already in the cleaned data are not appended again
+    with pytest.warns(UserWarning, match=f"Skipped {len(raw):,d} rows .* 2022-02"):
+        assert append_new_months(raw_csv, clean_path) == 0
+    from_csv = load_clean_data(clean_path, use_cache=False)
+    assert len(from_csv) == len(raw)
+    pd.testing.assert_frame_equal(load_clean_data(clean_path), from_csv)
+
+
+def test_natural_order():
+    assert natural_order(["8+", "<5", "6-8", "5-6", "Other"]) == [
+        "<5",
+        "5-6",
+        "6-8",
+        "8+",
+        "Other",
+    ]
+
+
+def test_compact_vitamin_d(raw_csv, tmp_path):
+    clean_path = str(tmp_path / "clean.csv")
+    clean_csv_in_chunks(raw_csv, clean_path)
+    vitamin_d = load_clean_data(clean_path)
+    compact = compact_vitamin_d(vitamin_d)
+    assert compact["Age"].dtype == "int8"
+    assert compact["BMI"].dtype == "float32"
+    assert compact["Inactive Time"].cat.ordered
+    report = memory_report(vitamin_d, compact)
+    assert report.loc["Total", "compact MB"] < report.loc["Total", "MB"]
+
+
+@pytest.mark.parametrize("use_cache", [True, False])
+def test_load_clean_data_compact(raw_csv, tmp_path, use_cache):
+    clean_path = str(tmp_path / "clean.csv")
+    clean_csv_in_chunks(raw_csv, clean_path)
+    vitamin_d = load_clean_data(clean_path, use_cache=use_cache)
+    compact = load_clean_data(clean_path, use_cache=use_cache, compact=True)
+    pd.testing.assert_frame_equal(compact, compact_vitamin_d(vitamin_d))
+    # The input of compact_vitamin_d keeps its dtypes
+    assert vitamin_d["BMI"].dtype == "float64"
+    assert not vitamin_d["Inactive Time"].cat.ordered
+
+
+def test_load_clean_data_concurrently(clean_data, tmp_path):
+    expected = load_clean_data(clean_data, use_cache=False)
+    for trial in range(3):
+        # A fresh copy, so every process finds the cache missing
+        clean_path = str(tmp_path / f"clean_{trial}.csv")
+        shutil.copyfile(clean_data, clean_path)
+        with ProcessPoolExecutor(8) as executor:
+            frames = list(executor.map(load_clean_data, [clean_path] * 8))
+        for vitamin_d in frames:
+            pd.testing.assert_frame_equal(vitamin_d, expected)
+        assert is_cache_valid(cache_dir_for(clean_path), clean_path)
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+from lightgbm import LGBMClassifier
+
+from thriva.experiment import ExperimentGrid, Variant
+from thriva.model import (
+    TARGET_COLUMN,
+    ModelSelection,
+    encoded_logistic_regression,
+    prepare_data,
+)
+
+
+def test_experiment_grid(clean_data):
+    model_list = [encoded_logistic_regression(), LGBMClassifier()]
+    grid = ExperimentGrid(
+        variants=[
+            Variant("all"),
+            Variant("clean", clean_na=True),
+            Variant("subset", columns=["Age", "BMI", "Sex"]),
+        ],
+        models=model_list,
+        path=clean_data,
+        n_jobs=2,
+        random_state=0,
+    )
+    results = grid.run()
+    assert list(results.columns) == [
+        (variant, model)
+        for variant in ["all", "clean", "subset"]
+        for model in ["LogisticRegression", "LGBMClassifier"]
+    ]
+    assert list(results.index) == ["accuracy", "auc", "precision", "recall"]
+    # The templates are cloned, never fitted
+    assert not hasattr(model_list[1], "booster_")
+    fitted = [grid.selections_[name].models[1] for name in ["all", "clean"]]
+    assert fitted[0] is not fitted[1]
+    assert grid.selections_["subset"].models[1].n_features_ == 3
+    # Variants share the split, minus the rows they drop
+    X_test, _ = grid.test_sets_["all"]
+    X_test_clean, _ = grid.test_sets_["clean"]
+    assert set(X_test_clean.index) <= set(X_test.index)
+    assert X_test_clean.notna().all().all()
+
+
+def test_experiment_grid_matches_model_selection(clean_data):
+    X_train, X_test, y_train, y_test = prepare_data(random_state=0, path=clean_data)
+    expected = (
+        ModelSelection(models=[LGBMClassifier()], random_state=0)
+        .fit(X_train, y_train)
+        .score(X_test, y_test)
+    )
+    grid = ExperimentGrid(
+        [Variant("all")], [LGBMClassifier()], path=clean_data, random_state=0
+    )
+    pd.testing.assert_frame_equal(grid.run()["all"], expected)
+    pd.testing.assert_frame_equal(grid.test_sets_["all"][0], X_test)
+
+
+def test_experiment_grid_clean_drops_missing_targets(clean_data, tmp_path):
+    data = pd.read_csv(clean_data)
+    missing = data.sample(frac=0.1, random_state=0).index
+    data.loc[missing, TARGET_COLUMN] = np.nan
+    path = str(tmp_path / "clean.csv")
+    data.to_csv(path, index=False)
+    grid = ExperimentGrid(
+        [Variant("all"), Variant("clean", clean_na=True)],
+        [LGBMClassifier()],
+        path=path,
+        random_state=0,
+    )
+    grid.run()
+    X_test, _ = grid.test_sets_["all"]
+    X_test_clean, _ = grid.test_sets_["clean"]
+    assert X_test.index.isin(missing).any()
+    assert not X_test_clean.index.isin(missing).any()
@@ -0,0 +1,57 @@
+import matplotlib.pyplot as plt
+import numpy as np
+import pytest
+from lightgbm import LGBMClassifier
+from matplotlib.figure import Figure
+from sklearn.dummy import DummyClassifier
+from sklearn.metrics import roc_auc_score
+
+from thriva.importance import permuted_scores
+from thriva.model import ModelSelection, encoded_logistic_regression, prepare_data
+
+
+@pytest.fixture(scope="module")
+def fitted(clean_data):
+    X_train, X_test, y_train, y_test = prepare_data(random_state=0, path=clean_data)
+    models = ModelSelection(
+        models=[encoded_logistic_regression(), LGBMClassifier(), DummyClassifier()],
+        random_state=0,
+    ).fit(X_train, y_train)
+    yield models, X_test, y_test
+
+
+def test_permuted_scores_match_loop(fitted):
+    models, X_test, y_test = fitted
+    model = models.models[1]
+    tasks = [("Age", 0), ("Sex", 1), ("Age", 2)]
+    # Two copies per batch, so the restored copies are reused
+    scores = permuted_scores(model, X_test, y_test, tasks, max_rows=2 * len(X_test))
+    for (col, seed), score in zip(tasks, scores):
+        permuted = X_test.copy()
+        permutation = np.random.default_rng(seed).permutation(len(X_test))
+        permuted[col] = permuted[col].iloc[permutation].values
+        expected = roc_auc_score(y_test, model.predict_proba(permuted)[:, 1])
+        assert score == pytest.approx(expected)
+
+
+def test_permutation_importance(fitted):
+    models, X_test, y_test = fitted
+    importances = models.permutation_importance(X_test, y_test, n_repeats=3)
+    assert list(importances.columns) == [
+        "LogisticRegression",
+        "LGBMClassifier",
+        "DummyClassifier",
+    ]
+    assert list(importances.index) == list(X_test.columns)
+    assert (importances["DummyClassifier"] == 0).all()
+    assert models.permutation_importances_std_.shape == importances.shape
+    # The permutations do not depend on the number of workers
+    in_parallel = models.permutation_importance(X_test, y_test, n_repeats=3, n_jobs=2)
+    np.testing.assert_allclose(in_parallel, importances)
+
+
+def test_importance_plot_permutation(fitted):
+    models, X_test, y_test = fitted
+    plots = models.importance_plot(X_test, y_test, n_repeats=2)
+    assert isinstance(plots["permutation"], Figure)
+    plt.close("all")
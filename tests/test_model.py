@@ -1,37 +1,56 @@
+import os
+import subprocess
+import sys
+import warnings
+
 import matplotlib.pyplot as plt
+import numpy as np
 import pytest
+from lightgbm import LGBMClassifier
 from matplotlib.axes import Axes
 from matplotlib.figure import Figure
 from numpy import ndarray
 from pandas import DataFrame, Series
+from sklearn.dummy import DummyClassifier
+from sklearn.preprocessing import OneHotEncoder
 
-from thriva.model import ModelSelection, prepare_data
+from thriva.model import (
+    FeatureStore,
+    ModelSelection,
+    encoded_logistic_regression,
+    fit_lgbm_cached,
+    limit_threads,
+    limited_threads,
+    model_names,
+    prepare_data,
+    seed_model,
+)
 
 
 @pytest.fixture(scope="module")
-def data():
-    X_train, X_test, y_train, y_test = prepare_data()
+def data(clean_data):
+    X_train, X_test, y_train, y_test = prepare_data(path=clean_data)
     yield X_train, X_test, y_train, y_test
 
 
 @pytest.fixture(scope="module")
-def models():
-    X_train, _, y_train, _ = prepare_data()
+def models(clean_data):
+    X_train, _, y_train, _ = prepare_data(path=clean_data)
     models = ModelSelection()
     models.fit(X_train, y_train)
     yield models
 
 
-def test_prepare_data():
-    X_train, X_test, y_train, y_test = prepare_data()
+def test_prepare_data(clean_data):
+    X_train, X_test, y_train, y_test = prepare_data(path=clean_data)
     assert isinstance(X_train, DataFrame)
     assert isinstance(X_test, DataFrame)
     assert isinstance(y_train, Series)
     assert isinstance(y_test, Series)
 
 
-def test_prepare_data_clean_na():
-    X_train, X_test, y_train, y_test = prepare_data(clean_na=True)
+def test_prepare_data_clean_na(clean_data):
+    X_train, X_test, y_train, y_test = prepare_data(clean_na=True, path=clean_data)
     assert isinstance(X_train, DataFrame)
     assert isinstance(X_test, DataFrame)
     assert isinstance(y_train, Series)
@@ -42,6 +61,45 @@ def test_prepare_data_clean_na():
     assert y_test.isna().sum() == 0
 
 
+def test_prepare_data_random_state(clean_data):
+    X_train, X_test, _, _ = prepare_data(random_state=0, path=clean_data)
+    X_train_again, X_test_again, _, _ = prepare_data(random_state=0, path=clean_data)
+    assert X_train.index.equals(X_train_again.index)
+    assert X_test.index.equals(X_test_again.index)
+
+
+def test_import_is_light_and_does_not_seed_numpy():
+    code = (
+        "import sys\n"
+        "import numpy as np\n"
+        "state = np.random.get_state()[1].copy()\n"
+        "import thriva.model\n"
+        "assert (np.random.get_state()[1] == state).all()\n"
+        "heavy = {'lightgbm', 'sklearn', 'matplotlib', 'seaborn'}\n"
+        "assert not heavy & set(sys.modules), heavy & set(sys.modules)\n"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+
+def test_seed_model():
+    model = encoded_logistic_regression()
+    seed_model(model, 0)
+    assert model.get_params()["logistic__random_state"] == 0
+    lgbm = seed_model(LGBMClassifier(random_state=1), 0)
+    assert lgbm.random_state == 1
+    assert seed_model(LGBMClassifier(), None).random_state is None
+
+
+def test_ModelSelection_random_state_is_reproducible(data):
+    X_train, X_test, y_train, y_test = data
+    probabilities = []
+    for _ in range(2):
+        model = LGBMClassifier(subsample=0.5, subsample_freq=1, colsample_bytree=0.5)
+        models = ModelSelection(models=[model], random_state=0)
+        probabilities.append(models.fit(X_train, y_train).predict_proba(X_test)[0])
+    assert np.array_equal(*probabilities)
+
+
 def test_fit_model(data):
     X_train, X_test, y_train, y_test = data
     models = ModelSelection()
@@ -64,3 +122,243 @@ def test_ModelSelection_roc_plot(models, data):
     roc = models.roc_plot(X_test, y_test)
     assert isinstance(roc, Figure)
     plt.close()
+
+
+def test_fit_model_compact_schema(clean_data):
+    X_train, X_test, y_train, y_test = prepare_data(compact=True, path=clean_data)
+    models = ModelSelection(models=[encoded_logistic_regression(), LGBMClassifier()])
+    models.fit(X_train, y_train)
+    results = models.score(X_test, y_test)
+    assert list(results.columns) == ["LogisticRegression", "LGBMClassifier"]
+
+
+def test_limit_threads():
+    model = limit_threads(LGBMClassifier(), 2)
+    assert model.get_params()["n_jobs"] == 2
+    model = limit_threads(LGBMClassifier(n_jobs=3), 2)
+    assert model.get_params()["n_jobs"] == 3
+
+
+def test_limited_threads_restores_n_jobs():
+    models = [LGBMClassifier(), encoded_logistic_regression()]
+    models[1].set_params(logistic__n_jobs=-1)
+    with limited_threads(models, 2):
+        assert models[0].get_params()["n_jobs"] == 2
+        assert models[1].get_params()["logistic__n_jobs"] == 2
+    assert models[0].get_params()["n_jobs"] == -1
+    assert models[1].get_params()["logistic__n_jobs"] == -1
+
+
+def test_fit_in_parallel_keeps_n_jobs(data):
+    X_train, _, y_train, _ = data
+    model_list = [LGBMClassifier(), LGBMClassifier(n_estimators=5)]
+    ModelSelection(models=model_list, n_jobs=2).fit(X_train, y_train)
+    assert [model.get_params()["n_jobs"] for model in model_list] == [-1, -1]
+
+
+def test_fit_model_in_parallel(data):
+    X_train, X_test, y_train, y_test = data
+    model_list = [encoded_logistic_regression(), LGBMClassifier()]
+    models = ModelSelection(models=model_list, n_jobs=2)
+    models.fit(X_train, y_train)
+    assert models.models == model_list
+    results = models.score(X_test, y_test)
+    assert list(results.columns) == ["LogisticRegression", "LGBMClassifier"]
+
+
+def test_ModelSelection_predict_proba_is_cached(data):
+    X_train, X_test, y_train, y_test = data
+    models = ModelSelection().fit(X_train, y_train)
+    probabilities = models.predict_proba(X_test)
+    assert models.predict_proba(X_test.copy()) is probabilities
+    assert models.predict_proba(X_test.iloc[:10]) is not probabilities
+    models.fit(X_train, y_train)
+    assert models.predict_proba(X_test) is not probabilities
+    # Only the last test set is kept
+    models.predict_proba(X_test.iloc[:10])
+    assert len(models._probabilities) == 1
+
+
+def test_ModelSelection_names_models_of_the_same_class(data):
+    X_train, X_test, y_train, y_test = data
+    model_list = [LGBMClassifier(n_estimators=5), LGBMClassifier(), DummyClassifier()]
+    models = ModelSelection(models=model_list).fit(X_train, y_train)
+    names = ["LGBMClassifier-1", "LGBMClassifier-2", "DummyClassifier"]
+    assert model_names(model_list) == names
+    results = models.score(X_test, y_test, n_bootstrap=20)
+    assert list(results.columns) == names
+    assert list(models.intervals_.columns) == names
+    # Each column holds its own model, not one of them twice
+    first, second, _ = models.predict_proba(X_test)
+    assert not np.allclose(first, second)
+
+
+def test_ModelSelection_cross_validate(data):
+    X_train, X_test, y_train, y_test = data
+    model_list = [encoded_logistic_regression(), LGBMClassifier()]
+    models = ModelSelection(models=model_list, n_jobs=2)
+    cv_results = models.cross_validate(X_train, y_train, cv=3)
+    assert list(cv_results.columns) == ["LogisticRegression", "LGBMClassifier"]
+    statistics = list(cv_results.index.get_level_values(0).unique())
+    assert statistics == ["mean", "std", "fold 0", "fold 1", "fold 2"]
+    assert cv_results.loc["mean"].shape == (4, 2)
+
+
+def test_ModelSelection_iter_cross_validate_can_stop_early(data):
+    X_train, X_test, y_train, y_test = data
+    models = ModelSelection()
+    for model_name, fold, report in models.iter_cross_validate(X_train, y_train):
+        break
+    assert model_name == "LGBMClassifier"
+    assert set(report) == {"accuracy", "auc", "precision", "recall"}
+
+
+def test_feature_store_matches_dataframe_models(data):
+    X_train, X_test, y_train, y_test = data
+    models = ModelSelection(models=[encoded_logistic_regression(), LGBMClassifier()])
+    models.fit(X_train, y_train)
+    reference = [
+        encoded_logistic_regression().fit(X_train, y_train),
+        LGBMClassifier().fit(X_train, y_train),
+    ]
+    for proba, model, reference_model in zip(
+        models.predict_proba(X_test), models.models, reference
+    ):
+        assert np.allclose(proba, reference_model.predict_proba(X_test))
+        # The fitted models still take DataFrames on their own
+        assert np.allclose(proba, model.predict_proba(X_test))
+
+
+def test_feature_store_encodes_once(data):
+    X_train, X_test, y_train, y_test = data
+    store = FeatureStore().fit(X_train)
+    assert store.codes(X_test) is store.codes(X_test.copy())
+    encoder = store.encoder(OneHotEncoder(handle_unknown="ignore"), X_train)
+    assert encoder is store.encoder(OneHotEncoder(handle_unknown="ignore"), X_train)
+    assert store.onehot(encoder, X_test).shape[0] == len(X_test)
+
+
+def test_feature_store_keeps_the_training_and_last_frames(data):
+    X_train, X_test, y_train, y_test = data
+    models = ModelSelection(models=[encoded_logistic_regression(), LGBMClassifier()])
+    models.fit(X_train, y_train)
+    store = models.feature_store
+    train_entries = len(store._cache)
+    codes = store.codes(X_train)
+    for start in range(20):
+        models.score(X_test.iloc[start:], y_test.iloc[start:])
+    # One encoding per model of the training frame and of the last test set
+    assert len(store._cache) == 2 * train_entries
+    assert store.codes(X_train) is codes
+
+
+def test_feature_store_onehot_follows_the_encoder(data):
+    X_train, X_test, y_train, y_test = data
+    store = FeatureStore().fit(X_train)
+    encoder = OneHotEncoder(handle_unknown="ignore").fit(X_train[["Sex"]])
+    wide = store.onehot(encoder, X_test[["Sex"]])
+    # Refitting the same object changes its categories, not its id
+    encoder.fit(X_train[["Sex"]].dropna().iloc[:1])
+    narrow = store.onehot(encoder, X_test[["Sex"]])
+    assert narrow.shape[1] == 1 < wide.shape[1]
+
+
+def test_fit_lgbm_cached_matches_fit(data, tmp_path):
+    X_train, X_test, y_train, y_test = data
+    reference = LGBMClassifier().fit(X_train, y_train)
+    for _ in range(2):
+        models = ModelSelection(lgbm_cache_dir=str(tmp_path)).fit(X_train, y_train)
+        assert len(list(tmp_path.glob("*.bin"))) == 1
+        proba = models.models[0].predict_proba(X_test)
+        assert np.allclose(proba, reference.predict_proba(X_test))
+    # Different data gets its own Dataset
+    ModelSelection(lgbm_cache_dir=str(tmp_path)).fit(X_train.iloc[:-1], y_train[:-1])
+    assert len(list(tmp_path.glob("*.bin"))) == 2
+
+
+def test_fit_lgbm_cached_keeps_recently_used(data, tmp_path):
+    X_train, _, y_train, _ = data
+    features = FeatureStore().fit(X_train).codes(X_train)
+    names = [str(col) for col in X_train.columns]
+
+    def fit(n_rows):
+        fit_lgbm_cached(
+            LGBMClassifier(n_estimators=2),
+            features[:n_rows],
+            y_train[:n_rows],
+            names,
+            [],
+            str(tmp_path),
+            max_entries=2,
+        )
+        return set(tmp_path.glob("*.bin"))
+
+    first = fit(100)
+    second = fit(200) - first
+    for age, path in enumerate([*first, *second]):
+        os.utime(path, (age, age))
+    assert fit(100) == first | second
+    # The cache hit made the first Dataset more recently used than the second
+    kept = fit(300)
+    assert len(kept) == 2 and first <= kept and not second & kept
+
+
+def test_fit_lgbm_cached_other_lightgbm_version(data, tmp_path, monkeypatch):
+    import lightgbm
+
+    X_train, X_test, y_train, _ = data
+    monkeypatch.setattr(lightgbm, "__version__", "4.0.0")
+    models = ModelSelection(lgbm_cache_dir=str(tmp_path))
+    with pytest.warns(UserWarning, match="not supported by the Dataset cache"):
+        models.fit(X_train, y_train)
+    assert list(tmp_path.iterdir()) == []
+    assert models.models[0].predict_proba(X_test).shape == (len(X_test), 2)
+
+
+def test_ModelSelection_update(data):
+    X_train, X_test, y_train, y_test = data
+    n_rows = len(X_train) // 2
+    models = ModelSelection(models=[LGBMClassifier(), encoded_logistic_regression()])
+    models.fit(X_train.iloc[:n_rows], y_train.iloc[:n_rows])
+    before = [proba.copy() for proba in models.predict_proba(X_test)]
+    coef = models.models[1][-1].coef_.copy()
+    models.update(X_train.iloc[n_rows:], y_train.iloc[n_rows:], boosting_rounds=5)
+    lgbm, logistic = models.models
+    assert lgbm.booster_.num_trees() == lgbm.n_estimators + 5
+    assert not logistic[-1].warm_start
+    assert not np.allclose(logistic[-1].coef_, coef)
+    after = models.predict_proba(X_test)
+    assert all(not np.allclose(a, b) for a, b in zip(before, after))
+    # The updated LightGBM model still predicts from DataFrames on its own
+    assert np.allclose(lgbm.predict_proba(X_test), after[0])
+
+
+def test_ModelSelection_tune(data):
+    X_train, X_test, y_train, y_test = data
+    model_list = [encoded_logistic_regression(), LGBMClassifier(), DummyClassifier()]
+    models = ModelSelection(models=model_list)
+    param_spaces = [
+        {"logistic__C": [0.01, 0.1, 1.0, 10.0]},
+        {"num_leaves": [4, 8, 16, 31], "learning_rate": [0.05, 0.1]},
+        None,
+    ]
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        results = models.tune(
+            X_train, y_train, param_spaces, n_candidates=4, max_boosting_rounds=60
+        )
+    assert not [w for w in caught if "overrid" in str(w.message).lower()]
+    assert list(results.columns) == ["LogisticRegression", "LGBMClassifier"]
+    assert models.models[1].n_estimators <= 60
+    assert models.models[2] is model_list[2]
+    assert isinstance(models.score(X_test, y_test), DataFrame)
+    # The tuned LightGBM model also predicts from DataFrames on its own
+    np.testing.assert_allclose(
+        models.models[1].predict_proba(X_test), models.predict_proba(X_test)[1]
+    )
+    # The categorical columns are not left in the tuned model's parameters
+    assert "categorical_column" not in models.models[1].get_params()
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        models.fit(X_train, y_train).update(X_test, y_test)
+    assert not [w for w in caught if "overrid" in str(w.message).lower()]
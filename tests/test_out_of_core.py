@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+import pytest
+from lightgbm import LGBMClassifier
+
+from thriva.clean_data import load_clean_data
+from thriva.model import (
+    FEATURE_COLUMNS,
+    OPTIMAL_LEVEL,
+    TARGET_COLUMN,
+    ModelSelection,
+    encoded_logistic_regression,
+)
+from thriva.out_of_core import MatrixFile, StreamedData, hashed_test_mask
+
+
+def test_hashed_test_mask():
+    positions = np.arange(100_000)
+    test = hashed_test_mask(positions, 0.2, random_state=1)
+    assert abs(test.mean() - 0.2) < 0.01
+    # The same rows are drawn whatever the chunks the positions come in
+    chunks = [hashed_test_mask(chunk, 0.2, 1) for chunk in np.array_split(positions, 7)]
+    np.testing.assert_array_equal(np.concatenate(chunks), test)
+    assert (hashed_test_mask(positions, 0.2, random_state=2) != test).any()
+
+
+def test_matrix_file(tmp_path):
+    matrix = np.arange(30, dtype=np.float32).reshape(10, 3)
+    path = tmp_path / "matrix.f32"
+    path.write_bytes(matrix.tobytes())
+    with MatrixFile(str(path), 3, batch_size=4) as rows:
+        assert len(rows) == 10
+        np.testing.assert_array_equal(rows[2:5], matrix[2:5])
+        np.testing.assert_array_equal(rows[-1], matrix[-1])
+        np.testing.assert_array_equal(rows[[0, 7]], matrix[[0, 7]])
+        with pytest.raises(IndexError):
+            rows[10]
+
+
+@pytest.mark.parametrize("use_cache", [True, False])
+def test_streamed_data_chunks(clean_data, use_cache):
+    data = StreamedData(clean_data, chunksize=700, random_state=0, use_cache=use_cache)
+    train = [np.concatenate(parts) for parts in zip(*data.chunks("train"))]
+    test = [np.concatenate(parts) for parts in zip(*data.chunks("test"))]
+    vitamin_d = load_clean_data(clean_data)
+    in_test = hashed_test_mask(np.arange(len(vitamin_d)), 0.2, 0)
+    assert len(train[0]) + len(test[0]) == len(vitamin_d)
+    np.testing.assert_array_equal(
+        test[1], vitamin_d[TARGET_COLUMN].lt(OPTIMAL_LEVEL).to_numpy()[in_test]
+    )
+    # Categories are coded as in the frames loaded in memory
+    col = FEATURE_COLUMNS.index("Main Goal")
+    codes = vitamin_d["Main Goal"].cat.codes.to_numpy()[~in_test].astype(np.float32)
+    codes[codes < 0] = np.nan
+    np.testing.assert_array_equal(train[0][:, col], codes)
+
+
+def test_streamed_data_clean_na(clean_data):
+    data = StreamedData(clean_data, clean_na=True, chunksize=1000)
+    features = np.concatenate([features for features, _ in data.chunks()])
+    vitamin_d = load_clean_data(clean_data, columns=[*FEATURE_COLUMNS, TARGET_COLUMN])
+    assert len(features) == len(vitamin_d.dropna())
+    assert not np.isnan(features).any()
+
+
+def test_fit_out_of_core_matches_fit(clean_data, tmp_path):
+    data = StreamedData(clean_data, chunksize=1000, random_state=0)
+    selection = ModelSelection(models=[LGBMClassifier()], random_state=0)
+    selection.fit_out_of_core(data, work_dir=tmp_path)
+    assert list(tmp_path.iterdir()) == []
+
+    vitamin_d = load_clean_data(clean_data)
+    in_test = hashed_test_mask(np.arange(len(vitamin_d)), 0.2, 0)
+    X, y = vitamin_d[FEATURE_COLUMNS], vitamin_d[TARGET_COLUMN].lt(OPTIMAL_LEVEL)
+    expected = ModelSelection(models=[LGBMClassifier()], random_state=0)
+    expected.fit(X[~in_test], y[~in_test])
+    # The fitted model also predicts from DataFrames
+    np.testing.assert_allclose(
+        selection.models[0].predict_proba(X[in_test]),
+        expected.models[0].predict_proba(X[in_test]),
+    )
+    pd.testing.assert_frame_equal(
+        selection.score_out_of_core(), expected.score(X[in_test], y[in_test])
+    )
+
+
+def test_fit_out_of_core_only_lgbm(clean_data):
+    selection = ModelSelection(models=[encoded_logistic_regression()])
+    with pytest.raises(ValueError, match="LogisticRegression"):
+        selection.fit_out_of_core(StreamedData(clean_data))
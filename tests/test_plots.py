@@ -1,24 +1,31 @@
 import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
 import pytest
 from matplotlib.figure import Figure
+from scipy.stats import gaussian_kde
 
 from thriva.clean_data import load_clean_data
 from thriva.model import ModelSelection, prepare_data
 from thriva.plots import (
+    PanelFigure,
+    binned_kde,
+    kde_plot,
     plot_categorical_percentages,
     plot_hist_percentages,
     plot_roc_curve,
+    subsample_by_level,
 )
 
 
 @pytest.fixture(scope="module")
-def vitamin_d():
-    yield load_clean_data()
+def vitamin_d(clean_data):
+    yield load_clean_data(clean_data)
 
 
 @pytest.fixture(scope="module")
-def models_X_test_y_test():
-    X_train, X_test, y_train, y_test = prepare_data()
+def models_X_test_y_test(clean_data):
+    X_train, X_test, y_train, y_test = prepare_data(path=clean_data)
     models = ModelSelection()
     models.fit(X_train, y_train)
     yield models, X_test, y_test
@@ -47,3 +54,80 @@ def test_plot_roc_curve(models_X_test_y_test):
     models, X_test, y_test = models_X_test_y_test
     fig = plot_roc_curve(models, X_test, y_test)
     assert isinstance(fig, Figure)
+
+
+def test_plot_categorical_percentages_compact_schema(clean_data):
+    vitamin_d = load_clean_data(clean_data, compact=True)
+    target = "Vitamin D Supplement"
+    col_list = ["Sleep Hours", "Main Goal", "Stressed Rating"]
+    fig = plot_categorical_percentages(vitamin_d, col_list, target, bottom=0.25)
+    assert isinstance(fig, Figure)
+    plt.close(fig)
+
+
+def test_binned_kde_matches_gaussian_kde():
+    values = np.random.default_rng(0).gamma(2, 10, 10_000)
+    support, density = binned_kde(values)
+    expected = gaussian_kde(values)(support)
+    assert np.abs(density - expected).max() < 1e-3 * expected.max()
+
+
+def test_kde_plot_binned(vitamin_d):
+    col_list = ["Tests Completed Month", "BMI"]
+    exact = kde_plot(vitamin_d, col_list, "Vitamin D Supplement")
+    binned = kde_plot(vitamin_d, col_list, "Vitamin D Supplement", binned=True)
+    for exact_ax, binned_ax in zip(exact.axes, binned.axes):
+        for exact_fill, binned_fill in zip(exact_ax.collections, binned_ax.collections):
+            exact_curve = exact_fill.get_paths()[0].vertices
+            binned_curve = binned_fill.get_paths()[0].vertices
+            assert np.allclose(exact_curve, binned_curve, atol=1e-5)
+    plt.close(exact)
+    plt.close(binned)
+
+
+def test_subsample_by_level():
+    df = pd.DataFrame({"x": np.arange(1000), "hue": ["Yes"] * 800 + ["No"] * 200})
+    sample = subsample_by_level(df, "hue", max_rows=100)
+    assert sample["hue"].value_counts().to_dict() == {"Yes": 80, "No": 20}
+    assert subsample_by_level(df, "hue", max_rows=None) is df
+
+
+def test_panel_figure_is_reused(vitamin_d, capsys):
+    target = "Vitamin D Supplement"
+    col_list = ["Fatigued Rating", "Sleep Hours", "Sex"]
+    fresh = plot_categorical_percentages(vitamin_d, col_list, target)
+    fresh.canvas.draw()
+    panel = PanelFigure()
+    other_cols = ["Diet Rating", "Main Goal", "Inactive Time"]
+    plot_categorical_percentages(vitamin_d, other_cols, target, panel=panel)
+    reused = plot_categorical_percentages(vitamin_d, col_list, target, panel=panel)
+    reused.canvas.draw()
+    assert reused is panel.fig
+    assert np.array_equal(
+        np.asarray(fresh.canvas.buffer_rgba()), np.asarray(reused.canvas.buffer_rgba())
+    )
+    assert [text.get_text() for text in reused.axes[0].get_xticklabels()] == [
+        "1",
+        "2",
+        "3",
+        "4",
+        "5",
+    ]
+    assert capsys.readouterr().out == ""
+    plt.close(fresh)
+    plt.close(reused)
+
+
+def test_panel_figure_closed_by_show(vitamin_d, tmp_path):
+    target = "Vitamin D Supplement"
+    col_list = ["Fatigued Rating", "Sleep Hours", "Sex"]
+    panel = PanelFigure()
+    closed = plot_categorical_percentages(vitamin_d, col_list, target, panel=panel)
+    plt.close(closed)
+    fig = plot_categorical_percentages(vitamin_d, col_list, target, panel=panel)
+    assert fig is panel.fig is not closed
+    assert plt.gcf() is fig
+    fig.canvas.draw()
+    # The rebuilt panel holds the bars, not a blank figure
+    assert len(fig.axes) == 3 and all(ax.patches for ax in fig.axes)
+    plt.close(fig)
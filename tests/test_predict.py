@@ -0,0 +1,62 @@
+import pandas as pd
+from lightgbm import LGBMClassifier
+
+from thriva.cache import cache_dir_for
+from thriva.clean_data import clean_csv_in_chunks, load_clean_data
+from thriva.model import (
+    FEATURE_COLUMNS,
+    TARGET_COLUMN,
+    ModelSelection,
+    encoded_logistic_regression,
+)
+from thriva.predict import iter_feature_chunks, load_model, predict_file, save_model
+
+
+def fit_models(clean_path):
+    vitamin_d = load_clean_data(clean_path)
+    X = vitamin_d[FEATURE_COLUMNS]
+    y = vitamin_d[TARGET_COLUMN].lt(75)
+    models = ModelSelection(models=[encoded_logistic_regression(), LGBMClassifier()])
+    return models.fit(X, y), X
+
+
+def test_predict_file_matches_predict_proba(raw_csv, tmp_path):
+    clean_path = str(tmp_path / "clean.csv")
+    clean_csv_in_chunks(raw_csv, clean_path)
+    models, X = fit_models(clean_path)
+    for model in models.models:
+        model_path = tmp_path / "model.joblib"
+        save_model(model, model_path)
+        output_path = tmp_path / "scores.csv"
+        n_rows = predict_file(
+            load_model(model_path), raw_csv, output_path, chunksize=64, n_jobs=2
+        )
+        scores = pd.read_csv(output_path, index_col="row")
+        assert n_rows == len(X)
+        assert scores.index.tolist() == list(range(len(X)))
+        # The raw file skips the CSV round trip of the cleaned file, so compare
+        # against the features of the raw file read in a single chunk
+        features = next(iter_feature_chunks(raw_csv, chunksize=len(X)))
+        assert features.dtypes.equals(X.dtypes)
+        expected = model.predict_proba(features)[:, 1]
+        assert abs(scores["probability"].to_numpy() - expected).max() < 1e-6
+
+
+def test_predict_file_from_column_cache(raw_csv, tmp_path):
+    clean_path = str(tmp_path / "clean.csv")
+    clean_csv_in_chunks(raw_csv, clean_path)
+    models, X = fit_models(clean_path)
+    output_path = tmp_path / "scores.csv"
+    predict_file(models.models[1], cache_dir_for(clean_path), output_path, 100)
+    scores = pd.read_csv(output_path, index_col="row")
+    expected = models.models[1].predict_proba(X)[:, 1]
+    assert abs(scores["probability"].to_numpy() - expected).max() < 1e-6
+
+
+def test_predict_file_all_cores(raw_csv, tmp_path):
+    clean_path = str(tmp_path / "clean.csv")
+    clean_csv_in_chunks(raw_csv, clean_path)
+    models, X = fit_models(clean_path)
+    output_path = tmp_path / "scores.csv"
+    n_rows = predict_file(models.models[1], raw_csv, output_path, 64, n_jobs=-1)
+    assert n_rows == len(X)
@@ -0,0 +1,90 @@
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+from thriva.clean_data import clean_csv_in_chunks, load_clean_data
+from thriva.profiling import (
+    active,
+    chrome_trace,
+    instrument,
+    profiling,
+    read_jsonl,
+    stage,
+    summary,
+)
+
+
+@instrument
+def double(df):
+    return pd.concat([df, df])
+
+
+def test_instrument_disabled():
+    df = pd.DataFrame({"a": [1, 2]})
+    assert active() is None
+    assert len(double(df)) == 4
+    with stage("block") as output:
+        output["result"] = df
+    assert double.__name__ == "double"
+
+
+def test_instrument_records(tmp_path):
+    df = pd.DataFrame({"a": [1, 2, 3], "b": [4, 5, 6]})
+    with profiling(tmp_path) as profiler:
+        double(df)
+        with stage("block", df) as output:
+            output["result"] = np.zeros((5, 4))
+            double(df)
+        records = list(profiler.records)
+    assert active() is None
+    assert [record["name"] for record in records] == ["double", "double", "block"]
+    first, nested, block = records
+    assert (first["rows_in"], first["cols_in"]) == (3, 2)
+    assert (first["rows_out"], first["cols_out"]) == (6, 2)
+    assert (block["rows_out"], block["cols_out"]) == (5, 4)
+    assert nested["depth"] == 1 and block["depth"] == 0
+    assert block["wall_s"] >= nested["wall_s"]
+    assert block["peak_rss_mb"] > 0
+    # Flushed at the end of the block
+    assert read_jsonl(str(next(tmp_path.glob("stages-*.jsonl")))) == records
+
+
+def test_stage_memory_is_sampled_during_the_stage():
+    with profiling() as profiler:
+        with stage("large"):
+            large = np.ones(200_000_000 // 8)
+            time.sleep(0.1)
+            del large
+        with stage("small"):
+            small = np.ones(50_000_000 // 8)
+        records = {record["name"]: record for record in profiler.records}
+    del small
+    assert records["large"]["rss_growth_mb"] > 150
+    # The process peak was reached by the larger stage before it
+    assert records["small"]["peak_rss_mb"] < records["small"]["process_peak_rss_mb"]
+    assert 40 < records["small"]["rss_growth_mb"] < 150
+
+
+def test_chrome_trace_and_summary(raw_csv, tmp_path):
+    clean_path = tmp_path / "clean.csv"
+    with profiling(tmp_path / "profile") as profiler:
+        clean_csv_in_chunks(raw_csv, clean_path, chunksize=200)
+        load_clean_data(clean_path)
+        records = list(profiler.records)
+    names = {record["name"] for record in records}
+    assert {"clean_csv_in_chunks", "clean_vitamin_d", "load_clean_data"} <= names
+    trace = json.loads(json.dumps(chrome_trace(records)))
+    events = trace["traceEvents"]
+    assert len(events) == len(records)
+    assert all(event["ph"] == "X" and event["dur"] >= 0 for event in events)
+    table = summary(records)
+    assert table.loc["clean_vitamin_d", "calls"] == 3
+    assert table.loc["clean_vitamin_d", "rows_in"] == 200
+
+
+def test_cprofile_dump(tmp_path):
+    with profiling(tmp_path, cprofile=True):
+        double(pd.DataFrame({"a": [1]}))
+    assert len(list(tmp_path.glob("double-*.prof"))) == 1
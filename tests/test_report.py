@@ -0,0 +1,109 @@
+import os
+import shutil
+from functools import partial
+
+import pandas as pd
+import pytest
+
+from thriva.report import (
+    Stage,
+    module_dependencies,
+    run_stages,
+    task_1_stages,
+    task_2_grid,
+    task_2_stages,
+)
+
+
+def copy_upper(source, path):
+    with open(source) as f:
+        text = f.read()
+    with open(path, "w") as f:
+        f.write(text.upper())
+
+
+def join(sources, path):
+    texts = []
+    for source in sources:
+        with open(source) as f:
+            texts.append(f.read())
+    with open(path, "w") as f:
+        f.write("+".join(texts))
+
+
+@pytest.fixture
+def stages(tmp_path):
+    source = tmp_path / "source.txt"
+    source.write_text("a")
+    upper = str(tmp_path / "upper.txt")
+    joined = str(tmp_path / "out" / "joined.txt")
+    yield [
+        # Declared before the stage it depends on
+        Stage(
+            "joined",
+            partial(join, [str(source), upper]),
+            [joined],
+            [str(source), upper],
+            ["thriva.report"],
+        ),
+        Stage("upper", partial(copy_upper, str(source)), [upper], [str(source)]),
+    ]
+
+
+@pytest.mark.parametrize("n_jobs", [1, 2])
+def test_run_stages(stages, tmp_path, n_jobs):
+    state_path = str(tmp_path / "state.json")
+    seconds = run_stages(stages, state_path, n_jobs=n_jobs)
+    assert all(elapsed is not None for elapsed in seconds.values())
+    assert (tmp_path / "out" / "joined.txt").read_text() == "a+A"
+    # Nothing changed
+    seconds = run_stages(stages, state_path, n_jobs=n_jobs)
+    assert all(elapsed is None for elapsed in seconds.values())
+    # A missing output is built again
+    (tmp_path / "upper.txt").unlink()
+    seconds = run_stages(stages, state_path, n_jobs=n_jobs)
+    assert seconds["upper"] is not None
+    # A changed input rebuilds everything downstream of it
+    (tmp_path / "source.txt").write_text("bc")
+    seconds = run_stages(stages, state_path, n_jobs=n_jobs)
+    assert all(elapsed is not None for elapsed in seconds.values())
+    assert (tmp_path / "out" / "joined.txt").read_text() == "bc+BC"
+    assert all(
+        elapsed is not None
+        for elapsed in run_stages(stages, state_path, force=True).values()
+    )
+
+
+def test_module_dependencies_follow_lazy_imports():
+    modules = module_dependencies("thriva.report")
+    # Imported inside the stage functions only
+    assert {"thriva.experiment", "thriva.plots", "thriva.predict"} <= set(modules)
+    assert {"thriva.profiling", "thriva.report"} <= set(modules)
+    assert "thriva.serve" not in modules
+
+
+def test_task_1_stages_in_parallel_without_cache(clean_data, tmp_path):
+    # A copy of the data has no column cache yet
+    data_path = str(tmp_path / "clean.csv")
+    shutil.copy(clean_data, data_path)
+    reports_dir = str(tmp_path / "reports")
+    stages = task_1_stages(reports_dir, data_path)
+    seconds = run_stages(stages, str(tmp_path / "state.json"), n_jobs=4)
+    assert all(elapsed is not None for elapsed in seconds.values())
+    for stage in stages:
+        assert all(os.path.exists(path) for path in stage.outputs)
+
+
+def test_task_2_stages(clean_data, tmp_path):
+    reports_dir = str(tmp_path / "reports")
+    stages = task_2_stages(reports_dir, clean_data)
+    seconds = run_stages(stages, str(tmp_path / "state.json"))
+    assert all(elapsed is not None for elapsed in seconds.values())
+    for name in ["LGBM_feature_importance", "permutation_importance", "roc_curve"]:
+        assert os.path.exists(os.path.join(reports_dir, f"{name}.png"))
+    # The stages fit the grid of task_2.py
+    grid = task_2_grid(clean_data)
+    results = grid.run()
+    scores = pd.read_csv(os.path.join(reports_dir, "scores_clean.csv"), index_col=0)
+    pd.testing.assert_frame_equal(scores, results["clean"], check_names=False)
+    assert os.listdir(os.path.join(os.path.dirname(clean_data), "lgbm_cache"))
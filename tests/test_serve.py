@@ -0,0 +1,111 @@
+import asyncio
+import json
+
+import numpy as np
+from lightgbm import LGBMClassifier
+
+from thriva.clean_data import clean_csv_in_chunks, load_clean_data
+from thriva.model import FEATURE_COLUMNS, TARGET_COLUMN
+from thriva.predict import prepare_features
+from thriva.serve import MicroBatcher, handle_connection
+
+
+def test_micro_batcher_matches_predict_proba(raw_csv, tmp_path):
+    clean_path = str(tmp_path / "clean.csv")
+    clean_csv_in_chunks(raw_csv, clean_path)
+    vitamin_d = load_clean_data(clean_path)
+    X = vitamin_d[FEATURE_COLUMNS]
+    model = LGBMClassifier().fit(X, vitamin_d[TARGET_COLUMN].lt(75))
+    users = json.loads(X.head(20).to_json(orient="records"))
+
+    async def predict_all():
+        batcher = MicroBatcher(model, max_batch_size=8, max_wait_ms=50)
+        batch_task = asyncio.create_task(batcher.run())
+        probabilities = await asyncio.gather(*(batcher.predict(u) for u in users))
+        batch_task.cancel()
+        return batcher, probabilities
+
+    batcher, probabilities = asyncio.run(predict_all())
+    expected = model.predict_proba(prepare_features(X.head(20)))[:, 1]
+    np.testing.assert_allclose(probabilities, expected)
+    assert max(batcher.batch_sizes) == 8
+    assert batcher.stats()["requests"] == 20
+
+
+def test_micro_batcher_only_fails_malformed_users(raw_csv, tmp_path):
+    clean_path = str(tmp_path / "clean.csv")
+    clean_csv_in_chunks(raw_csv, clean_path)
+    vitamin_d = load_clean_data(clean_path)
+    X = vitamin_d[FEATURE_COLUMNS]
+    model = LGBMClassifier().fit(X, vitamin_d[TARGET_COLUMN].lt(75))
+    users = json.loads(X.head(4).to_json(orient="records"))
+    users[1] = {**users[1], "BMI": "not a number"}
+
+    async def predict_all():
+        batcher = MicroBatcher(model, max_batch_size=4, max_wait_ms=50)
+        batch_task = asyncio.create_task(batcher.run())
+        results = await asyncio.gather(
+            *(batcher.predict(u) for u in users), return_exceptions=True
+        )
+        batch_task.cancel()
+        return batcher, results
+
+    batcher, results = asyncio.run(predict_all())
+    assert isinstance(results[1], ValueError)
+    valid = [0, 2, 3]
+    expected = model.predict_proba(prepare_features(X.iloc[valid]))[:, 1]
+    np.testing.assert_allclose([results[i] for i in valid], expected)
+    assert batcher.batch_sizes[0] == 4
+    assert batcher.stats()["requests"] == 3
+
+
+class FailingModel:
+    def predict_proba(self, X):
+        raise RuntimeError("model unavailable")
+
+
+def exchange(model, request):
+    """Send the raw `request` to a server of `model` and return its reply."""
+
+    async def send():
+        batcher = MicroBatcher(model, max_wait_ms=1)
+        batch_task = asyncio.create_task(batcher.run())
+        server = await asyncio.start_server(
+            lambda reader, writer: handle_connection(batcher, reader, writer),
+            "127.0.0.1",
+            0,
+        )
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(request)
+            # The server closes the keep-alive connection once it reads EOF
+            writer.write_eof()
+            reply = await reader.read()
+            writer.close()
+        batch_task.cancel()
+        return reply.decode()
+
+    return asyncio.run(send())
+
+
+def test_handle_connection_rejects_malformed_requests():
+    reply = exchange(FailingModel(), b"GARBAGE\r\n\r\n")
+    assert reply.startswith("HTTP/1.1 400 Bad Request")
+    assert "Malformed request" in reply
+    reply = exchange(FailingModel(), b"GET /stats HTTP/1.1\r\nno colon\r\n\r\n")
+    assert reply.startswith("HTTP/1.1 400 Bad Request")
+
+
+def test_handle_connection_reports_scoring_errors():
+    body = json.dumps({"Age": 40}).encode()
+    request = (
+        b"POST /predict HTTP/1.1\r\n"
+        + f"Content-Length: {len(body)}\r\n\r\n".encode()
+        + body
+    )
+    reply = exchange(FailingModel(), request)
+    assert reply.startswith("HTTP/1.1 500 Internal Server Error")
+    assert json.loads(reply.split("\r\n\r\n", 1)[1]) == {
+        "error": "RuntimeError: model unavailable"
+    }
@@ -0,0 +1,41 @@
+import pandas as pd
+
+from thriva.clean_data import (
+    RAW_DATE_COLS,
+    RAW_DTYPES,
+    clean_csv_in_chunks,
+    load_clean_data,
+)
+from thriva.synthetic import generate_raw, write_raw_csv
+
+
+def test_generate_raw_schema():
+    raw = generate_raw(1000, random_state=0)
+    assert list(raw.columns) == [*RAW_DATE_COLS, *RAW_DTYPES]
+    assert len(raw) == 1000
+    pd.testing.assert_frame_equal(raw, generate_raw(1000, random_state=0))
+
+
+def test_generate_raw_data_entry_errors():
+    raw = generate_raw(20_000, random_state=0)
+    age = raw["Users Age"]
+    assert age.between(18, 100).mean() > 0.9
+    assert (age > 1900).any()
+    assert (age == 150).any()
+    assert (raw["Users Bmi"] == 500).any()
+    assert (raw["Users Bmi"] < 10).any()
+    assert raw["Users Bmi"].isna().any()
+    assert raw["Users Inactive Time"].str.endswith(" hours").all()
+
+
+def test_write_raw_csv_cleans(tmp_path):
+    raw_path = tmp_path / "raw.csv"
+    clean_path = tmp_path / "clean.csv"
+    write_raw_csv(raw_path, 2500, random_state=0, chunksize=1000)
+    raw = pd.read_csv(raw_path, dtype=RAW_DTYPES, parse_dates=RAW_DATE_COLS)
+    assert len(raw) == 2500
+    clean_csv_in_chunks(raw_path, clean_path)
+    vitamin_d = load_clean_data(clean_path)
+    assert vitamin_d["Age"].max() <= 100
+    assert vitamin_d["BMI"].max() < 100
+    assert not vitamin_d["Inactive Time"].cat.categories.str.contains("hours").any()
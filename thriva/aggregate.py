@@ -0,0 +1,101 @@
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from thriva.profiling import instrument
+
+
+@dataclass
+class CountCube:
+    """Number of rows of each target class, for each level of feature columns.
+
+    Built by `count_cube`. Rows missing the target or the feature are left out
+    of the counts of that feature.
+
+    Parameters
+    ----------
+    target_col : str
+        Column the classes are counted for.
+    n_rows : int
+        Number of rows in the data, missing values included.
+    target_counts : pandas.Series
+        Number of rows of each target class.
+    counts : dict
+        Counts of each feature column, as a DataFrame with the levels of the
+        feature as index and the target classes as columns.
+    """
+
+    target_col: str
+    n_rows: int
+    target_counts: pd.Series
+    counts: dict
+
+    @property
+    def columns(self) -> list:
+        """Feature columns of the cube."""
+        return list(self.counts)
+
+    def percentages(self, col, classes=("Yes", "No")) -> pd.DataFrame:
+        """Percentage of each target class within each level of `col`."""
+        counts = self.counts[col]
+        return 100 * counts.div(counts.sum(axis=1), axis=0)[list(classes)]
+
+    def ratio(self, target_class="Yes") -> float:
+        """Share of all rows in `target_class`."""
+        return self.target_counts[target_class] / self.n_rows
+
+
+def _codes(series):
+    """Return integer codes of `series`, -1 if missing, and the level of each code.
+
+    Categories keep their order and unobserved categories are kept, as with
+    `groupby`. Other values are sorted.
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        levels = pd.CategoricalIndex(
+            series.cat.categories, dtype=series.dtype, name=series.name
+        )
+        return series.cat.codes.to_numpy(), levels
+    codes, levels = pd.factorize(series, sort=True)
+    return codes, pd.Index(levels, name=series.name)
+
+
+@instrument
+def count_cube(df, cols, target_col) -> CountCube:
+    """Count the target classes for every level of every column in `cols`.
+
+    The target is encoded once and each column is counted with a single
+    `numpy.bincount` over the joint codes of the column and the target, so
+    the data is read once whatever the number of plots drawn from the cube.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Data to count.
+    cols : list
+        Feature columns to count.
+    target_col : str
+        Column with the target classes.
+
+    Returns
+    -------
+    cube : CountCube
+        Counts of every column.
+    """
+    target_codes, classes = _codes(df[target_col])
+    n_classes = len(classes)
+    has_target = target_codes >= 0
+    target_counts = pd.Series(
+        np.bincount(target_codes[has_target], minlength=n_classes), index=classes
+    )
+    counts = {}
+    for col in dict.fromkeys(cols):
+        codes, levels = _codes(df[col])
+        defined = has_target & (codes >= 0)
+        joint = codes[defined].astype(np.int64) * n_classes + target_codes[defined]
+        flat = np.bincount(joint, minlength=len(levels) * n_classes)
+        counts[col] = pd.DataFrame(
+            flat.reshape(len(levels), n_classes), index=levels, columns=classes
+        )
+    return CountCube(target_col, len(df), target_counts, counts)
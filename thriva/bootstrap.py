@@ -0,0 +1,213 @@
+import numpy as np
+
+# Largest number of (replicate, row) cells resampled at once, to bound memory
+MAX_CELLS = 5_000_000
+
+
+def bootstrap_indices(n_rows, n_replicates, random_state=None, max_cells=MAX_CELLS):
+    """Draw bootstrap resamples of `n_rows` rows, in batches of replicates.
+
+    Parameters
+    ----------
+    n_rows : int
+        Number of rows to resample.
+    n_replicates : int
+        Number of resamples.
+    random_state : int or numpy.random.Generator, optional
+        Seed or generator of the resamples.
+    max_cells : int, optional
+        Largest number of replicates times rows in a batch.
+
+    Yields
+    ------
+    indices : numpy.ndarray
+        Rows drawn by each replicate of the batch, of shape
+        `(replicates in the batch, n_rows)`.
+    """
+    rng = np.random.default_rng(random_state)
+    batch_size = max(1, min(n_replicates, max_cells // max(n_rows, 1)))
+    for start in range(0, n_replicates, batch_size):
+        n_batch = min(batch_size, n_replicates - start)
+        yield rng.integers(0, n_rows, size=(n_batch, n_rows))
+
+
+def _ratio(numerator, denominator):
+    """`numerator / denominator`, 0 where the denominator is 0, as in sklearn."""
+    return np.divide(
+        numerator,
+        denominator,
+        out=np.zeros_like(numerator, dtype=float),
+        where=denominator > 0,
+    )
+
+
+class ResampledMetrics:
+    """Metrics of one model's predictions on bootstrap resamples.
+
+    The rows are sorted by score once, and grouped by distinct score and
+    predicted label. A resample then only needs the number of positive and
+    negative rows it draws from each group, counted with one
+    `numpy.bincount` for a whole batch of replicates. The confusion matrix
+    follows from the label of each group, and the AUC is the rank-based
+    Mann-Whitney statistic over the groups, with tied scores counted half,
+    so no resample is sorted.
+
+    Parameters
+    ----------
+    y_true : array-like
+        True labels, as booleans.
+    y_pred : array-like
+        Predicted labels, as booleans.
+    scores : array-like
+        Predicted probabilities of the positive class.
+    """
+
+    def __init__(self, y_true, y_pred, scores):
+        y_true = np.asarray(y_true, dtype=bool)
+        y_pred = np.asarray(y_pred, dtype=bool)
+        scores = np.asarray(scores)
+        order = np.lexsort((y_pred, scores))
+        sorted_scores, sorted_pred = scores[order], y_pred[order]
+        starts = np.r_[
+            True,
+            (sorted_scores[1:] != sorted_scores[:-1])
+            | (sorted_pred[1:] != sorted_pred[:-1]),
+        ]
+        group = np.empty(len(order), dtype=np.int64)
+        group[order] = np.cumsum(starts) - 1
+        self.n_groups = int(starts.sum())
+        # Code of each row: its group and whether it is positive
+        self.codes = 2 * group + y_true
+        self.predicted = sorted_pred[starts].astype(np.int64)
+        group_scores = sorted_scores[starts]
+        # Groups sharing a score, which only differ by their predicted label
+        self.ties = np.flatnonzero(np.r_[True, group_scores[1:] != group_scores[:-1]])
+
+    def __call__(self, indices) -> dict:
+        """Metrics of each replicate in `indices`, of shape `(replicates, rows)`.
+
+        Returns
+        -------
+        metrics : dict
+            Array of each metric in `classification_metrics`, one value per
+            replicate.
+        """
+        n_batch, n_rows = indices.shape
+        size = 2 * self.n_groups
+        codes = self.codes[indices]
+        codes += np.arange(n_batch)[:, None] * size
+        counts = np.bincount(codes.ravel(), minlength=n_batch * size)
+        counts = counts.reshape(n_batch, self.n_groups, 2)
+        negatives, positives = counts[:, :, 0], counts[:, :, 1]
+        true_positives = positives @ self.predicted
+        false_positives = negatives @ self.predicted
+        n_positives = positives.sum(axis=1)
+        n_negatives = n_rows - n_positives
+        if len(self.ties) < self.n_groups:
+            positives = np.add.reduceat(positives, self.ties, axis=1)
+            negatives = np.add.reduceat(negatives, self.ties, axis=1)
+        below = np.cumsum(negatives, axis=1) - negatives
+        pairs = (positives * (below + 0.5 * negatives)).sum(axis=1)
+        auc = _ratio(pairs, n_positives * n_negatives)
+        # The AUC is undefined when a resample holds a single class
+        auc[(n_positives == 0) | (n_negatives == 0)] = np.nan
+        return {
+            "accuracy": (true_positives + n_negatives - false_positives) / n_rows,
+            "auc": auc,
+            "precision": _ratio(true_positives, true_positives + false_positives),
+            "recall": _ratio(true_positives, n_positives),
+        }
+
+
+def bootstrap_metrics(
+    y_true, predictions, n_replicates=2000, random_state=None, max_cells=MAX_CELLS
+) -> dict:
+    """Bootstrap the metrics of several models on the same resamples.
+
+    Parameters
+    ----------
+    y_true : array-like
+        True labels, as booleans.
+    predictions : dict
+        Predicted labels and probabilities of the positive class, as a
+        `(y_pred, scores)` pair for each model.
+    n_replicates : int, optional
+        Number of resamples.
+    random_state : int, optional
+        Seed of the resamples.
+    max_cells : int, optional
+        Largest number of replicates times rows resampled at once.
+
+    Returns
+    -------
+    replicates : dict
+        For each model, the array of each metric over the resamples. Models
+        share the resamples, so their replicates can be compared pair by pair.
+    """
+    y_true = np.asarray(y_true, dtype=bool)
+    metrics = {
+        name: ResampledMetrics(y_true, y_pred, scores)
+        for name, (y_pred, scores) in predictions.items()
+    }
+    batches = {name: [] for name in predictions}
+    for indices in bootstrap_indices(
+        len(y_true), n_replicates, random_state, max_cells
+    ):
+        for name, resampled in metrics.items():
+            batches[name].append(resampled(indices))
+    return {
+        name: {
+            metric: np.concatenate([batch[metric] for batch in model_batches])
+            for metric in model_batches[0]
+        }
+        for name, model_batches in batches.items()
+    }
+
+
+def stacked_metric(y_true, y_pred, scores, metric="auc") -> np.ndarray:
+    """Compute a metric for several sets of predictions of the same labels at once.
+
+    Parameters
+    ----------
+    y_true : array-like
+        True labels, as booleans, of shape `(rows,)`.
+    y_pred : numpy.ndarray
+        Predicted labels, as booleans, of shape `(sets, rows)`.
+    scores : numpy.ndarray
+        Predicted probabilities of the positive class, of shape
+        `(sets, rows)`.
+    metric : str, optional, default="auc"
+        Metric of `classification_metrics`. The AUC is computed from the ranks
+        of the scores, with tied scores given their mean rank.
+
+    Returns
+    -------
+    values : numpy.ndarray
+        Metric of each set.
+    """
+    y_true = np.asarray(y_true, dtype=bool)
+    if metric == "auc":
+        from scipy.stats import rankdata
+
+        n_positives = y_true.sum()
+        n_negatives = len(y_true) - n_positives
+        ranks = rankdata(scores, axis=1)[:, y_true].sum(axis=1)
+        return (ranks - n_positives * (n_positives + 1) / 2) / (
+            n_positives * n_negatives
+        )
+    y_pred = np.asarray(y_pred, dtype=bool)
+    true_positives = (y_pred & y_true).sum(axis=1)
+    if metric == "accuracy":
+        return (y_pred == y_true).mean(axis=1)
+    if metric == "precision":
+        return _ratio(true_positives, y_pred.sum(axis=1))
+    if metric == "recall":
+        return _ratio(true_positives, np.full(len(y_pred), y_true.sum()))
+    raise ValueError(f"Unknown metric: {metric}")
+
+
+def percentile_interval(values, confidence=0.95):
+    """Return the percentile bootstrap interval of `values`, ignoring NaN."""
+    alpha = (1 - confidence) / 2
+    low, high = np.nanquantile(values, [alpha, 1 - alpha])
+    return low, high
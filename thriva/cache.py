@@ -0,0 +1,311 @@
+import errno
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+import pandas as pd
+
+CACHE_VERSION = 2
+
+
+def file_hash(path, block_size=1 << 20) -> str:
+    """Return the BLAKE2b hash of a file, read in blocks of `block_size` bytes."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def array_fingerprint(*arrays, extra="") -> str:
+    """Return a hash of the contents, shapes and dtypes of numpy arrays.
+
+    `extra` is hashed as well, to tie the fingerprint to settings that change
+    what is built from the arrays.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        digest.update(f"{array.shape}{array.dtype}".encode())
+        digest.update(array.tobytes())
+    digest.update(extra.encode())
+    return digest.hexdigest()
+
+
+def file_fingerprint(path) -> dict:
+    """Return the size, modification time and hash of a file."""
+    stat = os.stat(path)
+    return {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "hash": file_hash(path),
+    }
+
+
+def frame_fingerprint(df) -> str:
+    """Return a hash of the values, index, columns and dtypes of a DataFrame."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    digest.update(repr(list(df.columns)).encode())
+    digest.update(repr(df.dtypes.astype(str).tolist()).encode())
+    return digest.hexdigest()
+
+
+def cache_dir_for(path) -> str:
+    """Return the directory of the columnar cache written next to `path`."""
+    return f"{os.path.splitext(path)[0]}.cache"
+
+
+def _read_meta(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, "meta.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def is_cache_valid(cache_dir, source_path) -> bool:
+    """Check whether the cache in `cache_dir` was built from `source_path`.
+
+    Size and modification time are checked first. When only the modification
+    time differs, the source is hashed and the cache is kept if the contents
+    did not change.
+    """
+    meta = _read_meta(cache_dir)
+    if meta is None or meta.get("version") != CACHE_VERSION:
+        return False
+    stat = os.stat(source_path)
+    source = meta["source"]
+    if stat.st_size != source["size"]:
+        return False
+    if stat.st_mtime_ns == source["mtime_ns"]:
+        return True
+    if source["hash"] is None or file_hash(source_path) != source["hash"]:
+        return False
+    # Same contents, newer timestamp: refresh the stored modification time
+    meta["source"]["mtime_ns"] = stat.st_mtime_ns
+    _write_meta(cache_dir, meta)
+    return True
+
+
+def _write_meta(cache_dir, meta):
+    tmp_path = os.path.join(cache_dir, "meta.json.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, os.path.join(cache_dir, "meta.json"))
+
+
+def _column_values(series, column):
+    """Return the values of `series` to store for the cached `column`.
+
+    Categories not yet in `column` are appended to it, so the codes already
+    written stay valid.
+    """
+    if column["kind"] == "category":
+        categories = column["categories"]
+        new = [c for c in series.dropna().unique().tolist() if c not in categories]
+        categories.extend(sorted(new))
+        return pd.Categorical(series, categories=categories).codes
+    if column["kind"] == "datetime":
+        return series.to_numpy().view("int64")
+    return series.to_numpy()
+
+
+def _column_meta(name, series):
+    column = {"name": name, "files": []}
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        column["kind"] = "category"
+        column["categories"] = series.cat.categories.tolist()
+        column["ordered"] = bool(series.cat.ordered)
+    elif pd.api.types.is_datetime64_dtype(series.dtype):
+        column["kind"] = "datetime"
+    else:
+        column["kind"] = "numeric"
+    return column
+
+
+def write_column_cache(df, cache_dir, source_path):
+    """Write `df` as one `.npy` file per column.
+
+    Categorical columns are stored as their integer codes, with the categories
+    kept in `meta.json`, and datetimes as int64 nanoseconds. The files are
+    written to a private sibling directory that is then renamed to
+    `cache_dir`, so processes writing the same cache at once never read or
+    delete each other's files.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Data to cache.
+    cache_dir : str
+        Directory of the cache. It is replaced if it already exists and is
+        not up to date.
+    source_path : str
+        File the data was read from, fingerprinted to invalidate the cache.
+    """
+    tmp_dir = f"{cache_dir}.{os.getpid()}.{threading.get_ident()}.tmp"
+    os.makedirs(tmp_dir)
+    try:
+        columns = [_column_meta(col, df[col]) for col in df.columns]
+        meta = {
+            "version": CACHE_VERSION,
+            "source": file_fingerprint(source_path),
+            "n_rows": 0,
+            "columns": columns,
+        }
+        _write_part(df, tmp_dir, meta)
+        _write_meta(tmp_dir, meta)
+        _install(tmp_dir, cache_dir, source_path)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def _install(tmp_dir, cache_dir, source_path):
+    """Rename the cache built in `tmp_dir` to `cache_dir`.
+
+    A cache already put in place by a concurrent write is kept, as it holds
+    the same data. An outdated one is moved aside before it is deleted, as a
+    directory cannot be renamed over a non-empty one.
+    """
+    while True:
+        try:
+            os.rename(tmp_dir, cache_dir)
+            return
+        except OSError as error:
+            if error.errno not in (errno.ENOTEMPTY, errno.EEXIST):
+                raise
+        if is_cache_valid(cache_dir, source_path):
+            return
+        old_dir = f"{tmp_dir}.old"
+        try:
+            os.rename(cache_dir, old_dir)
+        except FileNotFoundError:
+            # Moved aside by another write, try again
+            continue
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def append_column_cache(df, cache_dir, source_path):
+    """Append the rows of `df` to a cache as new files, without rewriting it.
+
+    The cost only depends on the size of `df`. `source_path` must already hold
+    the cached rows followed by the rows of `df`. It is not hashed again, as
+    that would read the whole file, so the cache is invalidated by any later
+    change of its size or modification time.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Rows to add, with the columns of the cache.
+    cache_dir : str
+        Directory of a cache written by `write_column_cache`.
+    source_path : str
+        File the rows of `df` were appended to.
+    """
+    meta = _read_meta(cache_dir)
+    _write_part(df, cache_dir, meta)
+    stat = os.stat(source_path)
+    meta["source"] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "hash": None}
+    _write_meta(cache_dir, meta)
+
+
+def _write_part(df, cache_dir, meta):
+    for i, column in enumerate(meta["columns"]):
+        part = len(column["files"])
+        file_name = f"column_{i}.npy" if part == 0 else f"column_{i}_{part}.npy"
+        values = _column_values(df[column["name"]], column)
+        np.save(os.path.join(cache_dir, file_name), values, allow_pickle=False)
+        column["files"].append(file_name)
+    meta["n_rows"] += len(df)
+
+
+def _load_column(cache_dir, column, rows, mmap_mode):
+    parts = [
+        np.load(os.path.join(cache_dir, file_name), mmap_mode=mmap_mode)
+        for file_name in column["files"]
+    ]
+    if len(parts) == 1:
+        return parts[0] if rows is None else parts[0][rows]
+    if rows is None:
+        return np.concatenate(parts)
+    # Select the rows part by part, so only the selected rows are copied
+    positions = np.arange(sum(len(values) for values in parts))[rows]
+    selected = []
+    start = 0
+    for values in parts:
+        stop = start + len(values)
+        in_part = positions[(positions >= start) & (positions < stop)]
+        selected.append(values[in_part - start])
+        start = stop
+    return np.concatenate(selected)
+
+
+def read_column_cache(cache_dir, columns=None, rows=None, mmap_mode="r", dtypes=None):
+    """Read a cache written by `write_column_cache` back into a DataFrame.
+
+    Rows added by `append_column_cache` follow the rows first written.
+
+    Parameters
+    ----------
+    cache_dir : str
+        Directory of the cache.
+    columns : list, optional
+        Columns to read, in order. Other columns are never loaded.
+    rows : numpy.ndarray, optional
+        Boolean mask or integer positions of the rows to keep. Only those rows
+        are copied out of the memory-mapped files.
+    mmap_mode : str, optional
+        Memory-map mode passed to `numpy.load`.
+    dtypes : dict, optional
+        Dtype to convert numeric columns to. They are converted straight from
+        the memory-mapped files, so the stored dtype is never copied to memory.
+
+    Returns
+    -------
+    df : pandas.DataFrame
+        Cached data.
+    """
+    meta = _read_meta(cache_dir)
+    if meta is None:
+        raise FileNotFoundError(f"No data cache in {cache_dir}")
+    cached_columns = {column["name"]: column for column in meta["columns"]}
+    if columns is None:
+        columns = list(cached_columns)
+    missing = [col for col in columns if col not in cached_columns]
+    if missing:
+        raise KeyError(f"Columns not in the cache: {missing}")
+    data = {}
+    for col in columns:
+        column = cached_columns[col]
+        values = _load_column(cache_dir, column, rows, mmap_mode)
+        if column["kind"] == "category":
+            categories = pd.Index(column["categories"])
+            data[col] = pd.Categorical.from_codes(
+                values, categories=categories, ordered=column["ordered"]
+            )
+            if not column["ordered"] and not categories.is_monotonic_increasing:
+                # Appended categories go last, read_csv sorts them
+                data[col] = data[col].reorder_categories(categories.sort_values())
+        elif column["kind"] == "datetime":
+            data[col] = values.view("datetime64[ns]")
+        elif dtypes is not None and col in dtypes:
+            data[col] = values.astype(dtypes[col], copy=False)
+        else:
+            data[col] = values
+    return pd.DataFrame(data, columns=columns)
+
+
+def iter_column_cache(cache_dir, chunksize, columns=None):
+    """Read a cache written by `write_column_cache` in chunks of `chunksize` rows.
+
+    Each chunk keeps the position of its rows in the cache as its index.
+    """
+    n_rows = _read_meta(cache_dir)["n_rows"]
+    for start in range(0, n_rows, chunksize):
+        stop = min(start + chunksize, n_rows)
+        chunk = read_column_cache(cache_dir, columns=columns, rows=slice(start, stop))
+        chunk.index = pd.RangeIndex(start, stop)
+        yield chunk
@@ -1,4 +1,40 @@
+import argparse
+import io
+import re
+import warnings
+
+import numpy as np
 import pandas as pd
+from pandas.api.types import CategoricalDtype
+
+from thriva.cache import (
+    append_column_cache,
+    cache_dir_for,
+    is_cache_valid,
+    read_column_cache,
+    write_column_cache,
+)
+from thriva.profiling import instrument
+
+RAW_DATA_PATH = "data/vitamin_d_test_results_2022.csv"
+CLEAN_DATA_PATH = "data/vitamin_d_test_results_2022_cleaned.csv"
+
+RAW_DTYPES = {
+    "Users Active Days Walking": "float64",
+    "Users Diet Rating": "float64",
+    "Users Exercise Rating": "float64",
+    "Users Inactive Time": "category",
+    "Users Bmi": "float64",
+    "Users Fatigued Rating": "category",
+    "Users Sleep Hours": "category",
+    "Users Stressed Rating": "category",
+    "Users Main Goal": "category",
+    "Users Age": "int64",
+    "Sex": "category",
+    "Users Vitamin D Supplement (Yes / No)": "category",
+    "Analyte Results Avg Numeric Result": "float64",
+}
+RAW_DATE_COLS = ["Tests Completed Month"]
 
 
 def age_clean(age: int) -> int:
@@ -24,12 +60,50 @@ def age_clean(age: int) -> int:
         return age
 
 
-def clean_vitamin_d(df):
-    df["Users Age"] = df["Users Age"].apply(age_clean)
-    df["Users Bmi"] = df["Users Bmi"].mask(~df["Users Bmi"].between(10, 60))
-    df["Users Inactive Time"] = df["Users Inactive Time"].apply(
-        lambda x: x.replace(" hours", "")
+@instrument
+def age_clean_series(age: pd.Series) -> pd.Series:
+    """Vectorized version of `age_clean` applied to a whole column.
+
+    Parameters
+    ----------
+    age : pandas.Series
+        Age of the users
+
+    Returns
+    -------
+    age : pandas.Series
+        Age of the users corrected if necessary
+    """
+    age = age.astype("int64")
+    values = age.to_numpy()
+    values = np.where(values > 1900, 2022 - values, np.minimum(values, 100))
+    return pd.Series(values, index=age.index, name=age.name)
+
+
+@instrument
+def bmi_clean_series(bmi: pd.Series) -> pd.Series:
+    """Mask BMI values outside the plausible 10-60 range."""
+    return bmi.mask(~bmi.between(10, 60))
+
+
+@instrument
+def inactive_time_clean_series(inactive_time: pd.Series) -> pd.Series:
+    """Strip the " hours" suffix from the inactive time categories.
+
+    Only the categories are rewritten, so the cost does not depend on the
+    number of rows.
+    """
+    inactive_time = inactive_time.astype("category")
+    return inactive_time.cat.rename_categories(
+        lambda category: category.replace(" hours", "")
     )
+
+
+@instrument
+def clean_vitamin_d(df):
+    df["Users Age"] = age_clean_series(df["Users Age"])
+    df["Users Bmi"] = bmi_clean_series(df["Users Bmi"])
+    df["Users Inactive Time"] = inactive_time_clean_series(df["Users Inactive Time"])
     rename_dict = {col: col.replace("Users ", "") for col in df.columns}
     rename_dict["Users Bmi"] = "BMI"
     rename_dict["Users Vitamin D Supplement (Yes / No)"] = "Vitamin D Supplement"
@@ -38,54 +112,406 @@ def clean_vitamin_d(df):
     return df
 
 
-def load_clean_data():
-    dtypes = {
-        "Active Days Walking": "float64",
-        "Diet Rating": "float64",
-        "Exercise Rating": "float64",
-        "Inactive Time": "category",
-        "BMI": "float64",
-        "Fatigued Rating": "float64",
-        "Sleep Hours": "category",
-        "Stressed Rating": "category",
-        "Main Goal": "category",
-        "Age": "int64",
-        "Sex": "category",
-        "Vitamin D Supplement": "category",
-        "Vitamin D Level": "float64",
-    }
-    date_cols = ["Tests Completed Month"]
-
-    vitamin_d = pd.read_csv(
-        "data/vitamin_d_test_results_2022_cleaned.csv",
-        dtype=dtypes,
-        parse_dates=date_cols,
+@instrument
+def scan_raw_categories(path=RAW_DATA_PATH, chunksize=100_000):
+    """Collect the categories of every categorical raw column in one pass.
+
+    Only the categorical columns are read, so memory is bounded by the chunk
+    size and the number of distinct values.
+
+    Parameters
+    ----------
+    path : str
+        Path to the raw CSV file.
+    chunksize : int
+        Number of rows read at a time.
+
+    Returns
+    -------
+    dtypes : dict
+        Fixed `CategoricalDtype` for each categorical column.
+    """
+    categorical_cols = [col for col, dtype in RAW_DTYPES.items() if dtype == "category"]
+    return scan_categories(path, categorical_cols, chunksize)
+
+
+def scan_categories(path, columns, chunksize=100_000):
+    """Collect the categories of `columns` of a CSV file in one pass.
+
+    The categories are sorted, as `read_csv` sorts them when it reads a whole
+    file with the `category` dtype.
+
+    Returns
+    -------
+    dtypes : dict
+        Fixed `CategoricalDtype` for each column.
+    """
+    categories = {col: set() for col in columns}
+    reader = pd.read_csv(path, usecols=list(columns), dtype=str, chunksize=chunksize)
+    for chunk in reader:
+        for col in columns:
+            categories[col].update(chunk[col].dropna().unique())
+    return {col: CategoricalDtype(sorted(values)) for col, values in categories.items()}
+
+
+def read_clean_chunks(path=RAW_DATA_PATH, chunksize=100_000):
+    """Read the raw CSV in chunks and yield each chunk cleaned.
+
+    The categorical columns of every chunk share the same categories, so the
+    chunks can be concatenated or compared without dtype changes.
+
+    Parameters
+    ----------
+    path : str
+        Path to the raw CSV file.
+    chunksize : int
+        Number of rows read at a time.
+
+    Yields
+    ------
+    chunk : pandas.DataFrame
+        Cleaned chunk, as returned by `clean_vitamin_d`.
+    """
+    dtypes = {**RAW_DTYPES, **scan_raw_categories(path, chunksize)}
+    reader = pd.read_csv(
+        path, dtype=dtypes, parse_dates=RAW_DATE_COLS, chunksize=chunksize
     )
+    for chunk in reader:
+        yield clean_vitamin_d(chunk)
+
+
+@instrument
+def clean_csv_in_chunks(
+    input_path=RAW_DATA_PATH, output_path=CLEAN_DATA_PATH, chunksize=100_000
+):
+    """Clean the raw CSV chunk by chunk, appending each chunk to the output.
+
+    Peak memory is bounded by `chunksize` instead of the size of the file.
+    """
+    for i, chunk in enumerate(read_clean_chunks(input_path, chunksize)):
+        chunk.to_csv(
+            output_path, mode="w" if i == 0 else "a", header=i == 0, index=False
+        )
+
+
+CLEAN_DTYPES = {
+    "Active Days Walking": "float64",
+    "Diet Rating": "float64",
+    "Exercise Rating": "float64",
+    "Inactive Time": "category",
+    "BMI": "float64",
+    "Fatigued Rating": "float64",
+    "Sleep Hours": "category",
+    "Stressed Rating": "category",
+    "Main Goal": "category",
+    "Age": "int64",
+    "Sex": "category",
+    "Vitamin D Supplement": "category",
+    "Vitamin D Level": "float64",
+}
+CLEAN_DATE_COLS = ["Tests Completed Month"]
+COMPACT_DTYPES = {
+    "Active Days Walking": "float32",
+    "Diet Rating": "float32",
+    "Exercise Rating": "float32",
+    "Fatigued Rating": "float32",
+    "BMI": "float32",
+    "Vitamin D Level": "float32",
+}
+ORDERED_CATEGORY_COLS = ["Inactive Time", "Sleep Hours", "Stressed Rating"]
+
+
+def natural_order(categories):
+    """Sort range-like labels such as "<5", "5-6" and "8+" by their numbers.
+
+    Labels without any number are sorted alphabetically after the others.
+    """
+
+    def key(category):
+        match = re.search(r"\d+(\.\d+)?", category)
+        if match is None:
+            return (1, 0.0, category)
+        number = float(match.group())
+        if category.lstrip().startswith("<"):
+            number -= 0.5
+        elif category.rstrip().endswith("+"):
+            number += 0.5
+        return (0, number, category)
+
+    return sorted(categories, key=key)
+
+
+@instrument
+def compact_vitamin_d(df):
+    """Convert the cleaned data to a compact schema.
+
+    Ratings, BMI and vitamin D levels become float32, `Age` the smallest
+    integer type that holds it, and the range-like categories are ordered
+    so that plots and encoders follow their natural order. Only the converted
+    columns are new, the others are shared with `df`, which is left unchanged.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Cleaned vitamin D results, with any subset of the columns.
+
+    Returns
+    -------
+    df : pandas.DataFrame
+        Same data with the compact dtypes.
+    """
+    df = df.copy(deep=False)
+    for col, dtype in COMPACT_DTYPES.items():
+        if col in df and df[col].dtype != dtype:
+            df[col] = df[col].astype(dtype)
+    if "Age" in df:
+        df["Age"] = pd.to_numeric(df["Age"], downcast="integer")
+    for col in ORDERED_CATEGORY_COLS:
+        if col in df:
+            categories = natural_order(df[col].cat.categories)
+            df[col] = df[col].cat.reorder_categories(categories, ordered=True)
+    return df
+
+
+def memory_report(df, compact_df=None):
+    """Report the memory used by each column, in megabytes.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Data to report on.
+    compact_df : pandas.DataFrame, optional
+        Compact version of `df`, reported side by side with the saving.
+
+    Returns
+    -------
+    report : pandas.DataFrame
+        Dtype and memory of each column, with a final `Total` row.
+    """
+    report = pd.DataFrame(
+        {"dtype": df.dtypes.astype(str), "MB": df.memory_usage(index=False, deep=True)}
+    )
+    if compact_df is not None:
+        report["compact dtype"] = compact_df.dtypes.astype(str)
+        report["compact MB"] = compact_df.memory_usage(index=False, deep=True)
+    report.loc["Total"] = report.sum(numeric_only=True)
+    for col in ["MB", "compact MB"]:
+        if col in report:
+            report[col] = report[col] / 1e6
+    if compact_df is not None:
+        report["ratio"] = report["MB"] / report["compact MB"]
+    return report.round(3).fillna("")
+
+
+def months_mask(dates, months):
+    """Return a boolean mask of the dates inside an inclusive month range.
+
+    Parameters
+    ----------
+    dates : array-like of datetime64
+        Dates to filter.
+    months : tuple
+        `(first, last)` months, as anything `pandas.Timestamp` accepts. Either
+        end can be None to leave the range open.
+
+    Returns
+    -------
+    mask : numpy.ndarray
+        True for the dates inside the range.
+    """
+    first, last = months
+    dates = pd.DatetimeIndex(dates)
+    mask = np.ones(len(dates), dtype=bool)
+    if first is not None:
+        mask &= dates >= pd.Timestamp(first)
+    if last is not None:
+        mask &= dates <= pd.Timestamp(last)
+    return mask
+
+
+def _read_cache(cache_dir, columns, months, compact):
+    """Read the requested columns and months of the data cache."""
+    rows = None
+    if months is not None:
+        month_col = CLEAN_DATE_COLS[0]
+        dates = read_column_cache(cache_dir, columns=[month_col])[month_col]
+        rows = months_mask(dates, months)
+    return read_column_cache(
+        cache_dir,
+        columns=columns,
+        rows=rows,
+        dtypes=COMPACT_DTYPES if compact else None,
+    )
+
+
+@instrument
+def load_clean_data(
+    path=CLEAN_DATA_PATH, use_cache=True, columns=None, months=None, compact=False
+):
+    """Load the cleaned vitamin D results.
+
+    The first load parses the CSV and writes a columnar cache of `.npy` files
+    next to it. Later loads memory-map the cache instead of parsing the CSV,
+    until the CSV changes. Processes loading the same uncached file at once
+    each write the cache, and keep the frame they parsed if the cache they
+    read is replaced under them. Only the requested columns and the rows in the
+    requested months are read from the cache.
+
+    Parameters
+    ----------
+    path : str
+        Path to the cleaned CSV file.
+    use_cache : bool
+        Whether to read and write the columnar cache.
+    columns : list, optional
+        Columns to load, in order. All columns are loaded by default.
+    months : tuple, optional
+        Inclusive `(first, last)` range of `Tests Completed Month` to keep.
+        Either end can be None.
+    compact : bool
+        Convert the result to the compact schema of `compact_vitamin_d`. The
+        float32 columns are converted as they are read, so the float64 values
+        are never all in memory.
+
+    Returns
+    -------
+    vitamin_d : pandas.DataFrame
+        Cleaned vitamin D results.
+    """
+    month_col = CLEAN_DATE_COLS[0]
+    cache_dir = cache_dir_for(path)
+    dtypes = {**CLEAN_DTYPES, **COMPACT_DTYPES} if compact else CLEAN_DTYPES
+    parsed = None
+    if use_cache and not is_cache_valid(cache_dir, path):
+        parsed = pd.read_csv(path, dtype=CLEAN_DTYPES, parse_dates=CLEAN_DATE_COLS)
+        try:
+            write_column_cache(parsed, cache_dir, path)
+        except OSError as error:
+            warnings.warn(f"Could not write the data cache to {cache_dir}: {error}")
+            use_cache = False
+    if use_cache:
+        try:
+            vitamin_d = _read_cache(cache_dir, columns, months, compact)
+        except OSError:
+            if parsed is None:
+                raise
+            # Another process replaced the cache while it was read, but the
+            # frame just parsed holds the same data
+            use_cache = False
+        else:
+            parsed = None
+    if not use_cache:
+        if parsed is None:
+            usecols = None
+            if columns is not None:
+                usecols = list(columns)
+                if months is not None and month_col not in usecols:
+                    usecols.append(month_col)
+            parsed = pd.read_csv(
+                path,
+                usecols=usecols,
+                dtype=dtypes,
+                parse_dates=[
+                    col for col in CLEAN_DATE_COLS if usecols is None or col in usecols
+                ],
+            )
+        vitamin_d = parsed
+        if months is not None:
+            vitamin_d = vitamin_d[months_mask(vitamin_d[month_col], months)]
+            vitamin_d = vitamin_d.reset_index(drop=True)
+        if columns is not None:
+            vitamin_d = vitamin_d[list(columns)]
+    if compact:
+        vitamin_d = compact_vitamin_d(vitamin_d)
     return vitamin_d
 
 
+@instrument
+def append_new_months(raw_path, clean_path=CLEAN_DATA_PATH, chunksize=100_000):
+    """Clean the months of `raw_path` missing from the cleaned data and append them.
+
+    Only the rows tested after the last month of the cleaned data are kept, so
+    a batch can be appended again safely. The other rows are skipped with a
+    warning giving their number, as late results of a month already cleaned
+    are lost. The rows are appended to the cleaned CSV and to its columnar
+    cache without reading or rewriting the rows already there, so a monthly
+    batch takes as long to append however many months were cleaned before.
+
+    Parameters
+    ----------
+    raw_path : str
+        Raw CSV file with the new results, in the raw format.
+    clean_path : str
+        Cleaned CSV file to append to.
+    chunksize : int
+        Number of raw rows read at a time.
+
+    Returns
+    -------
+    n_rows : int
+        Number of rows appended.
+    """
+    month_col = CLEAN_DATE_COLS[0]
+    # Also builds the cache of the cleaned data if it is missing
+    last_month = load_clean_data(clean_path, columns=[month_col])[month_col].max()
+    header = pd.read_csv(clean_path, nrows=0).columns
+    n_rows = n_skipped = 0
+    for chunk in read_clean_chunks(raw_path, chunksize):
+        is_new = chunk[month_col] > last_month
+        n_skipped += int((~is_new).sum())
+        chunk = chunk[is_new]
+        if chunk.empty:
+            continue
+        text = chunk.reindex(columns=header).to_csv(header=False, index=False)
+        with open(clean_path, "a") as f:
+            f.write(text)
+        # Parse the rows back, so the cache holds exactly what the CSV holds
+        new_rows = pd.read_csv(
+            io.StringIO(text),
+            names=header,
+            dtype=CLEAN_DTYPES,
+            parse_dates=CLEAN_DATE_COLS,
+        )
+        append_column_cache(new_rows, cache_dir_for(clean_path), clean_path)
+        n_rows += len(new_rows)
+    if n_skipped:
+        warnings.warn(
+            f"Skipped {n_skipped:,d} rows of {raw_path} tested in or before "
+            f"{last_month:%Y-%m}, the last month of the cleaned data"
+        )
+    return n_rows
+
+
 if __name__ == "__main__":
-    dtypes = {
-        "Users Active Days Walking": "float64",
-        "Users Diet Rating": "float64",
-        "Users Exercise Rating": "float64",
-        "Users Inactive Time": "category",
-        "Users Bmi": "float64",
-        "Users Fatigued Rating": "category",
-        "Users Sleep Hours": "category",
-        "Users Stressed Rating": "category",
-        "Users Main Goal": "category",
-        "Users Age": "int64",
-        "Sex": "category",
-        "Users Vitamin D Supplement (Yes / No)": "category",
-        "Analyte Results Avg Numeric Result": "float64",
-    }
-    date_cols = ["Tests Completed Month"]
-    print("💾 Loading data...")
-    vitamin_d = pd.read_csv(
-        "data/vitamin_d_test_results_2022.csv", dtype=dtypes, parse_dates=date_cols
+    parser = argparse.ArgumentParser(description="Clean the raw vitamin D results.")
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        default=None,
+        help="Stream the raw file in chunks of this many rows.",
+    )
+    parser.add_argument(
+        "--append",
+        metavar="RAW_PATH",
+        default=None,
+        help="Only append the new months of this raw file to the cleaned data.",
     )
-    print("🧹 Cleaning data...")
-    vitamin_d = clean_vitamin_d(vitamin_d)
-    vitamin_d.to_csv("data/vitamin_d_test_results_2022_cleaned.csv", index=False)
-    print("🎉 Done!")
\ No newline at end of file
+    args = parser.parse_args()
+    if args.append:
+        print(f"🧹 Appending the new months of {args.append}...")
+        n_rows = append_new_months(
+            args.append, CLEAN_DATA_PATH, chunksize=args.chunksize or 100_000
+        )
+        print(f"➕ Appended {n_rows:,d} rows")
+    elif args.chunksize:
+        print(f"🧹 Cleaning data in chunks of {args.chunksize:,d} rows...")
+        clean_csv_in_chunks(RAW_DATA_PATH, CLEAN_DATA_PATH, chunksize=args.chunksize)
+    else:
+        print("💾 Loading data...")
+        vitamin_d = pd.read_csv(
+            RAW_DATA_PATH, dtype=RAW_DTYPES, parse_dates=RAW_DATE_COLS
+        )
+        print("🧹 Cleaning data...")
+        vitamin_d = clean_vitamin_d(vitamin_d)
+        vitamin_d.to_csv(CLEAN_DATA_PATH, index=False)
+    print("🎉 Done!")
@@ -0,0 +1,163 @@
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+from thriva.clean_data import CLEAN_DATA_PATH, load_clean_data
+from thriva.model import (
+    FEATURE_COLUMNS,
+    OPTIMAL_LEVEL,
+    TARGET_COLUMN,
+    ModelSelection,
+    default_models,
+    run_fit_tasks,
+)
+from thriva.profiling import instrument
+
+
+@dataclass
+class Variant:
+    """Preprocessing of the data for one row of an `ExperimentGrid`.
+
+    Parameters
+    ----------
+    name : str
+        Name of the variant in the results.
+    clean_na : bool, optional, default=False
+        Drop the rows with missing values in the features of the variant, or
+        in the target when `data` has it.
+    columns : list, optional
+        Features to keep, in order. All of `FEATURE_COLUMNS` by default.
+    transform : callable, optional
+        Called with the features and returning new features, after the rows
+        and columns are selected.
+    """
+
+    name: str
+    clean_na: bool = False
+    columns: list = None
+    transform: object = None
+
+    def apply(self, data) -> pd.DataFrame:
+        """Return the features of the variant, for the rows of `data` it keeps."""
+        columns = list(self.columns or FEATURE_COLUMNS)
+        X = data[columns]
+        if self.clean_na:
+            # A missing target would otherwise be labelled optimal by `lt`
+            if TARGET_COLUMN in data:
+                columns.append(TARGET_COLUMN)
+            X = X[data[columns].notna().all(axis=1).to_numpy()]
+        if self.transform is not None:
+            X = self.transform(X)
+        return X
+
+
+@dataclass
+class ExperimentGrid:
+    """Fit and score every model on every preprocessing variant of the data.
+
+    The cleaned data is loaded once and split once, by row, so every variant
+    is trained and tested on the same rows, minus the rows it drops. Each
+    (variant, model) cell fits its own clone of the model, and the cells are
+    fitted together in `n_jobs` threads.
+
+    Parameters
+    ----------
+    variants : list of Variant
+        Preprocessing variants.
+    models : list, optional
+        Models to fit on each variant. They are cloned, never fitted.
+    n_jobs : int, optional, default=1
+        Number of cells fitted at the same time. -1 uses all cores.
+    random_state : int, optional
+        Seed of the split and of the models.
+    months : tuple, optional
+        Inclusive `(first, last)` range of `Tests Completed Month` to use.
+    compact : bool, optional
+        Load the data with the compact schema of `compact_vitamin_d`.
+    path : str, optional
+        Path to the cleaned CSV file.
+    lgbm_cache_dir : str, optional
+        Directory where the binned LightGBM training Datasets are saved, as in
+        `ModelSelection`.
+    """
+
+    variants: list
+    models: list = field(default_factory=lambda: default_models())
+    n_jobs: int = 1
+    random_state: int = None
+    months: tuple = None
+    compact: bool = False
+    path: str = CLEAN_DATA_PATH
+    lgbm_cache_dir: str = None
+
+    def split(self):
+        """Load the data and split its rows into training and testing positions.
+
+        Returns
+        -------
+        data : pandas.DataFrame
+            Features and target of every row.
+        train : numpy.ndarray
+            Positions of the training rows.
+        test : numpy.ndarray
+            Positions of the testing rows.
+        """
+        from sklearn.model_selection import train_test_split
+
+        data = load_clean_data(
+            self.path,
+            columns=[*FEATURE_COLUMNS, TARGET_COLUMN],
+            months=self.months,
+            compact=self.compact,
+        )
+        # Same positions as the split of `prepare_data` with the same seed
+        train, test = train_test_split(
+            np.arange(len(data)), test_size=0.2, random_state=self.random_state
+        )
+        return data, train, test
+
+    @instrument
+    def run(self) -> pd.DataFrame:
+        """Fit and score every (variant, model) cell.
+
+        Returns
+        -------
+        results_ : pandas.DataFrame
+            Metrics of each cell, in the layout of `ModelSelection.results_`
+            with the variant as the outer column level.
+        """
+        from sklearn.base import clone
+
+        data, train, test = self.split()
+        y = data[TARGET_COLUMN].lt(OPTIMAL_LEVEL)
+        self.selections_ = {}
+        self.test_sets_ = {}
+        tasks = []
+        train_rows, test_rows = data.iloc[train], data.iloc[test]
+        for variant in self.variants:
+            if variant.name in self.selections_:
+                raise ValueError(f"Duplicate variant name: {variant.name}")
+            X_train = variant.apply(train_rows)
+            X_test = variant.apply(test_rows)
+            selection = ModelSelection(
+                models=[clone(model) for model in self.models],
+                lgbm_cache_dir=self.lgbm_cache_dir,
+                random_state=self.random_state,
+            )
+            tasks += selection.fit_tasks(X_train, y.loc[X_train.index])
+            self.selections_[variant.name] = selection
+            self.test_sets_[variant.name] = (X_test, y.loc[X_test.index])
+        run_fit_tasks(tasks, self.n_jobs)
+        self.results_ = pd.concat(
+            {
+                name: selection.score(*self.test_sets_[name])
+                for name, selection in self.selections_.items()
+            },
+            axis=1,
+        )
+        return self.results_
+
+    def roc_plot(self, variant) -> "Figure":
+        """Plot the ROC curve of each model fitted on `variant`."""
+        return self.selections_[variant].roc_plot(*self.test_sets_[variant])
@@ -0,0 +1,185 @@
+import numpy as np
+import pandas as pd
+
+from thriva.bootstrap import stacked_metric
+from thriva.model import limited_threads, model_names
+from thriva.profiling import instrument
+
+# Largest number of rows sent to `predict_proba` at once
+MAX_BATCH_ROWS = 1_000_000
+
+
+def metric_scores(model, proba, y_true, scoring="auc") -> np.ndarray:
+    """Compute `scoring` for stacked probabilities of the same labels.
+
+    `proba` has shape `(sets, rows, classes)`, with one set of probabilities
+    per version of the data. Labels are predicted as `model.predict` does.
+    """
+    y_pred = model.classes_[proba.argmax(axis=2)] == model.classes_[-1]
+    return stacked_metric(y_true, y_pred, proba[:, :, -1], scoring)
+
+
+def _column(series, values):
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return pd.Categorical.from_codes(values, dtype=series.dtype)
+    return values
+
+
+def permuted_scores(
+    model, X, y_true, tasks, scoring="auc", max_rows=MAX_BATCH_ROWS, n_threads=None
+) -> list:
+    """Score `model` on `X` with one column permuted, for each task.
+
+    `X` is tiled into a preallocated copy holding several permuted versions
+    of it, one after the other. Each copy has the column of its task shuffled
+    in place, and the copies go through `predict_proba` in a single call.
+
+    Parameters
+    ----------
+    model : estimator
+        Fitted classifier, predicting from DataFrames like `X`.
+    X : pandas.DataFrame
+        Testing data.
+    y_true : array-like
+        Testing labels.
+    tasks : list
+        `(column, seed)` pairs: the column to permute and the seed of the
+        permutation.
+    scoring : str, optional, default="auc"
+        Metric of `classification_metrics`.
+    max_rows : int, optional
+        Largest number of rows predicted at once.
+    n_threads : int, optional
+        Threads the model may use, set with `limited_threads`.
+
+    Returns
+    -------
+    scores : list
+        Score of the model for each task.
+    """
+    n_rows = len(X)
+    # Categorical columns are permuted as their codes
+    values = {
+        col: (
+            X[col].cat.codes.to_numpy()
+            if isinstance(X[col].dtype, pd.CategoricalDtype)
+            else X[col].to_numpy()
+        )
+        for col in X.columns
+    }
+    n_copies = max(1, min(len(tasks), max_rows // max(n_rows, 1)))
+    tiled = {col: np.tile(column, n_copies) for col, column in values.items()}
+    scores = []
+    with limited_threads([model], n_threads):
+        for start in range(0, len(tasks), n_copies):
+            batch = tasks[start : start + n_copies]
+            for copy, (col, seed) in enumerate(batch):
+                permutation = np.random.default_rng(seed).permutation(n_rows)
+                rows = slice(copy * n_rows, (copy + 1) * n_rows)
+                tiled[col][rows] = values[col][permutation]
+            size = len(batch) * n_rows
+            frame = pd.DataFrame(
+                {col: _column(X[col], tiled[col][:size]) for col in X.columns},
+                columns=X.columns,
+            )
+            proba = model.predict_proba(frame)
+            proba = proba.reshape(len(batch), n_rows, proba.shape[1])
+            scores += metric_scores(model, proba, y_true, scoring).tolist()
+            # Restore the copies for the next batch
+            for copy, (col, _) in enumerate(batch):
+                rows = slice(copy * n_rows, (copy + 1) * n_rows)
+                tiled[col][rows] = values[col]
+    return scores
+
+
+@instrument
+def permutation_importance(
+    models,
+    X,
+    y_true,
+    baselines,
+    n_repeats=5,
+    scoring="auc",
+    n_jobs=1,
+    random_state=None,
+    max_rows=MAX_BATCH_ROWS,
+):
+    """Drop in score of each model when each column of `X` is permuted.
+
+    Every (feature, repeat) permutation of every model is scored with
+    `permuted_scores`, in batches spread over `n_jobs` processes. The
+    permutations only depend on `random_state`, not on `n_jobs`, and are the
+    same for every model.
+
+    Parameters
+    ----------
+    models : list
+        Fitted classifiers, predicting from DataFrames like `X`.
+    X : pandas.DataFrame
+        Testing data.
+    y_true : array-like
+        Testing labels.
+    baselines : list
+        Score of each model on `X` unchanged.
+    n_repeats : int, optional, default=5
+        Number of permutations of each column.
+    scoring : str, optional, default="auc"
+        Metric of `classification_metrics`.
+    n_jobs : int, optional, default=1
+        Number of worker processes. -1 uses all cores.
+    random_state : int, optional
+        Seed of the permutations.
+    max_rows : int, optional
+        Largest number of rows predicted at once by a worker.
+
+    Returns
+    -------
+    importances : pandas.DataFrame
+        Mean drop in score over the repeats, with the features as index and
+        the models as columns.
+    std : pandas.DataFrame
+        Standard deviation of the drop over the repeats.
+    """
+    from joblib import Parallel, cpu_count, delayed, effective_n_jobs
+
+    seeds = np.random.default_rng(random_state).integers(
+        2**32, size=(len(X.columns), n_repeats)
+    )
+    tasks = [
+        (col, int(seed))
+        for col, col_seeds in zip(X.columns, seeds)
+        for seed in col_seeds
+    ]
+    n_workers = min(effective_n_jobs(n_jobs), len(tasks) * len(models))
+    n_threads = max(1, cpu_count() // n_workers) if n_workers > 1 else None
+    # Split each model's tasks in as many chunks as workers
+    n_chunks = max(1, -(-n_workers // len(models)))
+    chunks = [list(chunk) for chunk in np.array_split(np.arange(len(tasks)), n_chunks)]
+    jobs = [(i, chunk) for i in range(len(models)) for chunk in chunks if chunk]
+    results = Parallel(n_jobs=n_workers)(
+        delayed(permuted_scores)(
+            models[i],
+            X,
+            y_true,
+            [tasks[task] for task in chunk],
+            scoring,
+            max_rows,
+            n_threads,
+        )
+        for i, chunk in jobs
+    )
+    scores = {i: [] for i in range(len(models))}
+    for (i, _), chunk_scores in zip(jobs, results):
+        scores[i] += chunk_scores
+    names = model_names(models)
+    drops = {
+        name: baseline - np.reshape(scores[i], (len(X.columns), n_repeats))
+        for i, (name, baseline) in enumerate(zip(names, baselines))
+    }
+    importances = pd.DataFrame(
+        {name: drop.mean(axis=1) for name, drop in drops.items()}, index=X.columns
+    )
+    std = pd.DataFrame(
+        {name: drop.std(axis=1) for name, drop in drops.items()}, index=X.columns
+    )
+    return importances, std
@@ -1,31 +1,74 @@
+import os
+import sys
+import tempfile
+import threading
+import warnings
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
 from dataclasses import dataclass, field
 
+import numpy as np
 import pandas as pd
-from lightgbm import LGBMClassifier, plot_importance
-from matplotlib.figure import Figure
-from numpy.random import seed as default_rng
-from sklearn.linear_model import LogisticRegression
-from sklearn.metrics import accuracy_score, precision_score, recall_score, roc_auc_score
-from sklearn.model_selection import train_test_split
-from sklearn.pipeline import Pipeline
-from sklearn.preprocessing import OneHotEncoder
 
-from thriva.clean_data import load_clean_data
-from thriva.plots import plot_roc_curve
+from thriva.cache import array_fingerprint, frame_fingerprint
+from thriva.clean_data import CLEAN_DATA_PATH, CLEAN_DTYPES, load_clean_data
+from thriva.profiling import instrument, stage
 
-default_rng(25032023)
+# LightGBM, scikit-learn and the plots are imported by the functions that use
+# them, so importing this module only to prepare the data stays fast
 
+# Function of `sklearn.metrics` computing each metric
 classification_metrics = {
-    "accuracy": accuracy_score,
-    "auc": roc_auc_score,
-    "precision": precision_score,
-    "recall": recall_score,
+    "accuracy": "accuracy_score",
+    "auc": "roc_auc_score",
+    "precision": "precision_score",
+    "recall": "recall_score",
 }
 
+# Seed used by the task scripts, so their splits and models are reproducible
+RANDOM_STATE = 25032023
 
-def prepare_data(clean_na=False):
+TARGET_COLUMN = "Vitamin D Level"
+OPTIMAL_LEVEL = 75
+# Tests Completed Month is excluded from the features
+FEATURE_COLUMNS = [col for col in CLEAN_DTYPES if col != TARGET_COLUMN]
+
+# Warnings of a LightGBM validation Dataset as it takes the categorical columns
+# of the training Dataset it references
+OVERRIDE_WARNINGS = [
+    "Overriding the parameters from Reference Dataset",
+    "categorical_column in param dict is overridden",
+    "categorical_feature in Dataset is overridden",
+]
+
+# Binned Datasets kept by `fit_lgbm_cached`, the least recently used go first
+LGBM_CACHE_ENTRIES = 8
+# `set_lgbm_booster` writes the private attributes of this LightGBM version
+LGBM_BOOSTER_VERSION = 3
+
+
+@instrument
+def prepare_data(
+    clean_na=False, months=None, compact=False, random_state=None, path=CLEAN_DATA_PATH
+):
     """Prepare data for model training.
 
+    Parameters
+    ----------
+    clean_na : bool, optional
+        Drop the rows with missing values.
+    months : tuple, optional
+        Inclusive `(first, last)` range of `Tests Completed Month` to train
+        and test on. All months are used by default.
+    compact : bool, optional
+        Load the data with the compact schema of `compact_vitamin_d`.
+    random_state : int, optional
+        Seed of the train/test split. The split changes on every call by
+        default.
+    path : str, optional
+        Path to the cleaned CSV file.
+
     Returns
     -------
     X_train : pandas.DataFrame
@@ -41,16 +84,159 @@ def prepare_data(clean_na=False):
         Testing labels.
 
     """
-    vitamin_d = load_clean_data()
-    exclude_columns = ["Vitamin D Level", "Tests Completed Month"]
+    vitamin_d = load_clean_data(
+        path,
+        columns=[*FEATURE_COLUMNS, TARGET_COLUMN],
+        months=months,
+        compact=compact,
+    )
     if clean_na:
         vitamin_d = vitamin_d.dropna()
-    X = vitamin_d.drop(columns=exclude_columns, axis=1)
-    y = vitamin_d["Vitamin D Level"].lt(75)
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2)
+    X = vitamin_d[FEATURE_COLUMNS]
+    y = vitamin_d[TARGET_COLUMN].lt(OPTIMAL_LEVEL)
+    from sklearn.model_selection import train_test_split
+
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=0.2, random_state=random_state
+    )
     return X_train, X_test, y_train, y_test
 
 
+@dataclass
+class FeatureStore:
+    """Encode feature frames once and share the encodings between models.
+
+    `codes` turns a frame into the dense matrix LightGBM builds from a
+    DataFrame, with categorical columns as integer codes of the training
+    categories. `onehot` turns it into the sparse CSR matrix of a fitted
+    `OneHotEncoder`. Both are cached under the fingerprint of the frame, so
+    each encoding is computed once per dataset, whatever the number of models
+    or calls to fit, score and plot. Only the encodings of the training frame
+    and of the last other frame are kept, as the models are fitted once and
+    then scored on one test set at a time.
+    """
+
+    _key: str = field(default=None, init=False, repr=False)
+    _columns: list = field(default=None, init=False, repr=False)
+    _dtypes: dict = field(default=None, init=False, repr=False)
+    _encoders: dict = field(default_factory=dict, init=False, repr=False)
+    _cache: dict = field(default_factory=dict, init=False, repr=False)
+
+    def fit(self, X, key=None) -> "FeatureStore":
+        """Learn the columns and categories of the training frame `X`.
+
+        `key` is the fingerprint of `X`, computed when not given.
+        """
+        self._key = key or frame_fingerprint(X)
+        self._columns = list(X.columns)
+        self._dtypes = {
+            col: X[col].dtype for col in X.select_dtypes(include="category").columns
+        }
+        self._encoders.clear()
+        self._cache.clear()
+        return self
+
+    @property
+    def is_fitted(self) -> bool:
+        return self._columns is not None
+
+    @property
+    def columns(self) -> list:
+        """Columns of the training frame."""
+        return self._columns
+
+    @property
+    def categorical_feature(self) -> list:
+        """Positions of the columns LightGBM treats as categorical.
+
+        As with a DataFrame, ordered categories are treated as numeric codes.
+        """
+        return [
+            i
+            for i, col in enumerate(self._columns)
+            if col in self._dtypes and not self._dtypes[col].ordered
+        ]
+
+    @property
+    def pandas_categorical(self) -> list:
+        """Categories of each categorical column, in LightGBM's format."""
+        return [list(dtype.categories) for dtype in self._dtypes.values()]
+
+    def set_pandas_categorical(self, model):
+        """Give a LightGBM model fitted on `codes` the training categories.
+
+        Its booster then turns the categorical columns of a DataFrame into the
+        same codes, so the model predicts from DataFrames outside the store.
+        """
+        model.booster_.pandas_categorical = self.pandas_categorical
+
+    def _cached(self, key, kind, X, encode):
+        key = key or frame_fingerprint(X)
+        if (key, kind) not in self._cache:
+            if key != self._key:
+                # A new test set replaces the encodings of the previous one
+                self._cache = {
+                    cached: value
+                    for cached, value in self._cache.items()
+                    if cached[0] in (self._key, key)
+                }
+            self._cache[key, kind] = encode()
+        return self._cache[key, kind]
+
+    def codes(self, X, key=None) -> np.ndarray:
+        """Return `X` as a dense matrix with categorical codes, NaN if missing."""
+
+        def encode():
+            codes = X.copy()
+            for col, dtype in self._dtypes.items():
+                values = codes[col].cat.set_categories(dtype.categories).cat.codes
+                codes[col] = values.replace({-1: np.nan})
+            matrix = codes.to_numpy()
+            if matrix.dtype not in (np.float32, np.float64):
+                matrix = matrix.astype(np.float32)
+            return matrix
+
+        return self._cached(key, "codes", X, encode)
+
+    def encoder(self, template, X, key=None) -> "OneHotEncoder":
+        """Return a clone of the `OneHotEncoder` `template` fitted on `X`.
+
+        Encoders with the same parameters are fitted once per training frame.
+        """
+        from sklearn.base import clone
+
+        key = (key or frame_fingerprint(X), repr(sorted(template.get_params().items())))
+        if key not in self._encoders:
+            self._encoders[key] = clone(template).fit(X)
+        return self._encoders[key]
+
+    def onehot(self, encoder, X, key=None) -> "csr_matrix":
+        """Return the one-hot encoding of `X` by a fitted `encoder`.
+
+        The encoding is cached under the parameters and categories of the
+        encoder, so encoders fitted to the same categories share it and an
+        encoder refitted to other categories never gets a stale matrix.
+        """
+        return self._cached(
+            key,
+            ("onehot", encoder_fingerprint(encoder)),
+            X,
+            lambda: encoder.transform(X),
+        )
+
+
+def encoder_fingerprint(encoder) -> str:
+    """Return a hash of the parameters and fitted categories of an encoder."""
+    return array_fingerprint(
+        extra=repr(
+            (
+                sorted(encoder.get_params().items()),
+                [categories.tolist() for categories in encoder.categories_],
+            )
+        )
+    )
+
+
 @dataclass
 class ModelSelection:
     """Class for selecting the best model from a list of models.
@@ -59,15 +245,32 @@ class ModelSelection:
     ----------
     models : list, optional, default=[LinearRegression(), RandomForestRegressor(), lgb.LGBMRegressor()]
         List of models to be trained and evaluated.
+    n_jobs : int, optional, default=1
+        Number of models trained at the same time, in a thread pool. -1 uses
+        all cores. The cores are shared between the models, so models that use
+        all cores by default, such as LightGBM, get their share of threads.
+    feature_store : FeatureStore, optional
+        Encodings of the data shared by the models. One-hot pipelines are fed
+        its sparse one-hot matrix and LightGBM its categorical codes, so the
+        data is encoded once per dataset.
+    lgbm_cache_dir : str, optional
+        Directory where the binned LightGBM training Datasets are saved, so
+        later fits on the same data and features skip the binning. Disabled
+        by default.
+    random_state : int, optional
+        Seed given to the models, searches and folds, unless a model already
+        has its own. Fits are not reproducible by default.
 
     """
 
-    models: list = field(
-        default_factory=lambda: [
-            LGBMClassifier(),
-        ]
-    )
+    models: list = field(default_factory=lambda: default_models())
+    n_jobs: int = 1
+    feature_store: FeatureStore = field(default_factory=FeatureStore)
+    lgbm_cache_dir: str = None
+    random_state: int = None
+    _probabilities: dict = field(default_factory=dict, init=False, repr=False)
 
+    @instrument
     def fit(self, X, y) -> "ModelSelection":
         """Fit models to data and create a list of trained models, `trained_models`.
 
@@ -83,11 +286,206 @@ class ModelSelection:
         self : ModelSelection
             Trained models.
         """
+        run_fit_tasks(self.fit_tasks(X, y), self.n_jobs)
+        return self
+
+    def fit_tasks(self, X, y) -> list:
+        """Prepare the fit of every model on `X` and `y` without running it.
+
+        The models are seeded and `X` is encoded for each of them in this
+        thread, so fits run in parallel share the cached encodings.
+
+        Returns
+        -------
+        tasks : list
+            Fit of each model, to run with `run_fit_tasks`.
+        """
+        self._probabilities.clear()
         for model in self.models:
-            model.fit(X, y)
+            seed_model(model, self.random_state)
+        key = frame_fingerprint(X)
+        self.feature_store.fit(X, key)
+        return [
+            (self, model, *self._encode(model, X, key, fit=True), y)
+            for model in self.models
+        ]
+
+    def _encode(self, model, X, key, fit=False):
+        """Return the estimator to call for `model` and the encoded `X` it takes.
+
+        One-hot pipelines are split into the store's fitted encoder and the
+        remaining steps, which take the cached sparse matrix. LightGBM takes
+        the cached categorical codes. Other models take `X` unchanged.
+        """
+        store = self.feature_store
+        if is_onehot_pipeline(model):
+            if fit:
+                encoder = store.encoder(model.steps[0][1], X, key)
+                model.steps[0] = (model.steps[0][0], encoder)
+            return model[1:], store.onehot(model.steps[0][1], X, key)
+        if is_lgbm(model):
+            return model, store.codes(X, key)
+        return model, X
+
+    def _fit_model(self, model, estimator, features, y):
+        with stage(f"fit {type(model).__name__}", features):
+            return self._fit_estimator(model, estimator, features, y)
+
+    def _fit_estimator(self, model, estimator, features, y):
+        if is_lgbm(model):
+            store = self.feature_store
+            feature_name = [str(col) for col in store.columns]
+            if self.lgbm_cache_dir is None:
+                model.fit(
+                    features,
+                    y,
+                    feature_name=feature_name,
+                    categorical_feature=store.categorical_feature,
+                )
+            else:
+                fit_lgbm_cached(
+                    model,
+                    features,
+                    y,
+                    feature_name,
+                    store.categorical_feature,
+                    self.lgbm_cache_dir,
+                )
+            store.set_pandas_categorical(model)
+        else:
+            estimator.fit(features, y)
+        return model
+
+    @instrument
+    def update(self, X_new, y_new, boosting_rounds=10) -> "ModelSelection":
+        """Update the fitted models with a new batch of data.
+
+        Instead of training again on all the data, LightGBM models continue
+        boosting from their current trees and logistic regressions start from
+        their current coefficients, so an update only reads `X_new`, never the
+        data of `fit` again. The features are encoded with the categories learnt by `fit`,
+        and categories first seen in `X_new` are treated as missing. Models
+        that cannot be updated are left unchanged.
+
+        Parameters
+        ----------
+        X_new : pandas.DataFrame
+            New training data.
+        y_new : pandas.Series
+            New training target.
+        boosting_rounds : int, optional, default=10
+            Number of trees added to each LightGBM model.
+        """
+        store = self.feature_store
+        key = frame_fingerprint(X_new) if store.is_fitted else None
+        for model in self.models:
+            if store.is_fitted:
+                estimator, features = self._encode(model, X_new, key)
+            elif is_onehot_pipeline(model):
+                estimator, features = model[1:], model[0].transform(X_new)
+            else:
+                estimator, features = model, X_new
+            if is_lgbm(model):
+                update_lgbm(model, features, y_new, boosting_rounds, store)
+            elif _is_instance(
+                final_estimator(estimator), "sklearn.linear_model", "LogisticRegression"
+            ):
+                warm_start(estimator, features, y_new)
+        self._probabilities.clear()
         return self
 
-    def score(self, X_test, y_true) -> pd.DataFrame:
+    @instrument
+    def fit_out_of_core(self, data=None, work_dir=None) -> "ModelSelection":
+        """Fit the LightGBM models on the cleaned data without loading it whole.
+
+        The training rows of `data` are streamed in chunks, encoded and
+        appended to a temporary binary file. Each model then builds its binned
+        LightGBM Dataset from the file in batches of rows, so peak memory is
+        set by the chunk size and LightGBM's own training state, about 50
+        bytes per training row, instead of the whole DataFrame. The models are
+        fitted one after the other, each with all its threads, and can then
+        predict from DataFrames like those of `prepare_data`.
+
+        Parameters
+        ----------
+        data : StreamedData, optional
+            Data to stream and its split. By default, the cleaned data split
+            80/20 by row hash, seeded with `random_state`.
+        work_dir : str, optional
+            Directory where the temporary training file is written. The
+            system temporary directory by default.
+
+        Returns
+        -------
+        self : ModelSelection
+            Trained models.
+        """
+        from thriva.out_of_core import StreamedData, fit_lgbm_streamed
+
+        if data is None:
+            data = StreamedData(random_state=self.random_state)
+        others = [type(model).__name__ for model in self.models if not is_lgbm(model)]
+        if others:
+            raise ValueError(
+                f"Only LGBMClassifier models can be fitted out of core, not {others}"
+            )
+        self._probabilities.clear()
+        for model in self.models:
+            seed_model(model, self.random_state)
+        store = self.feature_store.fit(data.template())
+        feature_name = [str(col) for col in store.columns]
+        with tempfile.TemporaryDirectory(dir=work_dir) as tmp_dir:
+            train_path = os.path.join(tmp_dir, "train.f32")
+            y = data.write_train(train_path)
+            for model in self.models:
+                with stage(f"fit {type(model).__name__}"):
+                    fit_lgbm_streamed(
+                        model, train_path, y, feature_name, store.categorical_feature
+                    )
+                store.set_pandas_categorical(model)
+        self.streamed_data_ = data
+        return self
+
+    @instrument
+    def score_out_of_core(self, data=None) -> pd.DataFrame:
+        """Score the models on the test rows of streamed data, chunk by chunk.
+
+        Only the predicted probabilities and labels of the test rows are kept
+        in memory, to compute the metrics.
+
+        Parameters
+        ----------
+        data : StreamedData, optional
+            Data to stream and its split. The data of the last
+            `fit_out_of_core` by default.
+
+        Returns
+        -------
+        results_ : pd.DataFrame
+            Classification report for each model.
+        """
+        if data is None:
+            data = self.streamed_data_
+        scores = [[] for _ in self.models]
+        labels = []
+        for features, y in data.chunks("test"):
+            labels.append(y)
+            for model, model_scores in zip(self.models, scores):
+                model_scores.append(model.predict_proba(features)[:, 1])
+        y_true = np.concatenate(labels)
+        report = {}
+        for name, model, model_scores in zip(
+            model_names(self.models), self.models, scores
+        ):
+            positive = np.concatenate(model_scores)
+            proba = np.column_stack([1 - positive, positive])
+            report[name] = classification_report(model, proba, y_true)
+        results = pd.DataFrame(report, index=list(classification_metrics))
+        self.results_ = results.round(3)
+        return self.results_
+
+    @instrument
+    def score(self, X_test, y_true, n_bootstrap=0, confidence=0.95) -> pd.DataFrame:
         """Score the model on the test data.
 
         Parameters
@@ -96,45 +494,780 @@ class ModelSelection:
             Testing data.
         y_true : pandas.DataFrame
             Testing labels.
+        n_bootstrap : int, optional, default=0
+            Number of bootstrap resamples of the test set. When positive, the
+            percentile intervals of the metrics are stored in `intervals_` and
+            the differences between each pair of models, with their intervals
+            on the same resamples, in `differences_`.
+        confidence : float, optional, default=0.95
+            Confidence level of the intervals.
 
         Returns
         -------
         results_ : pd.DataFrame
             Classification report for each model.
         """
-        self.results_ = pd.DataFrame()
-        for model in self.models:
-            model_name = model.__class__.__name__
-            report = {}
-            for metric_name, metric in classification_metrics.items():
-                if metric_name == "auc":
-                    report[metric_name] = metric(
-                        y_true, model.predict_proba(X_test)[:, 1]
+        probabilities = self.predict_proba(X_test)
+        report = {
+            name: classification_report(model, proba, y_true)
+            for name, model, proba in zip(
+                model_names(self.models), self.models, probabilities
+            )
+        }
+        results = pd.DataFrame(report, index=list(classification_metrics))
+        self.results_ = results.round(3)
+        if n_bootstrap:
+            self._bootstrap(probabilities, y_true, results, n_bootstrap, confidence)
+        return self.results_
+
+    def _bootstrap(self, probabilities, y_true, results, n_bootstrap, confidence):
+        from thriva.bootstrap import bootstrap_metrics, percentile_interval
+
+        predictions = {
+            name: (model.classes_[proba.argmax(axis=1)], proba[:, 1])
+            for name, model, proba in zip(
+                model_names(self.models), self.models, probabilities
+            )
+        }
+        replicates = bootstrap_metrics(
+            y_true, predictions, n_bootstrap, random_state=self.random_state
+        )
+        bounds = ["low", "high"]
+        self.intervals_ = pd.DataFrame(
+            {
+                name: {
+                    (metric, bound): value
+                    for metric in classification_metrics
+                    for bound, value in zip(
+                        bounds, percentile_interval(metrics[metric], confidence)
+                    )
+                }
+                for name, metrics in replicates.items()
+            }
+        ).round(3)
+        differences = {}
+        names = list(replicates)
+        for i, first in enumerate(names):
+            for second in names[i + 1 :]:
+                column = {}
+                for metric in classification_metrics:
+                    column[(metric, "difference")] = (
+                        results.loc[metric, first] - results.loc[metric, second]
                     )
+                    interval = percentile_interval(
+                        replicates[first][metric] - replicates[second][metric],
+                        confidence,
+                    )
+                    column.update(zip([(metric, bound) for bound in bounds], interval))
+                differences[f"{first} - {second}"] = column
+        self.differences_ = pd.DataFrame(differences).round(3)
+
+    @instrument
+    def predict_proba(self, X_test) -> list:
+        """Predict the class probabilities of every model on `X_test`.
+
+        The probabilities of the last test set are cached under a fingerprint
+        of `X_test`, so `score` and `roc_plot` share them. Only one test set is
+        kept, so the cache does not grow with the number of test sets scored,
+        and it is cleared when the models are fitted again.
+
+        Parameters
+        ----------
+        X_test : pandas.DataFrame
+            Testing data.
+
+        Returns
+        -------
+        probabilities : list of numpy.ndarray
+            Class probabilities of each model, in the order of `models`.
+        """
+        key = frame_fingerprint(X_test)
+        if key not in self._probabilities:
+            probabilities = []
+            for model in self.models:
+                if self.feature_store.is_fitted:
+                    estimator, features = self._encode(model, X_test, key)
+                    probabilities.append(estimator.predict_proba(features))
                 else:
-                    report[metric_name] = metric(y_true, model.predict(X_test))
-            report = pd.DataFrame(report, index=[model_name], columns=report.keys())
-            self.results_ = pd.concat([self.results_, report])
-        self.results_ = self.results_.T.round(3)
-        return self.results_
+                    probabilities.append(model.predict_proba(X_test))
+            self._probabilities = {key: probabilities}
+        return self._probabilities[key]
+
+    @instrument
+    def tune(
+        self,
+        X,
+        y,
+        param_spaces,
+        factor=3,
+        cv=3,
+        n_candidates="exhaust",
+        min_samples=1000,
+        min_boosting_rounds=20,
+        max_boosting_rounds=1000,
+        early_stopping_rounds=20,
+        validation_size=0.1,
+        scoring="roc_auc",
+    ) -> pd.DataFrame:
+        """Tune every model with successive halving and keep the best version.
+
+        Each model is searched with `HalvingRandomSearchCV`: many candidates
+        are scored on a small budget and only the best `1 / factor` of them
+        go on to the next round with `factor` times more budget. LightGBM's
+        budget is its number of boosting rounds, with early stopping on a
+        held-out validation fold. The other models' budget is the number of
+        training rows. Candidates run in parallel on `n_jobs` processes.
+        LightGBM candidates are fitted on the categorical codes of the feature
+        store, as `fit` fits them.
+
+        Parameters
+        ----------
+        X : pandas.DataFrame
+            Training data.
+        y : pandas.Series
+            Training labels.
+        param_spaces : list
+            Parameter distributions of each model, in the order of `models`,
+            as accepted by `HalvingRandomSearchCV`. Models with None are
+            fitted with their current parameters.
+        factor : int, optional
+            Proportion of candidates kept, and budget growth, at each round.
+        cv : int, optional
+            Number of cross-validation folds scoring each candidate.
+        n_candidates : int or "exhaust", optional
+            Number of candidates sampled for the first round.
+        min_samples : int, optional
+            Training rows given to the non-LightGBM candidates of the first
+            round.
+        min_boosting_rounds : int, optional
+            Boosting rounds given to the LightGBM candidates of the first round.
+        max_boosting_rounds : int, optional
+            Boosting rounds given to the LightGBM candidates of the last round.
+        early_stopping_rounds : int, optional
+            Rounds without improvement on the validation fold before LightGBM
+            stops.
+        validation_size : float, optional
+            Share of `X` held out for LightGBM's early stopping.
+        scoring : str, optional
+            Metric the candidates are ranked by.
+
+        Returns
+        -------
+        search_results_ : pd.DataFrame
+            Best parameters, best score and number of candidates per model.
+        """
+        import lightgbm
+        from joblib import cpu_count, effective_n_jobs
+        from sklearn.base import clone
+        from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+        from sklearn.model_selection import HalvingRandomSearchCV, train_test_split
+
+        n_workers = effective_n_jobs(self.n_jobs)
+        n_threads = max(1, cpu_count() // n_workers)
+        X_fit, X_val, y_fit, y_val = train_test_split(
+            X, y, test_size=validation_size, stratify=y, random_state=self.random_state
+        )
+        store = self.feature_store.fit(X)
+        key = frame_fingerprint(X)
+        self.searches_ = {}
+        results = {}
+        names = model_names(self.models)
+        for i, (model, param_space) in enumerate(zip(self.models, param_spaces)):
+            seed_model(model, self.random_state)
+            if param_space is None:
+                self._fit_estimator(model, *self._encode(model, X, key, fit=True), y)
+                continue
+            model_name = names[i]
+            search_params = dict(
+                factor=factor,
+                cv=cv,
+                n_candidates=n_candidates,
+                scoring=scoring,
+                n_jobs=self.n_jobs,
+                random_state=self.random_state,
+            )
+            if is_lgbm(model):
+                search = HalvingRandomSearchCV(
+                    limit_threads(clone(model), n_threads),
+                    param_space,
+                    resource="n_estimators",
+                    min_resources=min_boosting_rounds,
+                    max_resources=max_boosting_rounds,
+                    **search_params,
+                )
+                with warnings.catch_warnings():
+                    # `categorical_feature` only reaches the training Dataset,
+                    # and each candidate's validation Dataset warns as it takes
+                    # the categorical columns from it, which is what it needs
+                    for message in OVERRIDE_WARNINGS:
+                        warnings.filterwarnings("ignore", message=message)
+                    search.fit(
+                        store.codes(X_fit),
+                        y_fit,
+                        eval_set=[(store.codes(X_val), y_val)],
+                        feature_name=[str(col) for col in store.columns],
+                        categorical_feature=store.categorical_feature,
+                        callbacks=[
+                            lightgbm.early_stopping(
+                                early_stopping_rounds, verbose=False
+                            )
+                        ],
+                    )
+                store.set_pandas_categorical(search.best_estimator_)
+            else:
+                search = HalvingRandomSearchCV(
+                    limit_threads(clone(model), n_threads),
+                    param_space,
+                    min_resources=min(min_samples, len(X)),
+                    **search_params,
+                )
+                search.fit(X, y)
+            self.models[i] = search.best_estimator_
+            self.searches_[model_name] = search
+            results[model_name] = {
+                "best_params": search.best_params_,
+                f"best_{scoring}": search.best_score_,
+                "n_candidates": search.n_candidates_[0],
+                "n_iterations": search.n_iterations_,
+            }
+        self._probabilities.clear()
+        self.search_results_ = pd.DataFrame(results)
+        return self.search_results_
+
+    def iter_cross_validate(self, X, y, cv=5):
+        """Cross-validate every model, yielding each fold's metrics as it finishes.
+
+        Every (model, fold) pair is trained on a clone of the model, in a
+        thread pool of `n_jobs` workers. Stopping the iteration cancels the
+        pairs that have not started yet.
+
+        Parameters
+        ----------
+        X : pandas.DataFrame
+            Data.
+        y : pandas.Series
+            Labels.
+        cv : int, optional
+            Number of stratified folds.
+
+        Yields
+        ------
+        model_name : str
+            Name of the model.
+        fold : int
+            Index of the fold.
+        report : dict
+            Value of each metric in `classification_metrics` on the fold.
+        """
+        from joblib import cpu_count, effective_n_jobs
+        from sklearn.base import clone
+        from sklearn.model_selection import StratifiedKFold
+
+        splitter = StratifiedKFold(
+            n_splits=cv, shuffle=True, random_state=self.random_state
+        )
+        folds = list(splitter.split(X, y))
+        tasks = [
+            (name, model, fold)
+            for name, model in zip(model_names(self.models), self.models)
+            for fold in range(cv)
+        ]
+        n_workers = min(effective_n_jobs(self.n_jobs), len(tasks))
+        n_threads = max(1, cpu_count() // n_workers)
+
+        def fit_and_score(model, fold):
+            train, test = folds[fold]
+            model = seed_model(
+                limit_threads(clone(model), n_threads), self.random_state
+            )
+            model.fit(X.iloc[train], y.iloc[train])
+            proba = model.predict_proba(X.iloc[test])
+            return classification_report(model, proba, y.iloc[test])
+
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            futures = {
+                executor.submit(fit_and_score, model, fold): (name, fold)
+                for name, model, fold in tasks
+            }
+            try:
+                for future in as_completed(futures):
+                    model_name, fold = futures[future]
+                    yield model_name, fold, future.result()
+            finally:
+                for future in futures:
+                    future.cancel()
+
+    @instrument
+    def cross_validate(self, X, y, cv=5) -> pd.DataFrame:
+        """Cross-validate every model and summarise the metrics of the folds.
+
+        Parameters
+        ----------
+        X : pandas.DataFrame
+            Data.
+        y : pandas.Series
+            Labels.
+        cv : int, optional
+            Number of stratified folds.
+
+        Returns
+        -------
+        cv_results_ : pd.DataFrame
+            Metrics for each model, in the layout of `results_`, indexed by
+            `("mean", metric)`, `("std", metric)` and `("fold i", metric)`.
+        """
+        reports = {f"fold {fold}": {} for fold in range(cv)}
+        for model_name, fold, report in self.iter_cross_validate(X, y, cv=cv):
+            reports[f"fold {fold}"][model_name] = report
+        names = model_names(self.models)
+        per_fold = {
+            fold: pd.DataFrame(report, index=list(classification_metrics))[names]
+            for fold, report in reports.items()
+        }
+        stacked = pd.concat(per_fold.values(), keys=per_fold.keys())
+        summary = {
+            "mean": stacked.groupby(level=1, sort=False).mean(),
+            "std": stacked.groupby(level=1, sort=False).std(),
+            **per_fold,
+        }
+        self.cv_results_ = pd.concat(summary.values(), keys=summary.keys()).round(3)
+        return self.cv_results_
+
+    @instrument
+    def permutation_importance(
+        self, X_test, y_test, n_repeats=5, scoring="auc", n_jobs=None
+    ) -> pd.DataFrame:
+        """Drop in score of every model when each feature is permuted.
 
-    def importance_plot(self) -> Figure:
-        """Plot the importance of each feature in the model."""
+        Works for any model. All the permutations of a model go through
+        `predict_proba` in large batches, in `n_jobs` worker processes.
+
+        Parameters
+        ----------
+        X_test : pandas.DataFrame
+            Testing data.
+        y_test : pandas.Series
+            Testing labels.
+        n_repeats : int, optional, default=5
+            Number of permutations of each feature.
+        scoring : str, optional, default="auc"
+            Metric of `classification_metrics`.
+        n_jobs : int, optional
+            Number of worker processes. Defaults to the `n_jobs` of the
+            selection.
+
+        Returns
+        -------
+        permutation_importances_ : pd.DataFrame
+            Mean drop in score, with the features as index and the models as
+            columns. Its standard deviation over the repeats is stored in
+            `permutation_importances_std_`.
+        """
+        from thriva.importance import metric_scores, permutation_importance
+
+        baselines = [
+            metric_scores(model, proba[None], y_test, scoring)[0]
+            for model, proba in zip(self.models, self.predict_proba(X_test))
+        ]
+        (
+            self.permutation_importances_,
+            self.permutation_importances_std_,
+        ) = permutation_importance(
+            self.models,
+            X_test,
+            y_test,
+            baselines,
+            n_repeats=n_repeats,
+            scoring=scoring,
+            n_jobs=self.n_jobs if n_jobs is None else n_jobs,
+            random_state=self.random_state,
+        )
+        return self.permutation_importances_
+
+    @instrument
+    def importance_plot(self, X_test=None, y_test=None, **kwargs) -> dict:
+        """Plot the importance of each feature in the model.
+
+        By default, the split counts of the LightGBM models are plotted. With
+        `X_test` and `y_test`, the permutation importances of every model are
+        plotted together, under the key `"permutation"`, and `kwargs` are
+        passed to `permutation_importance`.
+        """
         self.importance_plots_ = {}
-        for model in self.models:
-            model_name = model.__class__.__name__
-            if model_name == "LGBMClassifier":
-                self.importance_plots_[model_name] = plot_importance(model)
+        if X_test is not None:
+            from thriva.plots import plot_permutation_importance
+
+            self.permutation_importance(X_test, y_test, **kwargs)
+            self.importance_plots_["permutation"] = plot_permutation_importance(
+                self.permutation_importances_, self.permutation_importances_std_
+            )
+            return self.importance_plots_
+        from lightgbm import plot_importance
+
+        for name, model in zip(model_names(self.models), self.models):
+            if is_lgbm(model):
+                self.importance_plots_[name] = plot_importance(model)
         return self.importance_plots_
 
-    def roc_plot(self, X_test, y_test) -> Figure:
+    @instrument
+    def roc_plot(self, X_test, y_test) -> "Figure":
         """Plot the ROC curve for each model."""
+        from thriva.plots import plot_roc_curve
+
         self.roc_plot_ = plot_roc_curve(self, X_test, y_test)
         return self.roc_plot_
 
 
+def run_fit_tasks(tasks, n_jobs=1):
+    """Run the fits prepared by `ModelSelection.fit_tasks`, in `n_jobs` threads.
+
+    The tasks can come from several `ModelSelection`, to fit them together.
+    The cores are shared between the fits, so models that use all cores by
+    default, such as LightGBM, get their share of threads.
+    """
+    if n_jobs == 1:
+        for selection, *arguments in tasks:
+            selection._fit_model(*arguments)
+        return
+    from joblib import Parallel, cpu_count, delayed, effective_n_jobs
+
+    n_workers = min(effective_n_jobs(n_jobs), len(tasks))
+    n_threads = max(1, cpu_count() // n_workers)
+    with limited_threads([model for _, model, *_ in tasks], n_threads):
+        Parallel(n_jobs=n_workers, prefer="threads")(
+            delayed(selection._fit_model)(*arguments) for selection, *arguments in tasks
+        )
+
+
+def model_names(models) -> list:
+    """Return the name of each model in the reports and plots.
+
+    Models are named after their class, numbered as `"LGBMClassifier-1"`,
+    `"LGBMClassifier-2"`, ... when several of them share it, so each model gets
+    its own column.
+    """
+    counts = Counter(model.__class__.__name__ for model in models)
+    seen = Counter()
+    names = []
+    for model in models:
+        name = model.__class__.__name__
+        if counts[name] > 1:
+            seen[name] += 1
+            name = f"{name}-{seen[name]}"
+        names.append(name)
+    return names
+
+
+def classification_report(model, proba, y_true) -> dict:
+    """Compute every metric in `classification_metrics` from class probabilities.
+
+    The hard labels are taken as `model.classes_[proba.argmax(axis=1)]`, which
+    is what `predict` returns for the classifiers used here.
+    """
+    from sklearn import metrics
+
+    y_pred = model.classes_[proba.argmax(axis=1)]
+    return {
+        metric_name: getattr(metrics, function_name)(
+            y_true, proba[:, 1] if metric_name == "auc" else y_pred
+        )
+        for metric_name, function_name in classification_metrics.items()
+    }
+
+
+def lgbm_train_params(model) -> dict:
+    """Return the `lightgbm.train` parameters `LGBMClassifier.fit` would use."""
+    params = model.get_params()
+    for name in ["silent", "importance_type", "n_estimators", "class_weight"]:
+        params.pop(name)
+    if isinstance(params["random_state"], np.random.RandomState):
+        params["random_state"] = params["random_state"].randint(np.iinfo(np.int32).max)
+    if "verbose" not in params and "verbosity" not in params:
+        params["verbose"] = -1
+    params["objective"] = params["objective"] or "binary"
+    params.setdefault("metric", "binary_logloss")
+    return params
+
+
+def fit_lgbm_cached(
+    model,
+    features,
+    y,
+    feature_name,
+    categorical_feature,
+    cache_dir,
+    max_entries=LGBM_CACHE_ENTRIES,
+):
+    """Fit an `LGBMClassifier` on a binned Dataset cached in `cache_dir`.
+
+    The Dataset is saved in LightGBM's binary format under a fingerprint of
+    the features, labels, feature names, categorical features, Dataset
+    parameters and LightGBM version, so it is rebuilt whenever any of them
+    changes. The fitted model behaves as if `model.fit` had been called.
+    Custom objectives, class weights and multiclass labels fall back to
+    `model.fit`, as does a LightGBM version `set_lgbm_booster` does not
+    support. Only the `max_entries` most recently used Datasets are kept.
+    """
+    import lightgbm
+    from sklearn.preprocessing import LabelEncoder
+
+    classes = np.unique(y)
+    supported = is_lgbm_booster_supported()
+    if not supported:
+        warnings.warn(
+            f"LightGBM {lightgbm.__version__} is not supported by the Dataset "
+            "cache, fitting without it"
+        )
+    if (
+        not supported
+        or callable(model.objective)
+        or model.class_weight is not None
+        or len(classes) > 2
+    ):
+        return model.fit(
+            features,
+            y,
+            feature_name=feature_name,
+            categorical_feature=categorical_feature,
+        )
+    label_encoder = LabelEncoder().fit(y)
+    label = label_encoder.transform(y)
+    params = lgbm_train_params(model)
+    dataset_params = {k: v for k, v in params.items() if k != "n_jobs"}
+    key = array_fingerprint(
+        features,
+        label,
+        extra=repr(
+            (
+                feature_name,
+                categorical_feature,
+                sorted(dataset_params.items()),
+                lightgbm.__version__,
+            )
+        ),
+    )
+    path = os.path.join(cache_dir, f"{key}.bin")
+    if os.path.exists(path):
+        os.utime(path)
+        train_set = lightgbm.Dataset(path, params=params)
+    else:
+        os.makedirs(cache_dir, exist_ok=True)
+        train_set = lightgbm.Dataset(
+            features,
+            label=label,
+            feature_name=feature_name,
+            categorical_feature=categorical_feature,
+            params=params,
+        )
+        # Write to a private file first, so concurrent fits never read half a file
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        train_set.save_binary(tmp_path)
+        os.replace(tmp_path, path)
+        prune_lgbm_cache(cache_dir, max_entries)
+    booster = lightgbm.train(
+        params,
+        train_set,
+        num_boost_round=model.n_estimators,
+        feature_name=train_set.feature_name,
+        categorical_feature=train_set.categorical_feature,
+    )
+    booster.free_dataset()
+    return set_lgbm_booster(model, booster, label_encoder, params, features.shape[1])
+
+
+def prune_lgbm_cache(cache_dir, max_entries):
+    """Delete all but the `max_entries` most recently used Datasets of a cache."""
+    paths = [
+        os.path.join(cache_dir, name)
+        for name in os.listdir(cache_dir)
+        if name.endswith(".bin")
+    ]
+    paths.sort(key=os.path.getmtime, reverse=True)
+    for path in paths[max_entries:]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            # Already pruned by a concurrent fit
+            pass
+
+
+def is_lgbm_booster_supported() -> bool:
+    """Whether `set_lgbm_booster` supports the installed LightGBM version."""
+    import lightgbm
+
+    return int(lightgbm.__version__.split(".")[0]) == LGBM_BOOSTER_VERSION
+
+
+def set_lgbm_booster(model, booster, label_encoder, params, n_features):
+    """Give an `LGBMClassifier` a booster trained with `lightgbm.train`.
+
+    The model is left in the fitted state `LGBMClassifier.fit` leaves behind
+    (LightGBM 3.3), for labels encoded by `label_encoder` and `params` from
+    `lgbm_train_params`. Other LightGBM versions name the fitted attributes
+    differently and raise a RuntimeError.
+    """
+    if not is_lgbm_booster_supported():
+        import lightgbm
+
+        raise RuntimeError(
+            f"LightGBM {lightgbm.__version__} is not supported, "
+            f"only LightGBM {LGBM_BOOSTER_VERSION}.x"
+        )
+    classes = label_encoder.classes_
+    model._le = label_encoder
+    model._class_map = dict(zip(classes, label_encoder.transform(classes)))
+    model._classes = classes
+    model._n_classes = len(classes)
+    model._objective = params["objective"]
+    model._fobj = None
+    model._n_features = model._n_features_in = n_features
+    model._Booster = booster
+    model._evals_result = None
+    model._best_iteration = booster.best_iteration or None
+    model._best_score = booster.best_score
+    model.fitted_ = True
+    return model
+
+
+def update_lgbm(model, features, y, boosting_rounds, feature_store=None):
+    """Add `boosting_rounds` trees to a fitted `LGBMClassifier`, fitted on `y`.
+
+    `features` are encoded by `feature_store` when it is fitted.
+    """
+    n_estimators = model.n_estimators
+    fit_params = {"init_model": model.booster_}
+    if feature_store is not None and feature_store.is_fitted:
+        fit_params["feature_name"] = [str(col) for col in feature_store.columns]
+        fit_params["categorical_feature"] = feature_store.categorical_feature
+    pandas_categorical = model.booster_.pandas_categorical
+    model.set_params(n_estimators=boosting_rounds)
+    try:
+        model.fit(features, y, **fit_params)
+    finally:
+        model.set_params(n_estimators=n_estimators)
+    model.booster_.pandas_categorical = pandas_categorical
+    return model
+
+
+def final_estimator(estimator):
+    """Return the last step of a pipeline, or `estimator` itself."""
+    if _is_instance(estimator, "sklearn.pipeline", "Pipeline"):
+        return estimator[-1]
+    return estimator
+
+
+def warm_start(estimator, features, y):
+    """Fit `estimator` on `y`, starting from its current solution.
+
+    The final step of a pipeline is warm started.
+    """
+    final = final_estimator(estimator)
+    previous = final.warm_start
+    final.set_params(warm_start=True)
+    try:
+        estimator.fit(features, y)
+    finally:
+        final.set_params(warm_start=previous)
+    return estimator
+
+
+def is_onehot_pipeline(model) -> bool:
+    """Whether `model` is a pipeline starting with a `OneHotEncoder`."""
+    return _is_instance(model, "sklearn.pipeline", "Pipeline") and _is_instance(
+        model.steps[0][1], "sklearn.preprocessing", "OneHotEncoder"
+    )
+
+
+def is_lgbm(model) -> bool:
+    """Whether `model` is an `LGBMClassifier`."""
+    return _is_instance(model, "lightgbm", "LGBMClassifier")
+
+
+def _is_instance(obj, module, name):
+    """`isinstance(obj, module.name)`, without importing `module` to check it.
+
+    An object can only be an instance of a class that was already imported.
+    """
+    cls = getattr(sys.modules.get(module), name, None)
+    return cls is not None and isinstance(obj, cls)
+
+
+def limit_threads(model, n_threads):
+    """Cap the threads of a model, or of the steps of a pipeline, at `n_threads`.
+
+    Only `n_jobs` parameters asking for all cores (negative values) are
+    changed, so explicit settings are kept.
+    """
+    params = {
+        key: n_threads
+        for key, value in model.get_params().items()
+        if (key == "n_jobs" or key.endswith("__n_jobs"))
+        and value is not None
+        and value < 0
+    }
+    if params:
+        model.set_params(**params)
+    return model
+
+
+@contextmanager
+def limited_threads(models, n_threads):
+    """Cap the threads of `models` with `limit_threads` inside the block.
+
+    The `n_jobs` parameters of the models are restored on exit, so the cap
+    never outlives the block. Nothing changes if `n_threads` is None.
+    """
+    if n_threads is None:
+        yield models
+        return
+    saved = [
+        {
+            key: value
+            for key, value in model.get_params().items()
+            if key == "n_jobs" or key.endswith("__n_jobs")
+        }
+        for model in models
+    ]
+    for model in models:
+        limit_threads(model, n_threads)
+    try:
+        yield models
+    finally:
+        for model, params in zip(models, saved):
+            model.set_params(**params)
+
+
+def seed_model(model, random_state):
+    """Set the unset `random_state` parameters of a model, or of its steps.
+
+    Seeds chosen for a model are kept. Nothing changes if `random_state` is
+    None.
+    """
+    if random_state is None:
+        return model
+    params = {
+        key: random_state
+        for key, value in model.get_params().items()
+        if (key == "random_state" or key.endswith("__random_state")) and value is None
+    }
+    if params:
+        model.set_params(**params)
+    return model
+
+
+def default_models():
+    """Return the models fitted by `ModelSelection` by default."""
+    from lightgbm import LGBMClassifier
+
+    return [LGBMClassifier()]
+
+
 def encoded_logistic_regression():
     """Return a LogisticRegression model with OneHotEncoder."""
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import OneHotEncoder
+
     pipeline = Pipeline(
         [
             ("onehot", OneHotEncoder(handle_unknown="ignore")),
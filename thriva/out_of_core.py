@@ -0,0 +1,318 @@
+import os
+from dataclasses import dataclass, field
+
+# Imported at the top, unlike in the other modules, because `MatrixFile`
+# subclasses `lightgbm.Sequence`. Only the out-of-core fit imports this module.
+import lightgbm
+import numpy as np
+import pandas as pd
+
+from thriva.cache import (
+    cache_dir_for,
+    is_cache_valid,
+    iter_column_cache,
+    read_column_cache,
+)
+from thriva.clean_data import (
+    CLEAN_DATA_PATH,
+    CLEAN_DATE_COLS,
+    CLEAN_DTYPES,
+    months_mask,
+    scan_categories,
+)
+from thriva.model import (
+    FEATURE_COLUMNS,
+    LGBM_BOOSTER_VERSION,
+    OPTIMAL_LEVEL,
+    TARGET_COLUMN,
+    is_lgbm_booster_supported,
+    lgbm_train_params,
+    set_lgbm_booster,
+)
+from thriva.profiling import instrument
+
+# The test share of a hashed split is rounded to a multiple of 1 / SPLIT_BUCKETS
+SPLIT_BUCKETS = 1_000_000
+# Number of rows LightGBM reads from a `MatrixFile` at a time
+BATCH_ROWS = 100_000
+
+
+def hashed_test_mask(positions, test_size=0.2, random_state=None) -> np.ndarray:
+    """Whether each row falls in the test set of a split by hashed row position.
+
+    A row is assigned by a hash of its position in the file and of
+    `random_state` alone. The split is the same on every pass over the file,
+    whatever the chunk size, and rows appended to the file later never move
+    the rows already there.
+
+    Parameters
+    ----------
+    positions : array-like
+        Positions of the rows in the file.
+    test_size : float, optional, default=0.2
+        Share of the rows in the test set.
+    random_state : int, optional
+        Seed of the split. The split is deterministic even without a seed.
+
+    Returns
+    -------
+    mask : numpy.ndarray
+        True for the test rows.
+    """
+    salt = pd.util.hash_array(np.array([random_state or 0], dtype=np.uint64))[0]
+    keys = np.asarray(positions, dtype=np.uint64) ^ salt
+    buckets = pd.util.hash_array(keys) % np.uint64(SPLIT_BUCKETS)
+    return buckets < round(test_size * SPLIT_BUCKETS)
+
+
+class MatrixFile(lightgbm.Sequence):
+    """Float32 matrix stored row after row in a binary file, read on demand.
+
+    LightGBM samples rows to find the bins, then reads the file in batches of
+    `batch_size` rows to build its binned Dataset, so the matrix is never
+    loaded whole.
+
+    Parameters
+    ----------
+    path : str
+        Path to the binary file.
+    n_cols : int
+        Number of columns of the matrix.
+    batch_size : int, optional
+        Number of rows read at a time.
+    """
+
+    def __init__(self, path, n_cols, batch_size=BATCH_ROWS):
+        self.path = path
+        self.n_cols = n_cols
+        self.batch_size = batch_size
+        self._row_bytes = n_cols * np.dtype(np.float32).itemsize
+        self._n_rows = os.path.getsize(path) // self._row_bytes
+        self._file = open(path, "rb")
+
+    def __len__(self):
+        return self._n_rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._file.close()
+
+    def _read(self, start, n_rows) -> np.ndarray:
+        self._file.seek(start * self._row_bytes)
+        buffer = self._file.read(n_rows * self._row_bytes)
+        return np.frombuffer(buffer, dtype=np.float32).reshape(-1, self.n_cols)
+
+    def __getitem__(self, idx) -> np.ndarray:
+        if isinstance(idx, slice):
+            start, stop, step = idx.indices(self._n_rows)
+            return self._read(start, max(stop - start, 0))[::step]
+        if isinstance(idx, (list, np.ndarray)):
+            return np.stack([self[i] for i in idx])
+        if idx < 0:
+            idx += self._n_rows
+        if not 0 <= idx < self._n_rows:
+            raise IndexError(f"Row {idx} out of range for {self._n_rows} rows")
+        # LightGBM bins its sample of single rows as float64
+        return self._read(idx, 1)[0].astype(np.float64)
+
+
+@dataclass
+class StreamedData:
+    """Cleaned data read in chunks and encoded for LightGBM, split by row hash.
+
+    Chunks come from the columnar cache of the cleaned file when it is up to
+    date, and from the CSV file otherwise. The features and label are those
+    of `prepare_data`, with categorical columns as codes of categories fixed
+    for the whole file, sorted as `read_csv` sorts them. Rows are split into
+    training and testing sets by `hashed_test_mask`, so the test set can be
+    streamed again later without storing it.
+
+    Parameters
+    ----------
+    path : str, optional
+        Path to the cleaned CSV file.
+    clean_na : bool, optional, default=False
+        Drop the rows with missing values.
+    months : tuple, optional
+        Inclusive `(first, last)` range of `Tests Completed Month` to use.
+    test_size : float, optional, default=0.2
+        Share of the rows in the test set.
+    random_state : int, optional
+        Seed of the split.
+    chunksize : int, optional
+        Number of rows read at a time.
+    use_cache : bool, optional, default=True
+        Read the columnar cache when it is up to date. It is never written.
+    """
+
+    path: str = CLEAN_DATA_PATH
+    clean_na: bool = False
+    months: tuple = None
+    test_size: float = 0.2
+    random_state: int = None
+    chunksize: int = 100_000
+    use_cache: bool = True
+    _dtypes: dict = field(default=None, init=False, repr=False)
+
+    def _cache_dir(self):
+        cache_dir = cache_dir_for(self.path)
+        if self.use_cache and is_cache_valid(cache_dir, self.path):
+            return cache_dir
+        return None
+
+    @property
+    def categorical_dtypes(self) -> dict:
+        """Fixed `CategoricalDtype` of each categorical feature."""
+        if self._dtypes is None:
+            columns = [
+                col for col in FEATURE_COLUMNS if CLEAN_DTYPES[col] == "category"
+            ]
+            cache_dir = self._cache_dir()
+            if cache_dir is None:
+                self._dtypes = scan_categories(self.path, columns, self.chunksize)
+            else:
+                empty = read_column_cache(cache_dir, columns, rows=slice(0, 0))
+                self._dtypes = empty.dtypes.to_dict()
+        return self._dtypes
+
+    def template(self) -> pd.DataFrame:
+        """Return an empty frame with the feature columns and their dtypes."""
+        dtypes = {**CLEAN_DTYPES, **self.categorical_dtypes}
+        return pd.DataFrame(
+            {col: pd.Series(dtype=dtypes[col]) for col in FEATURE_COLUMNS}
+        )
+
+    def _frames(self):
+        """Yield the chunks of the file, indexed by the position of their rows."""
+        columns = [*FEATURE_COLUMNS, TARGET_COLUMN]
+        if self.months is not None:
+            columns.append(CLEAN_DATE_COLS[0])
+        cache_dir = self._cache_dir()
+        if cache_dir is not None:
+            yield from iter_column_cache(cache_dir, self.chunksize, columns)
+            return
+        reader = pd.read_csv(
+            self.path,
+            usecols=columns,
+            dtype={**CLEAN_DTYPES, **self.categorical_dtypes},
+            parse_dates=[col for col in CLEAN_DATE_COLS if col in columns],
+            chunksize=self.chunksize,
+        )
+        start = 0
+        for chunk in reader:
+            chunk.index = pd.RangeIndex(start, start + len(chunk))
+            start += len(chunk)
+            yield chunk
+
+    def encode(self, X) -> np.ndarray:
+        """Return the features of `X` as a float32 matrix, NaN if missing."""
+        dtypes = self.categorical_dtypes
+        features = np.empty((len(X), len(FEATURE_COLUMNS)), dtype=np.float32)
+        for i, col in enumerate(FEATURE_COLUMNS):
+            if col in dtypes:
+                codes = X[col].cat.set_categories(dtypes[col].categories).cat.codes
+                column = codes.to_numpy(dtype=np.float32)
+                column[column < 0] = np.nan
+            else:
+                column = X[col].to_numpy(dtype=np.float32, na_value=np.nan)
+            features[:, i] = column
+        return features
+
+    def chunks(self, part=None):
+        """Yield the encoded features and labels of each chunk.
+
+        Parameters
+        ----------
+        part : {"train", "test"}, optional
+            Only yield the rows of this part of the split. Every row by
+            default.
+
+        Yields
+        ------
+        features : numpy.ndarray
+            Float32 matrix of the `FEATURE_COLUMNS` of the rows.
+        labels : numpy.ndarray
+            Whether the vitamin D level of each row is below `OPTIMAL_LEVEL`.
+        """
+        if part not in (None, "train", "test"):
+            raise ValueError(f"Unknown part: {part}")
+        for chunk in self._frames():
+            keep = np.ones(len(chunk), dtype=bool)
+            if part is not None:
+                test = hashed_test_mask(chunk.index, self.test_size, self.random_state)
+                keep &= test if part == "test" else ~test
+            if self.months is not None:
+                keep &= months_mask(chunk[CLEAN_DATE_COLS[0]], self.months)
+            if self.clean_na:
+                keep &= (
+                    chunk[[*FEATURE_COLUMNS, TARGET_COLUMN]]
+                    .notna()
+                    .all(axis=1)
+                    .to_numpy()
+                )
+            chunk = chunk[keep]
+            if len(chunk):
+                yield self.encode(chunk), chunk[TARGET_COLUMN].lt(
+                    OPTIMAL_LEVEL
+                ).to_numpy()
+
+    @instrument
+    def write_train(self, path) -> np.ndarray:
+        """Write the encoded training rows to the binary file `path`.
+
+        Returns
+        -------
+        labels : numpy.ndarray
+            Label of each training row, in the order of the file.
+        """
+        labels = []
+        with open(path, "wb") as f:
+            for features, y in self.chunks("train"):
+                f.write(features.tobytes())
+                labels.append(y)
+        return np.concatenate(labels) if labels else np.zeros(0, dtype=bool)
+
+
+def fit_lgbm_streamed(model, path, y, feature_name, categorical_feature):
+    """Fit an `LGBMClassifier` on a matrix written by `StreamedData.write_train`.
+
+    The binned Dataset is built from the file in batches of rows, then the
+    booster is trained as `model.fit` would train it. Custom objectives and
+    class weights are not supported, nor are LightGBM versions other than
+    `LGBM_BOOSTER_VERSION`.
+    """
+    from sklearn.preprocessing import LabelEncoder
+
+    if not is_lgbm_booster_supported():
+        raise RuntimeError(
+            f"LightGBM {lightgbm.__version__} cannot fit out of core, "
+            f"only LightGBM {LGBM_BOOSTER_VERSION}.x"
+        )
+    if callable(model.objective) or model.class_weight is not None:
+        raise ValueError(
+            "Custom objectives and class weights cannot be fitted out of core"
+        )
+    label_encoder = LabelEncoder().fit(y)
+    params = lgbm_train_params(model)
+    with MatrixFile(path, len(feature_name)) as matrix:
+        train_set = lightgbm.Dataset(
+            matrix,
+            label=label_encoder.transform(y),
+            feature_name=feature_name,
+            categorical_feature=categorical_feature,
+            params=params,
+        )
+        booster = lightgbm.train(
+            params,
+            train_set,
+            num_boost_round=model.n_estimators,
+            feature_name=feature_name,
+            categorical_feature=categorical_feature,
+        )
+    booster.free_dataset()
+    return set_lgbm_booster(model, booster, label_encoder, params, len(feature_name))
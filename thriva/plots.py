@@ -1,30 +1,37 @@
+from dataclasses import dataclass, field
+
+import matplotlib.dates as mdates
 import matplotlib.pyplot as plt
-import seaborn as sns
+import numpy as np
+import pandas as pd
 from cycler import cycler
 from matplotlib import patheffects
-from sklearn.metrics import accuracy_score, roc_auc_score, roc_curve
+from matplotlib.colors import to_rgba
+from matplotlib.figure import Figure
+from matplotlib.patches import Patch
+
+from thriva.aggregate import count_cube
+from thriva.profiling import instrument
 
 # create color palette from list of colors
 color_list = ["#fa476f", "#45d0eb", "#664277", "#f9d423"]
 custom_color_cycle = cycler(color=color_list)
 
 
-def percentages_calculation(df, col, target_col):
-    df_defined = df[[col, target_col]].dropna()
-    percentages = df_defined[[col, target_col]].groupby(col).value_counts().unstack()
-    percentages = 100 * (percentages.T / percentages.sum(axis=1)).T[["Yes", "No"]]
-    df_defined = df[[col, target_col]].dropna()
-    percentages = df_defined[[col, target_col]].groupby(col).value_counts().unstack()
-    percentages = 100 * (percentages.T / percentages.sum(axis=1)).T[["Yes", "No"]]
-    return percentages
+def percentages_calculation(df, col, target_col, cube=None):
+    if cube is None:
+        cube = count_cube(df, [col], target_col)
+    return cube.percentages(col)
 
 
-def global_yes_ratio(df, target_col):
-    return df[target_col].value_counts()["Yes"] / len(df)
+def global_yes_ratio(df, target_col, cube=None):
+    if cube is None:
+        cube = count_cube(df, [], target_col)
+    return cube.ratio("Yes")
 
 
-def stacked_bar_plot(df, col, target_col, ax, width=0.9):
-    percentages = percentages_calculation(df, col, target_col)
+def stacked_bar_plot(df, col, target_col, ax, width=0.9, cube=None):
+    percentages = percentages_calculation(df, col, target_col, cube)
     ax = percentages.plot(
         kind="bar", stacked=True, ax=ax, width=width, color=["#fa476f", "#45d0eb"]
     )
@@ -32,38 +39,32 @@ def stacked_bar_plot(df, col, target_col, ax, width=0.9):
     return ax
 
 
+# shared by all bar labels, so labelling a panel creates no styling objects
+BAR_LABEL_STYLE = {
+    "fontsize": 18,
+    "fontweight": "bold",
+    "color": "w",
+    "path_effects": [patheffects.withStroke(linewidth=3, foreground="k")],
+}
+
+
+def label_bars(ax, container, percentages):
+    """Write rounded `percentages` on top of the bars of `container` at once."""
+    labels = np.rint(np.asarray(percentages, dtype=float)).astype(int).astype(str)
+    return ax.bar_label(container, labels=labels, **BAR_LABEL_STYLE)
+
+
 def write_yes_no_percentages_to_bars(ax, percentages):
-    # show percentages on top of bars
-    for j, (_, (no, yes)) in enumerate(percentages.iterrows()):
-        x_pos = j - 0.3
-        y_no_pos = no
-        y_yes_pos = no + yes
-
-        ax.text(
-            s=f"{int(round(no, 0)):d}",
-            x=x_pos,
-            y=y_no_pos,
-            fontsize=18,
-            color="w",
-            fontweight="bold",
-            path_effects=[patheffects.withStroke(linewidth=3, foreground="k")],
-        )
-        # shows text with colored edge
-        ax.text(
-            s=f"{int(round(yes, 0)):d}",
-            x=x_pos,
-            y=y_yes_pos,
-            fontsize=18,
-            fontweight="bold",
-            color="w",
-            path_effects=[patheffects.withStroke(linewidth=3, foreground="k")],
-        )
+    # show percentages on top of each segment of the stacked bars
+    containers = ax.containers[-percentages.shape[1] :]
+    for container, col in zip(containers, percentages):
+        label_bars(ax, container, percentages[col])
     return ax
 
 
-def hline_plot(df, target_col, ax):
+def hline_plot(df, target_col, ax, cube=None):
     xmin, xmax = ax.get_xlim()
-    yes_ratio = global_yes_ratio(df, target_col)
+    yes_ratio = global_yes_ratio(df, target_col, cube)
     # show global percentage of yes
     ax.hlines(
         yes_ratio * 100,
@@ -80,22 +81,21 @@ def hline_plot(df, target_col, ax):
 def apply_style_to_plot(
     df, col, ax, first_col=False, legend_title="Vitamin D\nSupplement"
 ):
-    # cast xlabels to integer
     if df[col].dtype == "category":
         ax.tick_params(axis="x", rotation=90, labelsize=18)
     else:
+        # cast xlabels to integer
+        labels = [label.get_text() for label in ax.get_xticklabels()]
         ax.set_xticklabels(
-            [int(x) if isinstance(x, float) else str(x) for x in ax.get_xticks()],
+            [label[:-2] if label.endswith(".0") else label for label in labels],
             rotation=0,
             fontsize=18,
         )
     ax.set_xlabel("", fontsize=0)
     ax.set_title(col, fontsize=20)
-    try:
-        ax.get_legend().remove()
-    except AttributeError:
-        # no legend to remove
-        print(type(ax))
+    legend = ax.get_legend()
+    if legend is not None:
+        legend.remove()
     if first_col:
         ax.legend(
             loc="lower left",
@@ -112,33 +112,215 @@ def apply_style_to_plot(
     return ax
 
 
-def plot_categorical_percentages(df, col_list, target_col, bottom=0.13):
+@dataclass
+class PanelFigure:
+    """Row of axes reused by successive panel plots.
+
+    `reset` removes what the previous plot drew, but keeps the figure and its
+    axes, so the next plot skips building them again. A figure closed since,
+    as `plt.show` closes it, is built again.
+
+    Parameters
+    ----------
+    n_cols : int, optional, default=3
+        Number of axes.
+    figsize : tuple, optional, default=(16, 9)
+        Size of the figure, in inches.
+    """
+
+    n_cols: int = 3
+    figsize: tuple = (16, 9)
+    fig: Figure = field(init=False, repr=False)
+    axes: list = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.fig, axis = plt.subplots(1, self.n_cols, figsize=self.figsize)
+        self.axes = list(np.atleast_1d(axis))
+
+    def reset(self) -> list:
+        """Remove the bars, lines, labels and legends, and return the axes."""
+        if not plt.fignum_exists(self.fig.number):
+            self.__post_init__()
+            return self.axes
+        for ax in self.axes:
+            for artist in [*ax.patches, *ax.texts, *ax.lines, *ax.collections]:
+                artist.remove()
+            ax.containers.clear()
+            legend = ax.get_legend()
+            if legend is not None:
+                legend.remove()
+            ax.relim()
+            ax.set_autoscale_on(True)
+        return self.axes
+
+
+def panel_axes(panel):
+    if panel is None:
+        fig, axis = plt.subplots(1, 3, figsize=(16, 9))
+        return fig, axis.flatten()
+    axis = panel.reset()
+    # made current again, so plt.savefig saves the panel
+    plt.figure(panel.fig.number)
+    return panel.fig, axis
+
+
+@instrument
+def plot_categorical_percentages(
+    df, col_list, target_col, bottom=0.13, cube=None, panel=None
+):
+    # a cube built once for several figures saves counting the data again,
+    # and a panel reused for several figures saves building them again
+    if cube is None:
+        cube = count_cube(df, col_list, target_col)
     width = 0.9
-    fig, axis = plt.subplots(1, 3, figsize=(16, 9))
-    for i, (col, ax) in enumerate(zip(col_list, axis.flatten())):
-        ax = stacked_bar_plot(df, col, target_col, ax, width=width)
-        ax = hline_plot(df, target_col, ax)
+    fig, axis = panel_axes(panel)
+    for i, (col, ax) in enumerate(zip(col_list, axis)):
+        ax = stacked_bar_plot(df, col, target_col, ax, width=width, cube=cube)
+        ax = hline_plot(df, target_col, ax, cube=cube)
         ax = apply_style_to_plot(df, col, ax, first_col=(i == 0))
-    plt.subplots_adjust(
+    fig.subplots_adjust(
         hspace=0.4, wspace=0.0, left=0.06, right=0.999, bottom=bottom, top=0.96
     )
     return fig
 
 
-def kde_plot(df, col_list, target_col, legend_title="Vitamin D\nSupplement"):
+def binned_kde(values, gridsize=200, cut=3, bw_adjust=1, n_bins=2048):
+    """Estimate a Gaussian KDE of `values` from binned data.
+
+    The values are linearly binned on `n_bins` points and the bins are
+    convolved with the Gaussian kernel by FFT, so the cost grows with the
+    number of values only through the binning. Bandwidth (Scott's rule),
+    support and normalisation follow `seaborn.kdeplot`.
+
+    Parameters
+    ----------
+    values : numpy.ndarray
+        Values to estimate the density of. Missing values are ignored.
+    gridsize : int, optional, default=200
+        Number of points of the returned support.
+    cut : float, optional, default=3
+        Number of bandwidths the support extends past the extreme values.
+    bw_adjust : float, optional, default=1
+        Factor the bandwidth is multiplied by.
+    n_bins : int, optional, default=2048
+        Number of bins the values are counted in.
+
+    Returns
+    -------
+    support : numpy.ndarray
+        Points the density is evaluated at, empty with fewer than two
+        distinct values.
+    density : numpy.ndarray
+        Density at each point of `support`.
+    """
+    from scipy.signal import fftconvolve
+
+    values = np.asarray(values, dtype=float)
+    values = values[np.isfinite(values)]
+    n_values = len(values)
+    if n_values < 2 or values.min() == values.max():
+        return np.array([]), np.array([])
+    bandwidth = np.std(values, ddof=1) * n_values ** (-1 / 5) * bw_adjust
+    low, high = values.min() - cut * bandwidth, values.max() + cut * bandwidth
+    delta = (high - low) / (n_bins - 1)
+    # linear binning shares each value between its two nearest bins
+    position = (values - low) / delta
+    left = np.clip(np.floor(position).astype(np.int64), 0, n_bins - 2)
+    right_weight = position - left
+    counts = np.bincount(left, weights=1 - right_weight, minlength=n_bins)
+    counts += np.bincount(left + 1, weights=right_weight, minlength=n_bins)
+    offsets = np.arange(-(n_bins - 1), n_bins) * delta
+    kernel = np.exp(-0.5 * (offsets / bandwidth) ** 2)
+    kernel /= bandwidth * np.sqrt(2 * np.pi) * n_values
+    density = np.clip(fftconvolve(counts, kernel, mode="valid"), 0, None)
+    support = np.linspace(low, high, gridsize)
+    return support, np.interp(support, np.linspace(low, high, n_bins), density)
+
+
+def subsample_by_level(df, hue, max_rows, random_state=0):
+    """Sample at most `max_rows` rows of `df`, keeping the share of each `hue` level."""
+    if max_rows is None or len(df) <= max_rows:
+        return df
+    return df.groupby(hue, group_keys=False, observed=True).sample(
+        frac=max_rows / len(df), random_state=random_state
+    )
+
+
+def binned_kdeplot(df, x, hue, ax, palette, alpha=0.25, linewidth=2):
+    """Draw the `binned_kde` of `x` for each level of `hue`.
+
+    The curves are drawn and labelled as `seaborn.kdeplot` draws them with
+    `fill=True` and `common_norm=False`.
+    """
+    data = df[[x, hue]].dropna()
+    is_date = pd.api.types.is_datetime64_any_dtype(data[x])
+    values = mdates.date2num(data[x]) if is_date else data[x].to_numpy(dtype=float)
+    if isinstance(data[hue].dtype, pd.CategoricalDtype):
+        levels = list(data[hue].cat.categories)
+    else:
+        levels = sorted(data[hue].unique())
+    colors = dict(zip(levels, palette))
+    hue_values = data[hue].to_numpy()
+    # drawn backwards, like seaborn, so the first level ends up on top
+    for level in reversed(levels):
+        support, density = binned_kde(values[hue_values == level])
+        if len(support) == 0:
+            continue
+        artist = ax.fill_between(
+            support,
+            0,
+            density,
+            facecolor=to_rgba(colors[level], alpha),
+            edgecolor=to_rgba(colors[level], 1),
+            linewidth=linewidth,
+        )
+        artist.sticky_edges.y[:] = (0, np.inf)
+    if is_date:
+        ax.xaxis_date()
+    handles = [
+        Patch(
+            facecolor=to_rgba(colors[level], alpha),
+            edgecolor=to_rgba(colors[level], 1),
+            linewidth=linewidth,
+        )
+        for level in levels
+    ]
+    ax.legend(handles, levels, title=hue)
+    ax.set_xlabel(x)
+    ax.set_ylabel("Density")
+    return ax
+
+
+@instrument
+def kde_plot(
+    df,
+    col_list,
+    target_col,
+    legend_title="Vitamin D\nSupplement",
+    binned=False,
+    max_rows=None,
+):
+    # the binned estimate and the row cap keep large datasets fast to draw
+    palette = ["#45d0eb", "#fa476f"]
     fig, axis = plt.subplots(1, 2, figsize=(16, 9))
     for i, (col, ax) in enumerate(zip(col_list, axis.flatten())):
-        sns.kdeplot(
-            data=df,
-            x=col,
-            hue=target_col,
-            common_norm=False,
-            fill=True,
-            alpha=0.25,
-            linewidth=2,
-            ax=ax,
-            palette=["#45d0eb", "#fa476f"],
-        )
+        data = subsample_by_level(df[[col, target_col]], target_col, max_rows)
+        if binned:
+            binned_kdeplot(data, col, target_col, ax, palette, alpha=0.25, linewidth=2)
+        else:
+            import seaborn as sns
+
+            sns.kdeplot(
+                data=data,
+                x=col,
+                hue=target_col,
+                common_norm=False,
+                fill=True,
+                alpha=0.25,
+                linewidth=2,
+                ax=ax,
+                palette=palette,
+            )
         ax.set_title(col, fontsize=20)
         ax.set_xlabel("", fontsize=0)
         ax.set_ylabel("Density", fontsize=20)
@@ -163,9 +345,9 @@ def kde_plot(df, col_list, target_col, legend_title="Vitamin D\nSupplement"):
     return fig
 
 
-def bar_plot(df, col, target_col, ax, width=0.9):
+def bar_plot(df, col, target_col, ax, width=0.9, cube=None):
     # plot bar chart
-    percentages = percentages_calculation(df, col, target_col)["Yes"]
+    percentages = percentages_calculation(df, col, target_col, cube)["Yes"]
     ax = percentages.plot(
         kind="bar", stacked=False, ax=ax, width=width, color=["#fa476f"]
     )
@@ -175,44 +357,48 @@ def bar_plot(df, col, target_col, ax, width=0.9):
 
 def write_yes_percentages_to_bars(ax, percentages):
     # show percentages on top of bars
-    for j, (_, yes) in enumerate(percentages.items()):
-        x_pos = j - 0.3
-        # shows text with colored edge
-        ax.text(
-            s=f"{int(round(yes, 0)):d}",
-            x=x_pos,
-            y=yes,
-            fontsize=18,
-            fontweight="bold",
-            color="w",
-            path_effects=[patheffects.withStroke(linewidth=3, foreground="k")],
-        )
+    label_bars(ax, ax.containers[-1], percentages)
     return None
 
 
+@instrument
 def plot_hist_percentages(
-    df, col_list, target_col, bottom=0.13, legend_title="Vitamin D < 50 nmol/L"
+    df,
+    col_list,
+    target_col,
+    bottom=0.13,
+    legend_title="Vitamin D < 50 nmol/L",
+    cube=None,
+    panel=None,
 ):
+    if cube is None:
+        cube = count_cube(df, col_list, target_col)
     width = 0.9
-    fig, axis = plt.subplots(1, 3, figsize=(16, 9))
-    for i, (col, ax) in enumerate(zip(col_list, axis.flatten())):
-        ax = bar_plot(df, col, target_col, ax, width=width)
-        ax = hline_plot(df, target_col, ax)
+    fig, axis = panel_axes(panel)
+    for i, (col, ax) in enumerate(zip(col_list, axis)):
+        ax = bar_plot(df, col, target_col, ax, width=width, cube=cube)
+        ax = hline_plot(df, target_col, ax, cube=cube)
         ax = apply_style_to_plot(
             df, col, ax, first_col=(i == 0), legend_title=legend_title
         )
-    plt.subplots_adjust(
+    fig.subplots_adjust(
         hspace=0.4, wspace=0.0, left=0.06, right=0.999, bottom=bottom, top=0.96
     )
     return fig
 
 
+@instrument
 def plot_roc_curve(models, X_test, y_test, ax=None):
+    from sklearn.metrics import accuracy_score, roc_auc_score, roc_curve
+
+    from thriva.model import model_names
+
     if ax is None:
         fig, ax = plt.subplots(1, 1, figsize=(9, 9))
         ax.set_prop_cycle(custom_color_cycle)
-    for model in models.models:
-        y_pred_proba = model.predict_proba(X_test)[:, 1]
+    names = model_names(models.models)
+    for name, proba in zip(names, models.predict_proba(X_test)):
+        y_pred_proba = proba[:, 1]
         fpr, tpr, _ = roc_curve(y_test, y_pred_proba)
         roc_auc = roc_auc_score(y_test, y_pred_proba)
         accuracy = accuracy_score(y_test, y_pred_proba > 0.5)
@@ -220,7 +406,7 @@ def plot_roc_curve(models, X_test, y_test, ax=None):
             fpr,
             tpr,
             lw=2,
-            label=f"{model.__class__.__name__}\n(acc = {accuracy:.3f}, auc = {roc_auc:.3f})",
+            label=f"{name}\n(acc = {accuracy:.3f}, auc = {roc_auc:.3f})",
         )
     ax.set_xlim([0.0, 1.0])
     ax.set_ylim([0.0, 1.0])
@@ -230,3 +416,42 @@ def plot_roc_curve(models, X_test, y_test, ax=None):
     ax.legend(loc="lower right", fontsize=18)
     plt.tight_layout()
     return fig
+
+
+@instrument
+def plot_permutation_importance(importances, std=None, ax=None):
+    """Plot the permutation importance of each feature for every model.
+
+    Parameters
+    ----------
+    importances : pandas.DataFrame
+        Mean drop in score, with the features as index and the models as
+        columns, as returned by `ModelSelection.permutation_importance`.
+    std : pandas.DataFrame, optional
+        Standard deviation of the drop, drawn as error bars.
+    ax : matplotlib.axes.Axes, optional
+        Axes to draw on.
+    """
+    if ax is None:
+        fig, ax = plt.subplots(1, 1, figsize=(12, 9))
+    else:
+        fig = ax.figure
+    # Most important features on top
+    order = importances.mean(axis=1).sort_values().index
+    importances = importances.loc[order]
+    if std is not None:
+        std = std.loc[order]
+    importances.plot.barh(
+        ax=ax,
+        xerr=std,
+        width=0.8,
+        color=color_list[: len(importances.columns)],
+        capsize=2,
+    )
+    ax.axvline(0, color="black", lw=1)
+    ax.set_xlabel("Drop in score when permuted", fontsize=20)
+    ax.set_ylabel("")
+    ax.tick_params(labelsize=16)
+    ax.legend(fontsize=16, loc="lower right")
+    plt.tight_layout()
+    return fig
@@ -0,0 +1,130 @@
+import argparse
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import joblib
+import pandas as pd
+
+from thriva.cache import iter_column_cache
+from thriva.clean_data import CLEAN_DTYPES, RAW_DATA_PATH, read_clean_chunks
+from thriva.model import FEATURE_COLUMNS
+
+
+def save_model(model, path):
+    """Save a fitted model with joblib."""
+    joblib.dump(model, path)
+
+
+def load_model(path):
+    """Load a model saved with `save_model`."""
+    return joblib.load(path)
+
+
+def prepare_features(chunk) -> pd.DataFrame:
+    """Select the model features of a cleaned chunk, in the training order.
+
+    Columns whose dtype differs from the cleaned file are converted, so the
+    model sees the dtypes it was trained on. This covers `Fatigued Rating`,
+    read as a category from the raw file, and strings parsed from JSON.
+    """
+    features = chunk.reindex(columns=FEATURE_COLUMNS)
+    for col in FEATURE_COLUMNS:
+        dtype = CLEAN_DTYPES[col]
+        if features[col].dtype != dtype:
+            features[col] = features[col].astype(dtype)
+    return features
+
+
+def iter_feature_chunks(path=RAW_DATA_PATH, chunksize=100_000):
+    """Stream the model features of a file in chunks.
+
+    Parameters
+    ----------
+    path : str
+        Raw CSV file, cleaned chunk by chunk with `clean_vitamin_d`, or the
+        `.cache` directory of a cleaned file written by `load_clean_data`.
+    chunksize : int
+        Number of rows per chunk.
+
+    Yields
+    ------
+    features : pandas.DataFrame
+        Features of the chunk, indexed by row position in the file.
+    """
+    if os.path.isdir(path):
+        chunks = iter_column_cache(path, chunksize, columns=FEATURE_COLUMNS)
+    else:
+        chunks = read_clean_chunks(path, chunksize)
+    for chunk in chunks:
+        yield prepare_features(chunk)
+
+
+def score_chunk(model, features) -> pd.DataFrame:
+    """Return the probability of a non-optimal vitamin D level for each row."""
+    proba = model.predict_proba(features)[:, 1]
+    return pd.DataFrame({"probability": proba}, index=features.index.rename("row"))
+
+
+def predict_file(model, input_path, output_path, chunksize=100_000, n_jobs=1):
+    """Score every row of a file with a fitted model, writing results as they come.
+
+    At most `2 * n_jobs` chunks are held in memory at once, so memory does not
+    grow with the size of the file. The output rows keep the input order.
+
+    Parameters
+    ----------
+    model : estimator
+        Fitted classifier, trained on the features of `prepare_data`.
+    input_path : str
+        File to score, as accepted by `iter_feature_chunks`.
+    output_path : str
+        CSV file the probabilities are written to.
+    chunksize : int
+        Number of rows per chunk.
+    n_jobs : int
+        Number of chunks scored at the same time, in a thread pool. -1 uses
+        all cores.
+
+    Returns
+    -------
+    n_rows : int
+        Number of rows scored.
+    """
+    from joblib import effective_n_jobs
+
+    n_jobs = effective_n_jobs(n_jobs)
+    n_rows = 0
+    with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+        pending = deque()
+        chunks = iter_feature_chunks(input_path, chunksize)
+        for features in chunks:
+            pending.append(executor.submit(score_chunk, model, features))
+            if len(pending) >= 2 * n_jobs:
+                n_rows += _write_scores(pending.popleft().result(), output_path, n_rows)
+        while pending:
+            n_rows += _write_scores(pending.popleft().result(), output_path, n_rows)
+    return n_rows
+
+
+def _write_scores(scores, output_path, n_written):
+    first = n_written == 0
+    scores.to_csv(output_path, mode="w" if first else "a", header=first)
+    return len(scores)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score users with a fitted model.")
+    parser.add_argument("model", help="Model saved with save_model.")
+    parser.add_argument("input", help="Raw CSV file or cleaned data cache.")
+    parser.add_argument("output", help="CSV file to write the probabilities to.")
+    parser.add_argument("--chunksize", type=int, default=100_000)
+    parser.add_argument("--n-jobs", type=int, default=1)
+    args = parser.parse_args()
+    print("💾 Loading model...")
+    model = load_model(args.model)
+    print("🔮 Scoring users...")
+    n_rows = predict_file(
+        model, args.input, args.output, chunksize=args.chunksize, n_jobs=args.n_jobs
+    )
+    print(f"🎉 Done! Scored {n_rows:,d} users.")
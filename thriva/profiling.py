@@ -0,0 +1,373 @@
+import argparse
+import atexit
+import functools
+import glob
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+PROFILE_ENV = "THRIVA_PROFILE"
+CPROFILE_ENV = "THRIVA_CPROFILE"
+# ru_maxrss is in kilobytes on Linux and in bytes on macOS
+RSS_UNIT = 1 if sys.platform == "darwin" else 1024
+# Seconds between two samples of the resident memory while stages run
+RSS_SAMPLE_INTERVAL = 0.005
+
+_profiler = None
+_local = threading.local()
+_cprofile_lock = threading.Lock()
+
+
+def peak_rss_mb():
+    """Return the peak resident memory of the process so far, in MB.
+
+    On Linux, a child process starts with the peak of its parent.
+    """
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * RSS_UNIT / 1e6
+
+
+def rss_mb():
+    """Return the current resident memory of the process, in MB."""
+    if psutil is None:
+        return None
+    return psutil.Process().memory_info().rss / 1e6
+
+
+class RssSampler:
+    """Peak resident memory of overlapping blocks, sampled by a thread.
+
+    The thread samples the memory every `interval` seconds while a block is
+    open, and stops when the last one closes. Blocks also sample it when they
+    open and close, so the peak of a block shorter than `interval` is the
+    larger of those two samples.
+    """
+
+    def __init__(self, interval=RSS_SAMPLE_INTERVAL):
+        self.interval = interval
+        self._peaks = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._next_token = 0
+
+    def start(self):
+        """Open a block and return its token and the memory it starts with."""
+        rss = rss_mb()
+        if rss is None:
+            return None, None
+        with self._lock:
+            token = self._next_token
+            self._next_token += 1
+            self._peaks[token] = rss
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._sample, daemon=True)
+                self._thread.start()
+        return token, rss
+
+    def stop(self, token):
+        """Close the block `token` and return its peak memory, in MB."""
+        if token is None:
+            return None
+        rss = rss_mb()
+        with self._lock:
+            return max(self._peaks.pop(token), rss)
+
+    def _sample(self):
+        while True:
+            time.sleep(self.interval)
+            rss = rss_mb()
+            with self._lock:
+                if not self._peaks:
+                    self._thread = None
+                    return
+                for token, peak in self._peaks.items():
+                    if rss > peak:
+                        self._peaks[token] = rss
+
+
+_sampler = RssSampler()
+
+
+def _shape(obj):
+    """Return the rows and columns of a DataFrame, Series or array, else None."""
+    if isinstance(obj, (tuple, list)):
+        obj = next((item for item in obj if hasattr(item, "shape")), None)
+    shape = getattr(obj, "shape", None)
+    if not isinstance(shape, tuple) or not shape:
+        return None, None
+    return shape[0], shape[1] if len(shape) > 1 else 1
+
+
+@dataclass
+class Profiler:
+    """Records of the stages run while profiling is enabled.
+
+    Parameters
+    ----------
+    output_dir : str, optional
+        Directory where `flush` writes the records, and the cProfile dumps.
+    cprofile : bool, optional, default=False
+        Run the outermost stage of each thread under `cProfile` and dump its
+        statistics to `output_dir`. Only one stage is profiled at a time.
+    """
+
+    output_dir: str = None
+    cprofile: bool = False
+    records: list = field(default_factory=list)
+
+    def __post_init__(self):
+        # Trace timestamps are microseconds since the epoch, so the records of
+        # several processes line up
+        self._origin = time.time() - time.perf_counter()
+
+    @contextmanager
+    def measure(self, name, data=None):
+        """Record the block as the stage `name`.
+
+        The rows and columns in are taken from `data`, and the rows and columns
+        out from the value the block stores under `"result"` in the yielded
+        dict. `peak_rss_mb` is the peak resident memory sampled during the
+        block, `rss_growth_mb` how far it rose above the memory in use when
+        the block started, and `process_peak_rss_mb` the peak of the process
+        so far, whichever stage reached it.
+        """
+        depth = getattr(_local, "depth", 0)
+        profile = None
+        if self.cprofile and depth == 0 and _cprofile_lock.acquire(blocking=False):
+            import cProfile
+
+            profile = cProfile.Profile()
+        rows_in, cols_in = _shape(data)
+        token, rss_before = _sampler.start()
+        output = {}
+        _local.depth = depth + 1
+        cpu_start = time.process_time()
+        start = time.perf_counter()
+        if profile is not None:
+            profile.enable()
+        try:
+            yield output
+        finally:
+            if profile is not None:
+                profile.disable()
+            wall = time.perf_counter() - start
+            cpu = time.process_time() - cpu_start
+            _local.depth = depth
+            rows_out, cols_out = _shape(output.get("result"))
+            rss_peak = _sampler.stop(token)
+            self.records.append(
+                {
+                    "name": name,
+                    "start_us": round((self._origin + start) * 1e6),
+                    "wall_s": wall,
+                    "cpu_s": cpu,
+                    "peak_rss_mb": rss_peak,
+                    "rss_growth_mb": (
+                        None if rss_peak is None else rss_peak - rss_before
+                    ),
+                    "process_peak_rss_mb": peak_rss_mb(),
+                    "rows_in": rows_in,
+                    "cols_in": cols_in,
+                    "rows_out": rows_out,
+                    "cols_out": cols_out,
+                    "depth": depth,
+                    "pid": os.getpid(),
+                    "thread": threading.get_ident(),
+                }
+            )
+            if profile is not None:
+                _cprofile_lock.release()
+                os.makedirs(self.output_dir or ".", exist_ok=True)
+                profile.dump_stats(
+                    os.path.join(
+                        self.output_dir or ".",
+                        f"{name}-{os.getpid()}-{len(self.records)}.prof",
+                    )
+                )
+
+    def to_jsonl(self, path, mode="a"):
+        """Write the records to `path`, one JSON object per line."""
+        with open(path, mode) as f:
+            for record in self.records:
+                f.write(json.dumps(record) + "\n")
+
+    def flush(self):
+        """Append the records to `output_dir` and clear them."""
+        if self.output_dir is None or not self.records:
+            return
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.to_jsonl(os.path.join(self.output_dir, f"stages-{os.getpid()}.jsonl"))
+        self.records.clear()
+
+
+def enable(output_dir=None, cprofile=False) -> Profiler:
+    """Start recording the stages and return the profiler recording them."""
+    global _profiler
+    _profiler = Profiler(output_dir, cprofile)
+    return _profiler
+
+
+def disable() -> Profiler:
+    """Stop recording the stages and return the profiler that recorded them."""
+    global _profiler
+    profiler, _profiler = _profiler, None
+    return profiler
+
+
+def active() -> Profiler:
+    """Return the profiler recording the stages, or None."""
+    return _profiler
+
+
+@contextmanager
+def profiling(output_dir=None, cprofile=False):
+    """Record the stages run inside the block, and flush them at its end."""
+    profiler = enable(output_dir, cprofile)
+    try:
+        yield profiler
+    finally:
+        disable()
+        profiler.flush()
+
+
+def instrument(function=None, name=None):
+    """Record every call of `function` as a stage while profiling is enabled.
+
+    When profiling is disabled, the only overhead is a check of a global.
+
+    Parameters
+    ----------
+    function : callable
+        Function to instrument. Used as `@instrument` or
+        `@instrument(name="...")`.
+    name : str, optional
+        Name of the stage. Defaults to the qualified name of `function`.
+    """
+    if function is None:
+        return functools.partial(instrument, name=name)
+    name = name or function.__qualname__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if _profiler is None:
+            return function(*args, **kwargs)
+        data = next((arg for arg in args if hasattr(arg, "shape")), None)
+        with _profiler.measure(name, data) as output:
+            output["result"] = result = function(*args, **kwargs)
+        return result
+
+    return wrapper
+
+
+@contextmanager
+def stage(name, data=None):
+    """Record the block as the stage `name` while profiling is enabled.
+
+    Store the output of the block under `"result"` in the yielded dict to
+    record its rows and columns.
+    """
+    if _profiler is None:
+        yield {}
+        return
+    with _profiler.measure(name, data) as output:
+        yield output
+
+
+def read_jsonl(paths) -> list:
+    """Read the records of one or several JSON lines files."""
+    records = []
+    for path in [paths] if isinstance(paths, str) else paths:
+        with open(path) as f:
+            records += [json.loads(line) for line in f if line.strip()]
+    return records
+
+
+def chrome_trace(records) -> dict:
+    """Convert records to the Chrome trace-event format.
+
+    The result, saved as JSON, opens in `chrome://tracing` or Perfetto, with
+    one row per process and thread.
+    """
+    events = [
+        {
+            "name": record["name"],
+            "ph": "X",
+            "ts": record["start_us"],
+            "dur": round(record["wall_s"] * 1e6),
+            "pid": record["pid"],
+            "tid": record["thread"],
+            "args": {
+                key: record[key]
+                for key in [
+                    "cpu_s",
+                    "peak_rss_mb",
+                    "rss_growth_mb",
+                    "process_peak_rss_mb",
+                    "rows_in",
+                    "cols_in",
+                    "rows_out",
+                    "cols_out",
+                ]
+            },
+        }
+        for record in records
+    ]
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def summary(records) -> "pd.DataFrame":
+    """Total and mean wall time, CPU time and peak memory of each stage.
+
+    The memory columns are the largest peak and growth over the calls.
+    """
+    import pandas as pd
+
+    df = pd.DataFrame(records)
+    return (
+        df.groupby("name")
+        .agg(
+            calls=("wall_s", "size"),
+            wall_s=("wall_s", "sum"),
+            mean_wall_s=("wall_s", "mean"),
+            cpu_s=("cpu_s", "sum"),
+            peak_rss_mb=("peak_rss_mb", "max"),
+            rss_growth_mb=("rss_growth_mb", "max"),
+            rows_in=("rows_in", "max"),
+        )
+        .sort_values("wall_s", ascending=False)
+    )
+
+
+if os.environ.get(PROFILE_ENV):
+    enable(os.environ[PROFILE_ENV], cprofile=bool(os.environ.get(CPROFILE_ENV)))
+    atexit.register(lambda: _profiler is not None and _profiler.flush())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Summarise the stages recorded with THRIVA_PROFILE=DIR."
+    )
+    parser.add_argument("directory")
+    parser.add_argument("--trace", help="Write a Chrome trace-event file.")
+    args = parser.parse_args()
+    records = read_jsonl(sorted(glob.glob(os.path.join(args.directory, "*.jsonl"))))
+    print(summary(records).round(3).to_string())
+    if args.trace:
+        with open(args.trace, "w") as f:
+            json.dump(chrome_trace(records), f)
+        print(f"💾 Saved the trace to {args.trace}")
@@ -0,0 +1,494 @@
+import argparse
+import ast
+import functools
+import hashlib
+import importlib.util
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from functools import partial
+
+import matplotlib
+
+from thriva.cache import cache_dir_for, file_hash
+from thriva.clean_data import CLEAN_DATA_PATH
+from thriva.profiling import active
+from thriva.profiling import stage as profile_stage
+
+REPORTS_DIR = "reports"
+STATE_FILE = ".stages.json"
+SUPPLEMENT = "Vitamin D Supplement"
+LOW_VITAMIN_D = "Low Vitamin D"
+# Columns of the three panels of each set of task 1 figures
+TASK_1_COLUMNS = [
+    ["Fatigued Rating", "Diet Rating", "Exercise Rating"],
+    ["Sleep Hours", "Main Goal", "Stressed Rating"],
+    ["Active Days Walking", "Inactive Time", "Sex"],
+]
+# Variants of task 2, and the suffix of the files built from each
+TASK_2_VARIANTS = {"all": "", "clean": "_clean"}
+PERMUTATION_REPEATS = 10
+# Only the imports of this package are followed for the stage fingerprints
+PACKAGE = __name__.split(".")[0]
+
+
+@dataclass
+class Stage:
+    """One artifact of the report and how to build it.
+
+    Parameters
+    ----------
+    name : str
+        Unique name of the stage.
+    function : callable
+        Called with the output paths to build them. It must be picklable to
+        run in a worker process, such as a module function or a `partial` of
+        one.
+    outputs : list
+        Files written by `function`.
+    inputs : list, optional
+        Files read by `function`, including the outputs of other stages, which
+        are built first.
+    modules : list, optional
+        Modules whose source the outputs depend on, besides the modules of
+        this package that the module of `function` imports.
+    """
+
+    name: str
+    function: object
+    outputs: list
+    inputs: list = field(default_factory=list)
+    modules: list = field(default_factory=list)
+
+
+def module_path(module) -> str:
+    """Return the source file of `module` without importing it."""
+    return importlib.util.find_spec(module).origin
+
+
+def _package_module(name):
+    """Return `name` if it is a module of this package, else its parent."""
+    parts = name.split(".")
+    base = os.path.join(os.path.dirname(module_path(PACKAGE)), *parts[1:])
+    if os.path.isfile(f"{base}.py") or os.path.isfile(
+        os.path.join(base, "__init__.py")
+    ):
+        return name
+    # `from thriva.model import RANDOM_STATE` names an attribute of a module
+    return ".".join(parts[:-1])
+
+
+@functools.lru_cache(maxsize=None)
+def _imports(path, mtime_ns):
+    """Return the modules of this package imported anywhere in the file `path`."""
+    with open(path) as f:
+        tree = ast.parse(f.read())
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            names.update(f"{node.module}.{alias.name}" for alias in node.names)
+    return {_package_module(name) for name in names if name.split(".")[0] == PACKAGE}
+
+
+def module_dependencies(module) -> list:
+    """Return `module` and the modules of this package it imports, recursively.
+
+    Imports inside functions count, as the stage functions import the code
+    they run lazily. The sources are parsed, not imported.
+    """
+    seen = set()
+    pending = [module]
+    while pending:
+        name = pending.pop()
+        if name in seen:
+            continue
+        seen.add(name)
+        if name.split(".")[0] == PACKAGE:
+            path = module_path(name)
+            pending += _imports(path, os.stat(path).st_mtime_ns)
+    return sorted(seen)
+
+
+def _file_hash(path, files):
+    """Hash `path`, reusing the hash stored in `files` while it is unchanged."""
+    stat = os.stat(path)
+    known = files.get(path)
+    if (
+        known is not None
+        and known["size"] == stat.st_size
+        and known["mtime_ns"] == stat.st_mtime_ns
+    ):
+        return known["hash"]
+    digest = file_hash(path)
+    files[path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "hash": digest}
+    return digest
+
+
+def stage_fingerprint(stage, files) -> str:
+    """Return a hash of the inputs, code and definition of `stage`.
+
+    The code is the source of `stage.modules` and of every module of this
+    package the module of the stage function imports.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(_describe(stage.function).encode())
+    modules = set(stage.modules)
+    module = _function(stage.function).__module__
+    if module.split(".")[0] == PACKAGE:
+        modules.update(module_dependencies(module))
+    paths = list(stage.inputs) + [module_path(module) for module in sorted(modules)]
+    for path in paths:
+        digest.update(f"{path}:{_file_hash(path, files)}".encode())
+    return digest.hexdigest()
+
+
+def _function(function):
+    while isinstance(function, partial):
+        function = function.func
+    return function
+
+
+def _describe(function):
+    if isinstance(function, partial):
+        return f"{_describe(function.func)}{function.args!r}{function.keywords!r}"
+    return f"{function.__module__}.{function.__qualname__}"
+
+
+def _headless():
+    matplotlib.use("Agg")
+
+
+def _build(stage):
+    _headless()
+    for path in stage.outputs:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    start = time.perf_counter()
+    with profile_stage(stage.name):
+        stage.function(*stage.outputs)
+    elapsed = time.perf_counter() - start
+    if active() is not None:
+        # Worker processes exit without running atexit, so write the records now
+        active().flush()
+    return elapsed
+
+
+def run_stages(stages, state_path, n_jobs=1, force=False) -> dict:
+    """Build the stages whose inputs, code or definition changed.
+
+    A stage is skipped when its fingerprint matches the one stored in
+    `state_path` at its last build and its outputs exist. Stages run as soon
+    as the stages building their inputs are done, in `n_jobs` worker
+    processes with a headless matplotlib backend.
+
+    Parameters
+    ----------
+    stages : list of Stage
+        Stages to run.
+    state_path : str
+        JSON file where the fingerprints are stored between runs.
+    n_jobs : int, optional, default=1
+        Number of worker processes. With 1, stages run in this process.
+    force : bool, optional, default=False
+        Build every stage, whether it changed or not.
+
+    Returns
+    -------
+    seconds : dict
+        Build time of each stage, None for skipped stages.
+    """
+    try:
+        with open(state_path) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        state = {}
+    fingerprints = state.setdefault("stages", {})
+    files = state.setdefault("files", {})
+    producers = {path: stage.name for stage in stages for path in stage.outputs}
+    pending = {stage.name: stage for stage in stages}
+    running = {}
+    seconds = {}
+
+    def ready(stage):
+        return all(
+            producers.get(path) in seconds for path in stage.inputs if path in producers
+        )
+
+    def record(stage, elapsed):
+        seconds[stage.name] = elapsed
+        fingerprints[stage.name] = stage_fingerprint(stage, files)
+        for path in stage.outputs:
+            _file_hash(path, files)
+
+    executor = (
+        ProcessPoolExecutor(n_jobs, initializer=_headless) if n_jobs > 1 else None
+    )
+    try:
+        while pending or running:
+            for stage in [stage for stage in pending.values() if ready(stage)]:
+                del pending[stage.name]
+                fingerprint = stage_fingerprint(stage, files)
+                if (
+                    not force
+                    and fingerprints.get(stage.name) == fingerprint
+                    and all(os.path.exists(path) for path in stage.outputs)
+                ):
+                    seconds[stage.name] = None
+                elif executor is None:
+                    record(stage, _build(stage))
+                else:
+                    running[executor.submit(_build, stage)] = stage
+            if not running:
+                if pending and not any(ready(stage) for stage in pending.values()):
+                    raise ValueError(f"Stages with unbuildable inputs: {list(pending)}")
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                record(running.pop(future), future.result())
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        # Stages built before a failure are kept
+        os.makedirs(os.path.dirname(state_path) or ".", exist_ok=True)
+        with open(state_path, "w") as f:
+            json.dump(state, f)
+    return seconds
+
+
+# The stage functions import the plotting and modelling code when they run, so a
+# run where every stage is skipped does not pay for importing it
+
+
+def vitamin_d_with_targets(path=CLEAN_DATA_PATH):
+    """Load the cleaned data with the `Low Vitamin D` target of task 1."""
+    from thriva.clean_data import load_clean_data
+
+    vitamin_d = load_clean_data(path)
+    low = (vitamin_d["Vitamin D Level"] < 50).map({True: "Yes", False: "No"})
+    vitamin_d[LOW_VITAMIN_D] = low.astype("category")
+    return vitamin_d
+
+
+def task_2_grid(path=CLEAN_DATA_PATH, n_jobs=-1) -> "ExperimentGrid":
+    """Return the experiment grid of task 2.
+
+    Every model is fitted on one split of the rows, with all the rows and
+    without the rows with NaN values. The binned LightGBM Datasets are cached
+    in `lgbm_cache` next to the data.
+    """
+    from lightgbm import LGBMClassifier
+    from sklearn.dummy import DummyClassifier
+
+    from thriva.experiment import ExperimentGrid, Variant
+    from thriva.model import RANDOM_STATE, encoded_logistic_regression
+
+    return ExperimentGrid(
+        variants=[Variant("all"), Variant("clean", clean_na=True)],
+        models=[encoded_logistic_regression(), LGBMClassifier(), DummyClassifier()],
+        n_jobs=n_jobs,
+        path=path,
+        lgbm_cache_dir=os.path.join(os.path.dirname(path), "lgbm_cache"),
+        random_state=RANDOM_STATE,
+    )
+
+
+def lgbm_importance_figure(selection) -> "Figure":
+    """Plot the split counts of the LightGBM model of a task 2 selection."""
+    return selection.importance_plot()["LGBMClassifier"].figure
+
+
+def permutation_importance_figure(selection, X_test, y_test, n_jobs=-1) -> "Figure":
+    """Plot the permutation importance of every model of a task 2 selection."""
+    plots = selection.importance_plot(
+        X_test, y_test, n_repeats=PERMUTATION_REPEATS, n_jobs=n_jobs
+    )
+    return plots["permutation"]
+
+
+def build_data_cache(data_path, meta_path):
+    """Write the column cache of `data_path`, unless it is up to date."""
+    from thriva.clean_data import load_clean_data
+
+    load_clean_data(data_path, columns=[])
+
+
+def data_cache_stage(data_path) -> Stage:
+    """Stage writing the column cache of the data the other stages read.
+
+    Stages depending on it start once the cache is written, rather than each
+    worker process finding it missing and writing it at the same time.
+    """
+    meta_path = os.path.join(cache_dir_for(data_path), "meta.json")
+    return Stage(
+        "data_cache", partial(build_data_cache, data_path), [meta_path], [data_path]
+    )
+
+
+def save_figure(fig, path, dpi=300):
+    import matplotlib.pyplot as plt
+
+    with profile_stage("savefig"):
+        fig.savefig(path, dpi=dpi)
+    plt.close(fig)
+
+
+def percentages_figure(kind, col_list, target, bottom, data_path, path):
+    from thriva.plots import plot_categorical_percentages, plot_hist_percentages
+
+    plot = (
+        plot_categorical_percentages if kind == "categorical" else plot_hist_percentages
+    )
+    vitamin_d = vitamin_d_with_targets(data_path)
+    save_figure(plot(vitamin_d, col_list, target, bottom=bottom), path)
+
+
+def kde_figure(col_list, target, data_path, path):
+    from thriva.plots import kde_plot
+
+    save_figure(kde_plot(vitamin_d_with_targets(data_path), col_list, target), path)
+
+
+def fit_models(data_path, *paths):
+    """Fit the grid of task 2, and save each selection with its test set and scores.
+
+    `paths` are the models file, then the scores file, of each variant of
+    `TASK_2_VARIANTS`, in order.
+    """
+    from thriva.predict import save_model
+
+    grid = task_2_grid(data_path)
+    results = grid.run()
+    for i, variant in enumerate(TASK_2_VARIANTS):
+        models_path, scores_path = paths[2 * i : 2 * i + 2]
+        results[variant].to_csv(scores_path)
+        save_model((grid.selections_[variant], *grid.test_sets_[variant]), models_path)
+
+
+def roc_figure(models_path, path):
+    from thriva.predict import load_model
+
+    models, X_test, y_test = load_model(models_path)
+    save_figure(models.roc_plot(X_test, y_test), path)
+
+
+def importance_figure(models_path, path):
+    from thriva.predict import load_model
+
+    models, _, _ = load_model(models_path)
+    save_figure(lgbm_importance_figure(models), path)
+
+
+def permutation_figure(models_path, path):
+    from thriva.predict import load_model
+
+    models, X_test, y_test = load_model(models_path)
+    save_figure(permutation_importance_figure(models, X_test, y_test), path)
+
+
+def task_1_stages(reports_dir=REPORTS_DIR, data_path=CLEAN_DATA_PATH) -> list:
+    """Stages of the figures of `task_1.py`."""
+    cache = data_cache_stage(data_path)
+    panels = [
+        ("categorical_0", "categorical", SUPPLEMENT, 0.0),
+        ("categorical_1", "categorical", SUPPLEMENT, 0.25),
+        ("categorical_2", "categorical", SUPPLEMENT, 0.25),
+        ("hist_0_low", "hist", LOW_VITAMIN_D, 0.05),
+        ("hist_1_low", "hist", LOW_VITAMIN_D, 0.25),
+        ("hist_2_low", "hist", LOW_VITAMIN_D, 0.25),
+    ]
+    stages = [
+        Stage(
+            name,
+            partial(
+                percentages_figure,
+                kind,
+                TASK_1_COLUMNS[i % 3],
+                target,
+                bottom,
+                data_path,
+            ),
+            [os.path.join(reports_dir, f"{name}.png")],
+            cache.outputs,
+        )
+        for i, (name, kind, target, bottom) in enumerate(panels)
+    ]
+    densities = [
+        ("numerical_0", ["BMI", "Age"], SUPPLEMENT),
+        ("numerical_0_low", ["BMI", "Age"], LOW_VITAMIN_D),
+        ("numerical_1", ["Tests Completed Month", "Vitamin D Level"], SUPPLEMENT),
+    ]
+    stages += [
+        Stage(
+            name,
+            partial(kde_figure, col_list, target, data_path),
+            [os.path.join(reports_dir, f"{name}.png")],
+            cache.outputs,
+        )
+        for name, col_list, target in densities
+    ]
+    return [cache] + stages
+
+
+def task_2_stages(reports_dir=REPORTS_DIR, data_path=CLEAN_DATA_PATH) -> list:
+    """Stages of the models and figures of `task_2.py`."""
+    models_paths = {
+        variant: os.path.join(reports_dir, "models", f"models{suffix}.joblib")
+        for variant, suffix in TASK_2_VARIANTS.items()
+    }
+    fit_outputs = []
+    for variant, suffix in TASK_2_VARIANTS.items():
+        fit_outputs += [
+            models_paths[variant],
+            os.path.join(reports_dir, f"scores{suffix}.csv"),
+        ]
+    cache = data_cache_stage(data_path)
+    stages = [
+        cache,
+        Stage("models", partial(fit_models, data_path), fit_outputs, cache.outputs),
+    ]
+    stages += [
+        Stage(
+            f"roc_curve{suffix}",
+            partial(roc_figure, models_paths[variant]),
+            [os.path.join(reports_dir, f"roc_curve{suffix}.png")],
+            [models_paths[variant]],
+        )
+        for variant, suffix in TASK_2_VARIANTS.items()
+    ]
+    stages += [
+        Stage(
+            "LGBM_feature_importance",
+            partial(importance_figure, models_paths["clean"]),
+            [os.path.join(reports_dir, "LGBM_feature_importance.png")],
+            [models_paths["clean"]],
+        ),
+        Stage(
+            "permutation_importance",
+            partial(permutation_figure, models_paths["clean"]),
+            [os.path.join(reports_dir, "permutation_importance.png")],
+            [models_paths["clean"]],
+        ),
+    ]
+    return stages
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the figures and models.")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count())
+    parser.add_argument("--force", action="store_true", help="Rebuild every stage.")
+    parser.add_argument("--reports-dir", default=REPORTS_DIR)
+    args = parser.parse_args()
+    stages = task_1_stages(args.reports_dir) + task_2_stages(args.reports_dir)
+    start = time.perf_counter()
+    seconds = run_stages(
+        stages,
+        os.path.join(args.reports_dir, STATE_FILE),
+        n_jobs=args.jobs,
+        force=args.force,
+    )
+    for name, elapsed in seconds.items():
+        print(f"{'⏭️  skipped' if elapsed is None else f'✅ {elapsed:7.2f} s'} {name}")
+    print(f"🎉 Done in {time.perf_counter() - start:.2f} s")
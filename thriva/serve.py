@@ -0,0 +1,214 @@
+import argparse
+import asyncio
+import json
+import time
+from collections import deque
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+from thriva.predict import load_model, prepare_features
+
+HTTP_STATUS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    500: "Internal Server Error",
+}
+
+
+@dataclass
+class MicroBatcher:
+    """Collect concurrent single-user requests into batches for one model.
+
+    A batch is scored as soon as it holds `max_batch_size` users, or
+    `max_wait_ms` milliseconds after its first user arrived.
+
+    Parameters
+    ----------
+    model : estimator
+        Fitted classifier, trained on the features of `prepare_data`.
+    max_batch_size : int, optional, default=64
+        Largest number of users scored in one `predict_proba` call.
+    max_wait_ms : float, optional, default=5
+        Longest time a user waits for the batch to fill up.
+    """
+
+    model: object
+    max_batch_size: int = 64
+    max_wait_ms: float = 5
+    latencies: deque = field(
+        default_factory=lambda: deque(maxlen=100_000), init=False, repr=False
+    )
+    batch_sizes: deque = field(
+        default_factory=lambda: deque(maxlen=100_000), init=False, repr=False
+    )
+
+    def __post_init__(self):
+        self._queue = asyncio.Queue()
+        self._started = time.perf_counter()
+
+    async def predict(self, user: dict) -> float:
+        """Return the probability of a non-optimal vitamin D level for a user."""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((user, future, time.perf_counter()))
+        return await future
+
+    async def run(self):
+        """Score batches until cancelled."""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait_ms / 1000
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            users, futures, arrivals = zip(*batch)
+            try:
+                # Scoring runs in a thread so the event loop keeps accepting users
+                proba = await loop.run_in_executor(None, self._score, users)
+            except Exception:
+                # Score the users one by one, so only the malformed ones fail
+                proba = await loop.run_in_executor(None, self._score_each, users)
+            now = time.perf_counter()
+            for future, arrival, probability in zip(futures, arrivals, proba):
+                if future.done():
+                    continue
+                if isinstance(probability, Exception):
+                    future.set_exception(probability)
+                else:
+                    future.set_result(float(probability))
+                    self.latencies.append(now - arrival)
+            self.batch_sizes.append(len(batch))
+
+    def _score(self, users):
+        features = prepare_features(pd.DataFrame.from_records(users))
+        return self.model.predict_proba(features)[:, 1]
+
+    def _score_each(self, users) -> list:
+        """Score each user alone, returning the error of the users that fail."""
+        proba = []
+        for user in users:
+            try:
+                proba.append(self._score([user])[0])
+            except Exception as error:
+                proba.append(error)
+        return proba
+
+    def stats(self) -> dict:
+        """Latency percentiles in milliseconds, throughput and mean batch size."""
+        if not self.latencies:
+            return {"requests": 0}
+        latencies = np.array(self.latencies) * 1000
+        return {
+            "requests": len(latencies),
+            "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+            "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+            "throughput_rps": round(
+                len(latencies) / (time.perf_counter() - self._started), 1
+            ),
+            "mean_batch_size": round(float(np.mean(self.batch_sizes)), 2),
+        }
+
+
+async def handle_connection(batcher, reader, writer):
+    """Serve the HTTP/1.1 requests of one keep-alive connection.
+
+    `POST /predict` takes the features of one user as a JSON object and
+    returns `{"probability": p}`. `GET /stats` returns `MicroBatcher.stats`.
+    A malformed request gets a 400 reply and closes the connection, since
+    the start of the next request can't be found.
+    """
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            try:
+                method, path, _ = request_line.decode().split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, value = line.decode().split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+            except ValueError as error:
+                await respond(writer, 400, {"error": f"Malformed request: {error}"})
+                break
+            body = await reader.readexactly(length)
+            status, response = await route(batcher, method, path, body)
+            await respond(writer, status, response)
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def respond(writer, status, response):
+    """Write `response` as the JSON body of an HTTP reply."""
+    payload = json.dumps(response).encode()
+    writer.write(
+        f"HTTP/1.1 {status} {HTTP_STATUS[status]}\r\n"
+        "Content-Type: application/json\r\n"
+        f"Content-Length: {len(payload)}\r\n"
+        "\r\n".encode() + payload
+    )
+    await writer.drain()
+
+
+async def route(batcher, method, path, body):
+    if method == "POST" and path == "/predict":
+        try:
+            user = json.loads(body)
+            probability = await batcher.predict(user)
+        except (ValueError, TypeError, KeyError) as error:
+            return 400, {"error": str(error)}
+        except Exception as error:
+            return 500, {"error": f"{type(error).__name__}: {error}"}
+        return 200, {"probability": probability}
+    if method == "GET" and path == "/stats":
+        return 200, batcher.stats()
+    return 404, {"error": f"{method} {path} not found"}
+
+
+async def serve(model, host="127.0.0.1", port=8000, max_batch_size=64, max_wait_ms=5):
+    """Serve `model` over HTTP until cancelled."""
+    batcher = MicroBatcher(
+        model, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms
+    )
+    batch_task = asyncio.create_task(batcher.run())
+    server = await asyncio.start_server(
+        lambda reader, writer: handle_connection(batcher, reader, writer), host, port
+    )
+    print(f"🚀 Serving on http://{host}:{port}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        batch_task.cancel()
+        print(json.dumps(batcher.stats()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve vitamin D risk scores.")
+    parser.add_argument("model", help="Model saved with thriva.predict.save_model.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-batch-size", type=int, default=64)
+    parser.add_argument("--max-wait-ms", type=float, default=5)
+    args = parser.parse_args()
+    model = load_model(args.model)
+    try:
+        asyncio.run(
+            serve(model, args.host, args.port, args.max_batch_size, args.max_wait_ms)
+        )
+    except KeyboardInterrupt:
+        pass
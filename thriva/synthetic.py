@@ -0,0 +1,122 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from thriva.clean_data import RAW_DATA_PATH
+
+# Share of the tests completed each month of 2022, as in the real export
+MONTH_SHARES = {
+    "2022-01-01": 0.164,
+    "2022-03-01": 0.078,
+    "2022-04-01": 0.088,
+    "2022-05-01": 0.181,
+    "2022-06-01": 0.079,
+    "2022-07-01": 0.086,
+    "2022-08-01": 0.082,
+    "2022-09-01": 0.079,
+    "2022-10-01": 0.087,
+    "2022-11-01": 0.076,
+}
+INACTIVE_TIMES = ["0-2 hours", "2-4 hours", "4-6 hours", "6-8 hours", "8+ hours"]
+SLEEP_HOURS = ["<5", "5-6", "7-8", "9+"]
+MAIN_GOALS = ["Energy", "Other", "Sleep", "Weight"]
+# Share of the optional answers left empty
+MISSING_SHARE = 0.05
+# Share of the ages entered as a year of birth, and entered as 150
+BIRTH_YEAR_SHARE = 0.048
+AGE_150_SHARE = 0.009
+# Share of the BMI entered as 500, and below 10
+BMI_500_SHARE = 0.009
+BMI_LOW_SHARE = 0.001
+
+
+def generate_raw(n_rows, random_state=None) -> pd.DataFrame:
+    """Generate vitamin D results in the schema of the raw export.
+
+    The distributions follow the real export, with its data-entry errors:
+    ages entered as years of birth or as 150, implausible BMI values and the
+    " hours" suffix of the inactive time.
+
+    Parameters
+    ----------
+    n_rows : int
+        Number of rows.
+    random_state : int or numpy.random.Generator, optional
+        Seed or generator of the random values.
+
+    Returns
+    -------
+    raw : pandas.DataFrame
+        Raw results, with the columns of `RAW_DTYPES` and `RAW_DATE_COLS`.
+    """
+    rng = np.random.default_rng(random_state)
+
+    def rating(low, high):
+        values = rng.integers(low, high + 1, n_rows).astype(float)
+        values[rng.random(n_rows) < MISSING_SHARE] = np.nan
+        return values
+
+    age = rng.integers(18, 96, n_rows)
+    error = rng.random(n_rows)
+    age = np.where(error < BIRTH_YEAR_SHARE, 2022 - age, age)
+    age = np.where(
+        (error >= BIRTH_YEAR_SHARE) & (error < BIRTH_YEAR_SHARE + AGE_150_SHARE),
+        150,
+        age,
+    )
+    bmi = rng.normal(27.1, 5.1, n_rows).clip(12, 58)
+    error = rng.random(n_rows)
+    bmi[error < BMI_500_SHARE] = 500.0
+    low = (error >= BMI_500_SHARE) & (error < BMI_500_SHARE + BMI_LOW_SHARE)
+    bmi[low] = rng.uniform(5, 10, low.sum())
+    bmi[rng.random(n_rows) < MISSING_SHARE] = np.nan
+    supplement = rng.random(n_rows) < 0.492
+    level = rng.normal(np.where(supplement, 71.0, 68.6), 24.8).clip(5, None)
+    return pd.DataFrame(
+        {
+            "Tests Completed Month": rng.choice(
+                list(MONTH_SHARES), n_rows, p=list(MONTH_SHARES.values())
+            ),
+            "Users Active Days Walking": rating(0, 7),
+            "Users Diet Rating": rating(1, 5),
+            "Users Exercise Rating": rating(1, 5),
+            "Users Inactive Time": rng.choice(INACTIVE_TIMES, n_rows),
+            "Users Bmi": bmi,
+            "Users Fatigued Rating": rating(1, 5),
+            "Users Sleep Hours": rng.choice(SLEEP_HOURS, n_rows),
+            "Users Stressed Rating": rng.integers(1, 6, n_rows),
+            "Users Main Goal": rng.choice(MAIN_GOALS, n_rows),
+            "Users Age": age,
+            "Sex": rng.choice(["Female", "Male"], n_rows, p=[0.509, 0.491]),
+            "Users Vitamin D Supplement (Yes / No)": np.where(supplement, "Yes", "No"),
+            "Analyte Results Avg Numeric Result": level,
+        }
+    )
+
+
+def write_raw_csv(path, n_rows, random_state=None, chunksize=1_000_000):
+    """Write `n_rows` of `generate_raw` to a CSV, `chunksize` rows at a time.
+
+    Peak memory is bounded by `chunksize`, so files of tens of millions of
+    rows can be generated.
+    """
+    rng = np.random.default_rng(random_state)
+    for start in range(0, n_rows, chunksize):
+        chunk = generate_raw(min(chunksize, n_rows - start), rng)
+        chunk.to_csv(
+            path, mode="w" if start == 0 else "a", header=start == 0, index=False
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Generate synthetic raw vitamin D results."
+    )
+    parser.add_argument("output", nargs="?", default=RAW_DATA_PATH)
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    print(f"🎲 Generating {args.rows:,d} rows...")
+    write_raw_csv(args.output, args.rows, random_state=args.seed)
+    print("🎉 Done!")
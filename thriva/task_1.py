@@ -10,22 +10,39 @@ Please show us how you arrived at this insight.
 # %autoreload 2
 import matplotlib.pyplot as plt
 
-from thriva.clean_data import load_clean_data
-from thriva.plots import kde_plot, plot_categorical_percentages, plot_hist_percentages
+from thriva.aggregate import count_cube
+from thriva.plots import (
+    PanelFigure,
+    kde_plot,
+    plot_categorical_percentages,
+    plot_hist_percentages,
+)
+from thriva.report import TASK_1_COLUMNS, vitamin_d_with_targets
 
 # %%
-vitamin_d = load_clean_data()
+# The cleaned data, with the "Low Vitamin D" target (below 50) used further down
+vitamin_d = vitamin_d_with_targets()
 vitamin_d.head()
 # %%
 # Investigate who is taking vitamin D supplements
 target = "Vitamin D Supplement"
-findings_cols_0 = ["Fatigued Rating", "Diet Rating", "Exercise Rating"]
-findings_cols_1 = ["Sleep Hours", "Main Goal", "Stressed Rating"]
-fig = plot_categorical_percentages(vitamin_d, findings_cols_0, target, bottom=0.0)
-plt.savefig("reports/categorical_0.png", dpi=300)
+findings_cols_0, findings_cols_1, cat_also_look_at = TASK_1_COLUMNS
+# Count every column against the target at once, and draw every 1x3 panel
+# below on the same figure. It is saved through `fig`, as `plt.show` may close
+# it, in which case the next plot builds it again
+panel = PanelFigure()
+supplement_cube = count_cube(
+    vitamin_d, findings_cols_0 + findings_cols_1 + cat_also_look_at, target
+)
+fig = plot_categorical_percentages(
+    vitamin_d, findings_cols_0, target, bottom=0.0, cube=supplement_cube, panel=panel
+)
+fig.savefig("reports/categorical_0.png", dpi=300)
 plt.show()
-fig = plot_categorical_percentages(vitamin_d, findings_cols_1, target, bottom=0.25)
-plt.savefig("reports/categorical_1.png", dpi=300)
+fig = plot_categorical_percentages(
+    vitamin_d, findings_cols_1, target, bottom=0.25, cube=supplement_cube, panel=panel
+)
+fig.savefig("reports/categorical_1.png", dpi=300)
 plt.show()
 # %%
 numeric_cols = ["BMI", "Age"]
@@ -34,20 +51,22 @@ plt.savefig("reports/numerical_0.png", dpi=300)
 plt.show()
 # %%
 target = "Low Vitamin D"
-vitamin_d["Low Vitamin D"] = vitamin_d["Vitamin D Level"] < 50
-vitamin_d["Low Vitamin D"] = vitamin_d["Low Vitamin D"].map({True: "Yes", False: "No"})
-vitamin_d["Low Vitamin D"] = vitamin_d["Low Vitamin D"].astype("category")
-expore_cols_0 = ["Fatigued Rating", "Diet Rating", "Exercise Rating"]
-expore_cols_1 = ["Sleep Hours", "Main Goal", "Stressed Rating"]
-expore_cols_2 = ["Active Days Walking", "Inactive Time", "Sex"]
-fig = plot_hist_percentages(vitamin_d, expore_cols_0, target, bottom=0.05)
-plt.savefig("reports/hist_0_low.png", dpi=300)
+expore_cols_0, expore_cols_1, expore_cols_2 = TASK_1_COLUMNS
+low_cube = count_cube(vitamin_d, expore_cols_0 + expore_cols_1 + expore_cols_2, target)
+fig = plot_hist_percentages(
+    vitamin_d, expore_cols_0, target, bottom=0.05, cube=low_cube, panel=panel
+)
+fig.savefig("reports/hist_0_low.png", dpi=300)
 plt.show()
-fig = plot_hist_percentages(vitamin_d, expore_cols_1, target, bottom=0.25)
-plt.savefig("reports/hist_1_low.png", dpi=300)
+fig = plot_hist_percentages(
+    vitamin_d, expore_cols_1, target, bottom=0.25, cube=low_cube, panel=panel
+)
+fig.savefig("reports/hist_1_low.png", dpi=300)
 plt.show()
-fig = plot_hist_percentages(vitamin_d, expore_cols_2, target, bottom=0.25)
-plt.savefig("reports/hist_2_low.png", dpi=300)
+fig = plot_hist_percentages(
+    vitamin_d, expore_cols_2, target, bottom=0.25, cube=low_cube, panel=panel
+)
+fig.savefig("reports/hist_2_low.png", dpi=300)
 plt.show()
 # %%
 target = "Low Vitamin D"
@@ -57,9 +76,10 @@ plt.savefig("reports/numerical_0_low.png", dpi=300)
 plt.show()
 # %%
 target = "Vitamin D Supplement"
-cat_also_look_at = ["Active Days Walking", "Inactive Time", "Sex"]
-fig = plot_categorical_percentages(vitamin_d, cat_also_look_at, target, bottom=0.25)
-plt.savefig("reports/categorical_2.png", dpi=300)
+fig = plot_categorical_percentages(
+    vitamin_d, cat_also_look_at, target, bottom=0.25, cube=supplement_cube, panel=panel
+)
+fig.savefig("reports/categorical_2.png", dpi=300)
 plt.show()
 num_also_look_at = ["Tests Completed Month", "Vitamin D Level"]
 kde_plot(vitamin_d, num_also_look_at, target)
@@ -10,33 +10,33 @@ of your exploration.
 # %load_ext autoreload
 # %autoreload 2
 import matplotlib.pyplot as plt
-from lightgbm import LGBMClassifier
-from sklearn.dummy import DummyClassifier
 
-from thriva.model import ModelSelection, encoded_logistic_regression, prepare_data
-# %%
-X_train, X_test, y_train, y_test = prepare_data()
-model_list = [encoded_logistic_regression(), LGBMClassifier(), DummyClassifier()]
-# %%
-models = ModelSelection(models=model_list)
-models.fit(X_train, y_train)
-models.score(X_test, y_test)
+from thriva.report import (
+    lgbm_importance_figure,
+    permutation_importance_figure,
+    task_2_grid,
+)
+
 # %%
-# Clean NaN values from the training data
-X_train_clean, X_test_clean, y_train_clean, y_test_clean = prepare_data(clean_na=True)
-models_clean = ModelSelection(models=model_list)
-models_clean.fit(X_train_clean, y_train_clean)
-models_clean.score(X_test_clean, y_test_clean)
+# Load and split the data once, and fit a copy of every model on each variant,
+# the second one without the rows with NaN values
+grid = task_2_grid()
+grid.run()
 # %%
-models.roc_plot(X_test, y_test)
+grid.roc_plot("all")
 plt.savefig("reports/roc_curve.png", dpi=300)
 plt.close()
-models_clean.roc_plot(X_test_clean, y_test_clean)
+grid.roc_plot("clean")
 plt.savefig("reports/roc_curve_clean.png", dpi=300)
 plt.show()
 # %%
-importances = models_clean.importance_plot()
-importances["LGBMClassifier"]
-plt.savefig("LGBM_feature_importance.png", dpi=300)
+fig = lgbm_importance_figure(grid.selections_["clean"])
+fig.savefig("reports/LGBM_feature_importance.png", dpi=300)
+# %%
+# Permutation importance of every model, on the same scale
+fig = permutation_importance_figure(
+    grid.selections_["clean"], *grid.test_sets_["clean"]
+)
+fig.savefig("reports/permutation_importance.png", dpi=300)
 
 # %%